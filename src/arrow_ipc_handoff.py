@@ -0,0 +1,166 @@
+import os
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from source_readers import read_source
+
+# Worker processes parse exports and write the result as an Arrow IPC file into
+# shared memory (/dev/shm when available). Only the file path travels back to the
+# parent, which memory-maps the file instead of unpickling a copy of the frame.
+HANDOFF_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def current_rss():
+    # Resident set size of this process in bytes (Linux); None elsewhere
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def mixed_to_text(df):
+    """
+    Columns Arrow cannot type (object columns mixing numbers and text) as text, nulls kept.
+    Applied to every parsed export, whichever process parsed it, so both paths of
+    read_source_files give the same frame. Returns df itself when nothing changes.
+    """
+    mixed = []
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            mixed.append(col)
+    if not mixed:
+        return df
+    df = df.copy(deep=False)
+    for col in mixed:
+        df[col] = df[col].map(lambda value: str(value) if pd.notna(value) else None)
+    return df
+
+
+def to_arrow_table(df):
+    # Arrow table of a parsed export (mixed columns as text, see mixed_to_text)
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.Table.from_pandas(mixed_to_text(df), preserve_index=False)
+
+
+def _parse_to_ipc(path, sheet_name, read_kwargs):
+    # Runs in the worker process
+    df = read_source(path, sheet_name=sheet_name, **read_kwargs)
+    table = to_arrow_table(df)
+    del df
+    ipc_path = os.path.join(HANDOFF_DIR, f"handoff-{os.getpid()}-{uuid.uuid4().hex}.arrow")
+    with pa.OSFile(ipc_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return ipc_path, table.num_rows
+
+
+def _map_ipc(ipc_path):
+    # Zero-copy: the table's buffers point straight into the mapped file.
+    # Also returns the whole mapping, to tell which buffers pandas kept in place.
+    source = pa.memory_map(ipc_path, 'r')
+    mapping = source.read_buffer()
+    source.seek(0)
+    table = pa.ipc.open_file(source).read_all()
+    # The mapping keeps the data alive; the name is no longer needed
+    os.unlink(ipc_path)
+    return table, mapping
+
+
+def _bytes_in_mapping(df, mapping):
+    # Bytes of df's column data still pointing into the mapping: columns pandas converted
+    # (nulls in numeric columns, booleans, object columns) were copied and do not count
+    start, end = mapping.address, mapping.address + mapping.size
+    total = 0
+    for col in df.columns:
+        values = df[col].array
+        if hasattr(values, '__arrow_array__'):
+            arrow = pa.array(values)
+            chunks = arrow.chunks if isinstance(arrow, pa.ChunkedArray) else [arrow]
+            total += sum(buffer.size for chunk in chunks for buffer in chunk.buffers()
+                         if buffer is not None and start <= buffer.address < end)
+        else:
+            data = np.asarray(values)
+            if data.dtype != object and start <= data.__array_interface__['data'][0] < end:
+                total += data.nbytes
+    return total
+
+
+class HandoffStats:
+    def __init__(self):
+        self.files = 0
+        self.rows = 0
+        self.bytes_not_copied = 0
+        self.rss_start = current_rss()
+        self.rss_peak = self.rss_start
+
+    def sample_rss(self):
+        rss = current_rss()
+        if rss is not None and (self.rss_peak is None or rss > self.rss_peak):
+            self.rss_peak = rss
+
+    def report(self):
+        print(f"Handoff: {self.files} files, {self.rows} rows, "
+              f"{self.bytes_not_copied / 2**20:.1f} MiB used in place from the mapping instead of pickled")
+        if self.rss_start is not None:
+            print(f"  Parent RSS: {self.rss_start / 2**20:.0f} MiB at start, {self.rss_peak / 2**20:.0f} MiB peak")
+
+
+def read_source_files(paths, workers, sheet_name=0, stats=None, **read_kwargs):
+    """
+    Parse several exports (any format read_source accepts) in worker processes.
+    Yields (path, DataFrame, None) in the order of paths, or (path, None, error) when a file failed.
+    Numeric columns without nulls, datetimes and text are handed to pandas without copying
+    the mapped buffers.
+    With workers <= 1 the files are parsed in this process, one by one.
+    Either way, columns mixing numbers and text come back as text (see mixed_to_text).
+    """
+    if workers <= 1:
+        for path in paths:
+            try:
+                df = mixed_to_text(read_source(path, sheet_name=sheet_name, **read_kwargs))
+            except Exception as e:
+                yield path, None, e
+                continue
+            yield path, df, None
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_parse_to_ipc, path, sheet_name, read_kwargs) for path in paths]
+        consumed = 0
+        try:
+            for path, future in zip(paths, futures):
+                consumed += 1
+                try:
+                    ipc_path, rows = future.result()
+                    table, mapping = _map_ipc(ipc_path)
+                    df = table.to_pandas(split_blocks=True, self_destruct=True)
+                    del table
+                except Exception as e:
+                    yield path, None, e
+                    continue
+                if stats is not None:
+                    stats.files += 1
+                    stats.rows += rows
+                    stats.bytes_not_copied += _bytes_in_mapping(df, mapping)
+                    stats.sample_rss()
+                del mapping
+                yield path, df, None
+        finally:
+            # Caller stopped early: remove handoff files nobody will map
+            for future in futures[consumed:]:
+                try:
+                    os.unlink(future.result()[0])
+                except Exception:
+                    pass
@@ -0,0 +1,43 @@
+import os
+import tempfile
+
+import pandas as pd
+
+import budget_schema
+from budget_schema import _load_cache, header_fingerprint, resolve_schema
+
+# Check: a cached sheet schema is widened when the data no longer fits it, the widened
+# types are written back to the cache, and the next run with the same data reuses them
+# without reporting the change again.
+# Usage: python src/bench_budget_schema.py
+SHEET = 'Budget 2026'
+
+
+def run(df):
+    schema = resolve_schema(SHEET, df)
+    return [(field.name, field.field_type) for field in schema]
+
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+    budget_schema.SCHEMA_CACHE_FILE = os.path.join(tmp_dir, 'budget_schemas.json')
+    fingerprint = header_fingerprint(SHEET, ['Branch', 'Target', 'Policies'])
+
+    first = pd.DataFrame({'Branch': ['Jakarta', 'Medan'], 'Target': [100, 250], 'Policies': [3, 4]})
+    assert run(first) == [('Branch', 'STRING'), ('Target', 'INTEGER'), ('Policies', 'INTEGER')]
+
+    # Same headers, but Target now holds fractions: INTEGER -> FLOAT
+    widened = pd.DataFrame({'Branch': ['Jakarta', 'Medan'], 'Target': [100.5, 250.0], 'Policies': [3, 4]})
+    assert run(widened) == [('Branch', 'STRING'), ('Target', 'FLOAT'), ('Policies', 'INTEGER')]
+    cached = _load_cache()['versions'][fingerprint]['columns']
+    assert cached == [['Branch', 'STRING'], ['Target', 'FLOAT'], ['Policies', 'INTEGER']], cached
+    print("Widened type saved to the cache: passed")
+
+    # The next run starts from the widened cache entry and has nothing to report or save
+    updated_at = _load_cache()['versions'][fingerprint]['updated_at']
+    saved = []
+    save_cache = budget_schema._save_cache
+    budget_schema._save_cache = lambda cache: saved.append(cache)
+    assert run(widened) == [('Branch', 'STRING'), ('Target', 'FLOAT'), ('Policies', 'INTEGER')]
+    budget_schema._save_cache = save_cache
+    assert not saved and _load_cache()['versions'][fingerprint]['updated_at'] == updated_at
+    print("Widened cache reused without a second change: passed")
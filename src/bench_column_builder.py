@@ -0,0 +1,179 @@
+import decimal
+import gc
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+from arrow_ipc_handoff import read_source_files
+from prod_hist_schema import COLUMN_MAPPING, SCHEMA, build_detail
+from source_readers import SOURCE_EXTENSIONS, declared_column_types, list_sources
+
+# Check: build the prod_hist detail frame from the full set of exports, the old way
+# (rename, concat, audit/missing columns, projection, type passes) and with build_detail,
+# each in a fresh process. The transform's peak is the parsed exports plus the larger of
+# the RSS high-water mark growth and the tracemalloc peak. Most of it is the final frame
+# itself (one Decimal object per BIGNUMERIC value), the same both ways; what is left, the
+# overhead, is the parsed data still held and the intermediate copies, measured against
+# the parsed exports. Asserted: both ways produce the same frame (on small synthetic
+# exports, then on the full set), and build_detail's overhead stays within
+# OVERHEAD_LIMIT times the parsed exports and below the old way's.
+# Usage: python src/bench_column_builder.py [prod_hist dir]
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROD_HIST_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'data', 'prod_hist')
+PARSE_WORKERS = min(4, os.cpu_count() or 1)
+NOW = datetime(2026, 1, 1, 8, 0, 0)
+# Peak memory beyond the final frame allowed, as a multiple of the parsed exports. The old
+# way holds about 0.6x (the exports stay alive through the concat and type passes);
+# keeping them too, or copying every column, goes well above 1x.
+OVERHEAD_LIMIT = 0.5
+
+
+def legacy_detail(parts, file_names):
+    # The pipeline build_detail replaces
+    dfs = []
+    for df, name in zip(parts, file_names):
+        df = df.rename(columns=COLUMN_MAPPING)
+        df['SourceFilename'] = name
+        dfs.append(df)
+    df = pd.concat(dfs, ignore_index=True)
+    del dfs
+    df['create_date'] = NOW
+    df['modified_date'] = NOW
+    df['create_by'] = 'ETL_Script'
+    df['modified_by'] = 'ETL_Script'
+    schema_cols = [field.name for field in SCHEMA]
+    for col in schema_cols:
+        if col not in df.columns:
+            df[col] = None
+    df = df[schema_cols]
+    if 'TANGGAL' in df.columns and pd.api.types.is_datetime64_any_dtype(df['TANGGAL']):
+        df['TANGGAL'] = df['TANGGAL'].dt.strftime('%Y-%m-%d')
+    for col in [f.name for f in SCHEMA if f.field_type == 'BIGNUMERIC']:
+        df[col] = df[col].apply(lambda x: decimal.Decimal(str(x)) if pd.notnull(x) and str(x).lower() != 'nan' else None)
+    return df
+
+
+def parse(prod_hist_dir):
+    files = list_sources(path for extension in SOURCE_EXTENSIONS
+                         for path in glob.glob(os.path.join(prod_hist_dir, f"*{extension}")))
+    parts, names = [], []
+    for path, df, error in read_source_files(files, PARSE_WORKERS,
+                                             column_types=declared_column_types(SCHEMA, COLUMN_MAPPING)):
+        if error is not None:
+            raise error
+        parts.append(df)
+        names.append(os.path.basename(path))
+    return parts, names
+
+
+def rss(field):
+    # VmRSS (current) or VmHWM (peak since the last reset) in bytes
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+def reset_peak_rss():
+    # Linux: '5' resets the high-water mark to the current RSS
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+
+
+def measure(variant, prod_hist_dir, traced):
+    # RSS and tracemalloc are measured in separate runs: tracing every allocation (one
+    # Decimal per BIGNUMERIC value) costs more resident memory than it would report
+    parts, names = parse(prod_hist_dir)
+    input_bytes = int(sum(part.memory_usage(deep=True).sum() for part in parts))
+    gc.collect()
+    baseline = rss('VmRSS')
+    reset_peak_rss()
+    if traced:
+        tracemalloc.start()
+    start = time.perf_counter()
+    if variant == 'legacy':
+        final = legacy_detail(parts, names)
+    else:
+        final = build_detail(parts, names, now=NOW, consume=True)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if traced else rss('VmHWM') - baseline
+    tracemalloc.stop()
+    return {
+        'rows': len(final), 'seconds': seconds, 'input_bytes': input_bytes,
+        'final_bytes': int(final.memory_usage(deep=True).sum()), 'peak': peak,
+    }
+
+
+def synthetic_parts():
+    # Two small exports: datetime TANGGAL, integral and fractional BIGNUMERIC values with
+    # nulls, and a column the second export lacks
+    first = pd.DataFrame({
+        'tanggal': pd.to_datetime(['2018-01-02', '2018-01-03', None]),
+        'branch': ['JKT', None, 'SBY'],
+        'Tahun': [2018, 2018, 2018],
+        'New Premi': [1500000, 0, 250],
+        'Comm': [12.5, None, 0.1],
+        'BankersClause': ['Y', 'N', None],
+    })
+    second = pd.DataFrame({
+        'tanggal': pd.to_datetime(['2019-12-31']),
+        'branch': ['MDN'],
+        'Tahun': [2019],
+        'New Premi': [None],
+        'Comm': [3.0],
+    })
+    return [first, second], ['ProduksiJanDes2018.xlsx', 'ProduksiJanDes2019.xlsx']
+
+
+def same_frame(parts, names):
+    # Raises if build_detail differs from the old pipeline in values, dtypes or order
+    expected = legacy_detail([part.copy() for part in parts], names)
+    actual = build_detail(parts, names, now=NOW, consume=True)
+    pd.testing.assert_frame_equal(actual, expected)
+    return True
+
+
+if __name__ == '__main__' and len(sys.argv) > 2:
+    # Child: one measurement in a fresh process
+    variant, prod_hist_dir = sys.argv[1], sys.argv[2]
+    if variant == 'equal':
+        result = same_frame(*parse(prod_hist_dir))
+    else:
+        result = measure(variant, prod_hist_dir, traced=sys.argv[3] == 'traced')
+    print(json.dumps(result))
+elif __name__ == '__main__':
+    prod_hist_dir = sys.argv[1] if len(sys.argv) > 1 else PROD_HIST_DIR
+    assert same_frame(*synthetic_parts())
+    print("Same frame both ways on synthetic exports: passed")
+
+    def child(*args):
+        out = subprocess.run([sys.executable, __file__, args[0], prod_hist_dir, *args[1:]],
+                             check=True, capture_output=True, text=True).stdout
+        return json.loads(out.strip().splitlines()[-1])
+
+    overhead = {}
+    for variant in ('legacy', 'build_detail'):
+        r = child(variant, 'rss')
+        growth = max(r['peak'], child(variant, 'traced')['peak'])
+        # Everything the transform holds at its peak: the parsed exports plus what it allocated
+        peak = r['input_bytes'] + growth
+        overhead[variant] = (peak - r['final_bytes']) / r['input_bytes']
+        print(f"{variant:>12}: {r['rows']} rows in {r['seconds']:.1f}s, final frame {r['final_bytes'] / 2**20:.0f} MiB, "
+              f"parsed exports {r['input_bytes'] / 2**20:.0f} MiB, peak growth {growth / 2**20:.0f} MiB "
+              f"-> peak {peak / r['final_bytes']:.2f}x the final frame, "
+              f"overhead {overhead[variant]:.2f}x the parsed exports")
+    # A child whose frames differ exits non-zero (assert_frame_equal), failing check=True
+    assert child('equal') is True
+    print("Same frame both ways on the exports: passed")
+    assert overhead['build_detail'] <= OVERHEAD_LIMIT, \
+        f"build_detail overhead {overhead['build_detail']:.2f}x the parsed exports (limit {OVERHEAD_LIMIT}x)"
+    assert overhead['build_detail'] < overhead['legacy'], overhead
+    print(f"build_detail overhead within {OVERHEAD_LIMIT}x the parsed exports and below the old way's: passed")
@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+
+import pandas as pd
+
+from datetime_parsing import parse_datetime_column
+
+# Benchmark: default pd.to_datetime inference vs. fixed-format cached parsing
+# on every date in the full logbook export (typed columns, text dates and interval endpoints).
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+file_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(PROJECT_ROOT, 'data', 'ReportLogbookAll-07202026170107.xlsx')
+sheet_name = 'Report Logbook All'
+DAYFIRST = False
+
+# '1/1/2025 11:04:50 AM - 1/2/2025 2:50:39 PM; ...' -> one value per endpoint
+INTERVAL_ENDPOINT = r'(\d{1,2}/\d{1,2}/\d{4} \d{1,2}:\d{2}:\d{2} [AP]M)'
+
+
+def timed(label, func, values):
+    start = time.perf_counter()
+    result = func(values)
+    elapsed = time.perf_counter() - start
+    rate = len(values) / elapsed if elapsed else float('inf')
+    print(f"  {label:<10} {elapsed:8.3f}s  {rate:12,.0f} values/s  {int(result.notna().sum())} parsed")
+    return result
+
+
+try:
+    print(f"Loading {file_path}...")
+    df = pd.read_excel(file_path, sheet_name=sheet_name)
+    print(f"Rows: {len(df)}")
+
+    # 'Date ...' columns hold either one date per row or a list of 'start - end;' intervals
+    columns = {}
+    interval_cols = []
+    for col in df.columns:
+        if not col.startswith('Date '):
+            continue
+        if df[col].astype(object).astype(str).str.contains(' - ', regex=False).any():
+            interval_cols.append(col)
+        else:
+            columns[col] = df[col]
+    endpoints = pd.concat(
+        [df[col].astype(object).dropna().astype(str).str.extractall(INTERVAL_ENDPOINT)[0] for col in interval_cols],
+        ignore_index=True,
+    )
+    columns['interval endpoints'] = endpoints
+
+    for name, values in columns.items():
+        values = values.reset_index(drop=True)
+        print(f"\n--- {name} ({len(values)} values, {values.nunique()} distinct) ---")
+        baseline = timed('default', lambda v: pd.to_datetime(v, errors='coerce'), values)
+        fast = timed('fixed fmt', lambda v: parse_datetime_column(v, dayfirst=DAYFIRST), values)
+        mismatched = int((baseline.notna() & (baseline != fast)).sum())
+        if mismatched:
+            print(f"  Note: {mismatched} values differ from default inference (day/month order)")
+
+except Exception as e:
+    print(f"An error occurred: {e}")
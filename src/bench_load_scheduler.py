@@ -0,0 +1,209 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from google.api_core.exceptions import Forbidden, NotFound, ServiceUnavailable, TooManyRequests
+
+from bq_client_pool import replace_table
+from load_scheduler import BACKFILL, INTERACTIVE, LoadScheduler, append_table
+
+# Check: a burst of small loads against a local client that enforces BigQuery-style quotas
+# (scaled down to seconds), sent directly and through the scheduler.
+# Interactive reports replace their tables; the backfill appends chunks to its tables.
+# Usage: python src/bench_load_scheduler.py
+
+INTERACTIVE_TABLES = [f"local.bench.Report_{name}" for name in ('UW', 'ReAs', 'Logbook')]
+BACKFILL_TABLES = ["local.bench.Report_Prod_Hist"] + [f"local.bench.Rollup_{i}" for i in range(1, 5)]
+REQUESTS_PER_TABLE = 30
+BACKFILL_CHUNKS = 60  # per backfill table
+CHUNK_ROWS = 1000
+SENDERS = 8
+
+# Quotas of the fake, and the scheduler budgets kept just below them
+FAKE_QUOTAS = dict(concurrent=2, table_rate=5, table_window=2.0, latency=0.05, failure_rate=0.05)
+BUDGETS = [('table', 4, 2.0)]
+
+
+class _FakeJob:
+    def __init__(self, output_rows):
+        self.output_rows = output_rows
+
+    def result(self):
+        return self
+
+
+class _FakeTable:
+    table_type = 'TABLE'
+
+
+class QuotaFakeClient:
+    """
+    Local stand-in for the parts of bigquery.Client the loaders use, enforcing quotas
+    the way BigQuery does (by rejecting the job):
+    - more than `concurrent` jobs running at once -> 429 TooManyRequests;
+    - more than `table_rate` jobs per `table_window` seconds on a table -> 403 rateLimitExceeded;
+    - more than `table_daily` jobs on a table in total -> 403 quotaExceeded (not transient).
+    failure_rate injects random 503s; latency is the duration of each job.
+    """
+
+    project = 'local'
+
+    def __init__(self, concurrent=4, table_rate=5, table_window=10.0, table_daily=1500,
+                 latency=0.0, failure_rate=0.0, seed=None):
+        self.concurrent = concurrent
+        self.table_rate = table_rate
+        self.table_window = table_window
+        self.table_daily = table_daily
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.tables = {}               # table_id -> DataFrame
+        self.jobs = defaultdict(list)  # table_id -> start times of accepted jobs
+        self.rejected = defaultdict(int)
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def _start_job(self, table_id):
+        now = time.monotonic()
+        with self._lock:
+            if self._running >= self.concurrent:
+                self.rejected['concurrent'] += 1
+                raise TooManyRequests("Too many concurrent jobs")
+            starts = self.jobs[table_id]
+            if len(starts) >= self.table_daily:
+                self.rejected['table_daily'] += 1
+                raise Forbidden(f"Quota exceeded: too many jobs for table {table_id}",
+                                errors=[{'reason': 'quotaExceeded'}])
+            if sum(1 for start in starts if start > now - self.table_window) >= self.table_rate:
+                self.rejected['table_rate'] += 1
+                raise Forbidden(f"Exceeded rate limits: too many table update operations for {table_id}",
+                                errors=[{'reason': 'rateLimitExceeded'}])
+            if self.random.random() < self.failure_rate:
+                self.rejected['transient'] += 1
+                raise ServiceUnavailable("Backend temporarily unavailable")
+            starts.append(now)
+            self._running += 1
+
+    def _finish_job(self):
+        with self._lock:
+            self._running -= 1
+
+    def _run_job(self, table_id, apply):
+        self._start_job(table_id)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            with self._lock:
+                return _FakeJob(apply())
+        finally:
+            self._finish_job()
+
+    def load_table_from_dataframe(self, df, table_id, job_config=None):
+        def apply():
+            if job_config is not None and job_config.write_disposition == 'WRITE_APPEND' and table_id in self.tables:
+                self.tables[table_id] = pd.concat([self.tables[table_id], df], ignore_index=True)
+            else:
+                self.tables[table_id] = df
+            return len(df)
+        return self._run_job(table_id, apply)
+
+    def copy_table(self, source_id, table_id, job_config=None):
+        def apply():
+            self.tables[table_id] = self.tables[source_id]
+            return len(self.tables[table_id])
+        return self._run_job(table_id, apply)
+
+    def get_table(self, table_id):
+        if table_id not in self.tables:
+            raise NotFound(f"Table {table_id} not found")
+        return _FakeTable()
+
+    def delete_table(self, table_id, not_found_ok=False):
+        with self._lock:
+            if self.tables.pop(table_id, None) is None and not not_found_ok:
+                raise NotFound(f"Table {table_id} not found")
+
+
+def workload():
+    rng = random.Random(7)
+    requests = [(table, INTERACTIVE, False, pd.DataFrame({'Value': [i] * rng.randint(1, 50)}))
+                for i in range(REQUESTS_PER_TABLE) for table in INTERACTIVE_TABLES]
+    requests += [(table, BACKFILL, True, pd.DataFrame({'Value': range(i * CHUNK_ROWS, (i + 1) * CHUNK_ROWS)}))
+                 for i in range(BACKFILL_CHUNKS) for table in BACKFILL_TABLES]
+    rng.shuffle(requests)
+    return requests
+
+
+def run_direct(client, requests):
+    failed = 0
+
+    def send(request):
+        nonlocal failed
+        table_id, _, append, df = request
+        try:
+            (append_table if append else replace_table)(client, table_id, df, None)
+        except Exception:
+            failed += 1
+
+    with ThreadPoolExecutor(max_workers=SENDERS) as executor:
+        list(executor.map(send, requests))
+    return failed
+
+
+def run_scheduled(client, requests):
+    # Submitted as one burst: requests for the same table merge while they wait
+    scheduler = LoadScheduler(budgets=BUDGETS, max_concurrent=FAKE_QUOTAS['concurrent'])
+    waits = {INTERACTIVE: [], BACKFILL: []}
+    futures = []
+    start = time.perf_counter()
+    # Holding the dispatcher's lock queues the whole burst before the first job starts,
+    # so each table's requests merge into exactly one job
+    with scheduler._cond:
+        for table_id, priority, append, df in requests:
+            future = scheduler.submit(client, table_id, df, None, priority=priority, append=append)
+            future.add_done_callback(lambda _, priority=priority: waits[priority].append(time.perf_counter() - start))
+            futures.append(future)
+    failed = sum(1 for future in futures if future.exception() is not None)
+    return failed, scheduler.stats, waits
+
+
+def report(label, client, failed, elapsed, requests):
+    backfill_rows = sum(len(client.tables[table]) for table in BACKFILL_TABLES if table in client.tables)
+    jobs = sum(len(starts) for starts in client.jobs.values())
+    print(f"{label}: {elapsed:.1f}s, {len(requests)} requests, {failed} failed, {jobs} jobs accepted, "
+          f"rejected {dict(client.rejected)}")
+    print(f"  backfill rows {backfill_rows} of {len(BACKFILL_TABLES) * BACKFILL_CHUNKS * CHUNK_ROWS}")
+    return jobs, backfill_rows
+
+
+requests = workload()
+
+client = QuotaFakeClient(seed=1, **FAKE_QUOTAS)
+start = time.perf_counter()
+failed = run_direct(client, requests)
+report("direct", client, failed, time.perf_counter() - start, requests)
+# Sent directly, the burst runs into the concurrency quota and every failure is a rejection
+assert failed > 0 and sum(client.rejected.values()) >= failed
+
+client = QuotaFakeClient(seed=1, **FAKE_QUOTAS)
+start = time.perf_counter()
+failed, stats, waits = run_scheduled(client, requests)
+jobs, backfill_rows = report("scheduled", client, failed, time.perf_counter() - start, requests)
+print(f"  scheduler {dict(stats)}")
+# Through the scheduler nothing fails and each table's burst merges into one load:
+# a replace is a staging load plus a copy, an append a single load (a retried replace
+# whose copy was rejected loads its staging table again)
+assert failed == 0
+assert stats['jobs'] == len(INTERACTIVE_TABLES) + len(BACKFILL_TABLES)
+expected_jobs = 2 * len(INTERACTIVE_TABLES) + len(BACKFILL_TABLES)
+assert expected_jobs <= jobs <= expected_jobs + stats['retried'], jobs
+assert backfill_rows == len(BACKFILL_TABLES) * BACKFILL_CHUNKS * CHUNK_ROWS
+latest = {table_id: df for table_id, _, append, df in requests if not append}
+assert all(client.tables[table_id].equals(df) for table_id, df in latest.items())
+print("  interactive tables hold the last submitted frame: passed")
+for priority, label in ((INTERACTIVE, 'interactive'), (BACKFILL, 'backfill')):
+    print(f"  {label:<11} mean done after {sum(waits[priority]) / len(waits[priority]):.2f}s, "
+          f"last {max(waits[priority]):.2f}s")
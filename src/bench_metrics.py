@@ -0,0 +1,82 @@
+import socket
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+from upload_metrics import ReportMetrics, start_metrics_server
+
+# Check: record one synthetic sheet through ReportMetrics, scrape /metrics over HTTP and
+# verify the samples, then compare the recording cost with converting the sheet.
+# Usage: python src/bench_metrics.py
+ROWS = 200000
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('', 0))
+        return s.getsockname()[1]
+
+
+def scrape(port):
+    with urllib.request.urlopen(f"http://localhost:{port}/metrics", timeout=5) as response:
+        content_type = response.headers['Content-Type']
+        text = response.read().decode('utf-8')
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return content_type, samples
+
+
+metrics = ReportMetrics('check')
+rng = np.random.default_rng(0)
+values = rng.random(ROWS).round(2).astype(str).astype(object)
+values[::1000] = 'n/a'      # 200 values the conversion turns into NULL
+values[1::1000] = None      # 200 values already missing
+sheet = pd.DataFrame({'TSI': values})
+
+start = time.perf_counter()
+with metrics.timed('convert'):
+    metrics.rows_parsed.inc(len(sheet))
+    converted = pd.to_numeric(sheet['TSI'], errors='coerce')
+    metrics.coerced('TSI', sheet['TSI'], converted)
+convert_seconds = time.perf_counter() - start
+metrics.rows_loaded.inc(len(converted))
+metrics.failures['load'].inc()
+
+server = start_metrics_server(free_port())
+content_type, samples = scrape(server.server_address[1])
+server.shutdown()
+
+expected = {
+    'upload_rows_parsed_total{report="check"}': ROWS,
+    'upload_rows_loaded_total{report="check"}': ROWS,
+    'upload_coerced_nulls_total{report="check",column="TSI"}': ROWS // 1000,
+    'upload_failures_total{report="check",stage="load"}': 1,
+    'upload_failures_total{report="check",stage="parse"}': 0,
+    'upload_stage_seconds_count{report="check",stage="convert"}': 1,
+    'upload_stage_seconds_bucket{report="check",stage="convert",le="+Inf"}': 1,
+}
+print(f"Content-Type: {content_type}")
+for name, value in expected.items():
+    actual = samples.get(name)
+    print(f"  {name} = {actual} (expected {value})")
+    assert actual == value, name
+print("Scrape check: passed")
+
+# Recording cost: a bound child is one locked add, independent of the row count
+child = metrics.rows_parsed
+calls = 100000
+start = time.perf_counter()
+for _ in range(calls):
+    child.inc(1)
+per_call = (time.perf_counter() - start) / calls
+start = time.perf_counter()
+metrics.coerced('TSI', sheet['TSI'], converted)
+coerced_seconds = time.perf_counter() - start
+print(f"Counter inc: {per_call * 1e6:.2f} us per call")
+print(f"Coerced-null count on {ROWS} rows: {coerced_seconds * 1e3:.2f} ms "
+      f"({coerced_seconds / convert_seconds:.1%} of the conversion itself)")
@@ -0,0 +1,263 @@
+import decimal
+import hashlib
+import re
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from google.cloud import bigquery
+
+import snapshot_diff
+from load_reconciliation import (DECIMAL_PRECISION, KEY_HASH_HEX_DIGITS, KEY_HASH_MULTIPLIER, KEY_HASH_PRIME,
+                                 Checksums, ReconciliationError, reconcile_load)
+from snapshot_diff import AUDIT_COLUMNS, apply_delta, diff_snapshot, save_snapshot
+
+# Check: load a synthetic report into the local stand-in backend, then reconcile it.
+# A clean load must match; a truncated load, a coerced value, a cut text and a changed key
+# must each be reported. A delta load of the next export (new audit dates, some rows
+# updated, inserted and deleted) must match too. Also times the local checksums against
+# the Arrow conversion the load does anyway.
+# Usage: python src/bench_reconciliation.py
+ROWS = 200000
+TABLE_ID = 'local.check.Report_Check'
+
+SCHEMA = [
+    bigquery.SchemaField("IdLogQuotation", "FLOAT"),
+    bigquery.SchemaField("Branch", "STRING"),
+    bigquery.SchemaField("TSI", "FLOAT"),
+    bigquery.SchemaField("Qty", "INTEGER"),
+    bigquery.SchemaField("NEW_PREMI", "BIGNUMERIC"),
+    bigquery.SchemaField("DateCreated", "DATETIME"),
+]
+# The report schema plus the audit columns the uploaders stamp on every run
+AUDITED_SCHEMA = SCHEMA + [
+    bigquery.SchemaField("create_date", "DATETIME"),
+    bigquery.SchemaField("modified_date", "DATETIME"),
+    bigquery.SchemaField("create_by", "STRING"),
+    bigquery.SchemaField("modified_by", "STRING"),
+]
+
+
+class _Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def result(self):
+        return self.rows
+
+
+class LocalChecksumBackend:
+    """
+    Local stand-in for the loaded table and the aggregate query.
+    Loads convert the frame to Arrow with the BigQuery schema exactly as
+    load_table_from_dataframe does before upload. The aggregates are then evaluated on
+    that Arrow table with pyarrow.compute, independently of the pandas checksums.
+    The delete-and-insert transaction of snapshot_diff.apply_delta is applied as well.
+    transform(df) may damage the frame before it is stored, to simulate a bad load.
+    """
+
+    project = 'local'
+
+    def __init__(self, transform=None):
+        self.transform = transform
+        self.tables = {}
+
+    def load_table_from_dataframe(self, df, table_id, job_config=None):
+        from google.cloud.bigquery import _pandas_helpers
+        if self.transform is not None:
+            df = self.transform(df)
+        self.tables[table_id] = _pandas_helpers.dataframe_to_arrow(df, job_config.schema)
+        return _Job(len(df))
+
+    # The staging-table swap of replace_table
+    def copy_table(self, source_id, destination_id, job_config=None):
+        self.tables[destination_id] = self.tables[source_id]
+        return _Job(self.tables[source_id].num_rows)
+
+    def get_table(self, table_id):
+        from google.api_core.exceptions import NotFound
+        if table_id not in self.tables:
+            raise NotFound(f"Table {table_id} not found")
+        return _Table()
+
+    def delete_table(self, table_id, not_found_ok=False):
+        self.tables.pop(table_id, None)
+
+    def query(self, sql):
+        if 'BEGIN TRANSACTION' in sql:
+            return self._apply_delta(sql)
+        table_id = re.search(r'FROM `([^`]+)`', sql).group(1)
+        table = self.tables[table_id]
+        row = {}
+        for expression, alias in re.findall(r'^\s*(.+?) AS (\w+),?$', sql, flags=re.MULTILINE):
+            row[alias] = self._aggregate(table, expression)
+        return _Result([row])
+
+    def _apply_delta(self, sql):
+        table_id, key, keys_id = re.search(
+            r'DELETE FROM `([^`]+)` WHERE `([^`]+)` IN \(SELECT `[^`]+` FROM `([^`]+)`\)', sql).groups()
+        rows_id = re.search(r'INSERT INTO `[^`]+` \(.*\) SELECT .* FROM `([^`]+)`', sql).group(1)
+        table = self.tables[table_id]
+        kept = table.filter(pc.invert(pc.is_in(table.column(key), value_set=self.tables[keys_id].column(key).combine_chunks())))
+        self.tables[table_id] = pa.concat_tables([kept, self.tables[rows_id].select(kept.column_names).cast(kept.schema)])
+        return _Result([])
+
+    def _aggregate(self, table, expression):
+        if expression == 'COUNT(*)':
+            return table.num_rows
+        match = re.fullmatch(r'(\w+)\((.*)\)', expression)
+        func, inner = match.group(1), match.group(2)
+        if func == 'COUNTIF':
+            return table.column(re.fullmatch(r'`(.+)` IS NULL', inner).group(1)).null_count
+        values = self._values(table, inner)
+        if len(values) == 0 or values.null_count == len(values):
+            return None
+        if func == 'BIT_XOR':
+            return int(np.bitwise_xor.reduce(values.drop_null().to_numpy()))
+        if func == 'SUM':
+            if pa.types.is_decimal(values.type):
+                with decimal.localcontext() as ctx:
+                    ctx.prec = DECIMAL_PRECISION
+                    return sum((value for value in values.drop_null().to_pylist()), decimal.Decimal(0))
+            if pa.types.is_integer(values.type):
+                return sum(values.drop_null().to_pylist())
+            return pc.sum(values).as_py()
+        bound = (pc.min if func == 'MIN' else pc.max)(values).as_py()
+        return bound
+
+    def _values(self, table, inner):
+        column = re.fullmatch(r'`(.+)`', inner)
+        if column:
+            return table.column(column.group(1))
+        column = re.fullmatch(r'LENGTH\(`(.+)`\)', inner)
+        if column:
+            return pc.utf8_length(table.column(column.group(1)))
+        column = re.search(r'CAST\(`(.+?)` AS INT64\)', inner)
+        if column:
+            keys = pc.round(pc.cast(table.column(column.group(1)), pa.float64())).to_numpy(zero_copy_only=False)
+            keys = pd.Series(keys).dropna().to_numpy().astype(np.int64)
+            return pa.array(np.fmod(np.fmod(keys, KEY_HASH_PRIME) * KEY_HASH_MULTIPLIER, KEY_HASH_PRIME))
+        column = re.search(r'MD5\(`(.+?)`\)', inner)
+        keys = table.column(column.group(1)).drop_null().to_pylist()
+        return pa.array([int(hashlib.md5(str(key).encode('utf-8')).hexdigest()[:KEY_HASH_HEX_DIGITS], 16)
+                         for key in keys], type=pa.int64())
+
+
+class _Table:
+    table_type = 'TABLE'
+
+
+class _Job:
+    def __init__(self, output_rows):
+        self.output_rows = output_rows
+
+    def result(self):
+        return self
+
+
+def frame():
+    rng = np.random.default_rng(0)
+    branch = rng.choice(['Jakarta', 'Surabaya', 'Medan', 'Bandung Timur'], ROWS).astype(object)
+    branch[::97] = None
+    tsi = rng.random(ROWS) * 1e9
+    tsi[::113] = np.nan
+    premi = [decimal.Decimal(str(round(x, 2))) for x in rng.random(ROWS) * 1e7]
+    premi[::131] = [None] * len(premi[::131])
+    return pd.DataFrame({
+        'IdLogQuotation': np.arange(1, ROWS + 1, dtype=np.float64) * 7,
+        'Branch': branch,
+        'TSI': tsi,
+        'Qty': pd.array(rng.integers(0, 1000, ROWS), dtype='Int64'),
+        'NEW_PREMI': premi,
+        'DateCreated': pd.to_datetime('2025-01-01') + pd.to_timedelta(rng.integers(0, 10**7, ROWS), unit='s'),
+    })
+
+
+def damaged(how):
+    def transform(df):
+        df = df.copy()
+        if how == 'truncated':
+            return df.iloc[:-1]
+        if how == 'coerced':
+            df.loc[5, 'TSI'] = np.nan
+        elif how == 'cut text':
+            df.loc[7, 'Branch'] = 'Jak'
+        elif how == 'changed key':
+            df.loc[9, 'IdLogQuotation'] += 1
+        return df
+    return transform
+
+
+def run(label, df, transform=None):
+    client = LocalChecksumBackend(transform)
+    checksums = Checksums(df, SCHEMA, 'IdLogQuotation')
+    client.load_table_from_dataframe(df, TABLE_ID, job_config=bigquery.LoadJobConfig(schema=SCHEMA)).result()
+    try:
+        reconcile_load(client, TABLE_ID, checksums, SCHEMA)
+        detected = False
+    except ReconciliationError as e:
+        detected = True
+        print(f"  {e}")
+    print(f"{label}: {'mismatch reported' if detected else 'matched'}")
+    return detected
+
+
+def audited(df, now):
+    df = df.copy()
+    df['create_date'] = df['modified_date'] = now
+    df['create_by'] = df['modified_by'] = 'ETL_Script'
+    return df
+
+
+def run_delta():
+    # First export loaded in full, the next one as a delta through snapshot_diff
+    client = LocalChecksumBackend()
+    first = audited(frame(), datetime(2026, 1, 1, 8, 0))
+    client.load_table_from_dataframe(first, TABLE_ID, job_config=bigquery.LoadJobConfig(schema=AUDITED_SCHEMA))
+    save_snapshot(diff_snapshot('Report_Check', first, 'IdLogQuotation'))
+
+    second = frame().iloc[10:].reset_index(drop=True)           # 10 rows deleted
+    second.loc[:4, 'TSI'] += 1                                   # 5 rows updated
+    extra = frame().iloc[:3].assign(IdLogQuotation=lambda d: d['IdLogQuotation'] + 10**9)
+    second = audited(pd.concat([second, extra], ignore_index=True), datetime(2026, 1, 2, 8, 0))  # 3 inserted
+    changes = diff_snapshot('Report_Check', second, 'IdLogQuotation')
+    written = apply_delta(client, TABLE_ID, second, changes, AUDITED_SCHEMA)
+
+    stale_dates = Checksums(second, AUDITED_SCHEMA, 'IdLogQuotation')
+    stale = [alias for alias, _, _ in stale_dates.compare(next(iter(client.query(stale_dates.query(TABLE_ID)).result())))]
+    print(f"delta load ({written} rows written): unchanged rows keep their audit dates, "
+          f"differing on {', '.join(stale) or 'nothing'}")
+    try:
+        reconcile_load(client, TABLE_ID, Checksums(second, AUDITED_SCHEMA, 'IdLogQuotation', skip=AUDIT_COLUMNS),
+                       AUDITED_SCHEMA)
+        return written == 8 and bool(stale)
+    except ReconciliationError as e:
+        print(f"  {e}")
+        return False
+
+
+df = frame()
+ok = not run("clean load", df)
+for how in ('truncated', 'coerced', 'cut text', 'changed key'):
+    ok &= run(how, df, damaged(how))
+with tempfile.TemporaryDirectory() as snapshot_dir:
+    snapshot_diff.SNAPSHOT_DIR = snapshot_dir
+    delta_ok = run_delta()
+print(f"delta load: {'matched' if delta_ok else 'MISMATCH'}")
+assert ok and delta_ok
+print("Reconciliation check: passed")
+
+from google.cloud.bigquery import _pandas_helpers
+start = time.perf_counter()
+checksums = Checksums(df, SCHEMA, 'IdLogQuotation')
+checksum_seconds = time.perf_counter() - start
+start = time.perf_counter()
+_pandas_helpers.dataframe_to_arrow(df, SCHEMA)
+arrow_seconds = time.perf_counter() - start
+print(f"Local checksums on {ROWS} rows: {checksum_seconds * 1e3:.0f} ms "
+      f"({len(checksums.checks)} aggregates; Arrow conversion for the load: {arrow_seconds * 1e3:.0f} ms)")
+print(f"Query: {len(checksums.query(TABLE_ID))} bytes of SQL, one result row")
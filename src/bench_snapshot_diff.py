@@ -0,0 +1,52 @@
+import os
+import tempfile
+
+import pandas as pd
+
+import snapshot_diff
+from snapshot_diff import diff_snapshot, save_snapshot, snapshot_path
+
+# Check: an export whose keys have nulls or duplicates is loaded in full and never becomes
+# a baseline (the old one is dropped, so the next run is a full load again), a stored
+# snapshot with duplicate keys is ignored instead of failing the diff, and clean exports
+# still diff by key.
+# Usage: python src/bench_snapshot_diff.py
+TABLE = 'logbook'
+KEY = 'IdLogbook'
+
+
+def export(ids, remarks):
+    return pd.DataFrame({KEY: ids, 'Remark': remarks, 'create_date': pd.Timestamp.now()})
+
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+    snapshot_diff.SNAPSHOT_DIR = tmp_dir
+
+    first = diff_snapshot(TABLE, export([1, 2, 3], ['a', 'b', 'c']), KEY)
+    assert not first.has_baseline and first.keys_usable
+    save_snapshot(first)
+
+    changed = diff_snapshot(TABLE, export([1, 2, 4], ['a', 'B', 'd']), KEY)
+    assert changed.has_baseline
+    assert changed.summary()['inserted'] == 1 and changed.summary()['updated'] == 1
+    assert list(changed.deleted_keys) == [3]
+    save_snapshot(changed)
+    print("Clean exports diff by key: passed")
+
+    duplicated = diff_snapshot(TABLE, export([1, 2, 2], ['a', 'B', 'x']), KEY)
+    assert not duplicated.has_baseline and not duplicated.keys_usable
+    save_snapshot(duplicated)
+    assert not os.path.exists(snapshot_path(TABLE))
+
+    after = diff_snapshot(TABLE, export([1, 2, 4], ['a', 'B', 'd']), KEY)
+    assert not after.has_baseline and after.keys_usable
+    save_snapshot(after)
+    assert diff_snapshot(TABLE, export([1, 2, 4], ['a', 'B', 'd']), KEY).has_baseline
+    print("Duplicate keys never become the baseline: passed")
+
+    # A snapshot stored with duplicate keys (e.g. by an older version) falls back to a full load
+    stored = pd.read_parquet(snapshot_path(TABLE))
+    pd.concat([stored, stored.head(1)], ignore_index=True).to_parquet(snapshot_path(TABLE), index=False)
+    fallback = diff_snapshot(TABLE, export([1, 2, 4], ['a', 'B', 'd']), KEY)
+    assert not fallback.has_baseline and fallback.inserted.all()
+    print("Snapshot with duplicate keys ignored: passed")
@@ -0,0 +1,60 @@
+import glob
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from arrow_ipc_handoff import to_arrow_table
+from prod_hist_schema import COLUMN_MAPPING, SCHEMA
+from source_readers import declared_column_types, read_source
+
+# Benchmark: parse throughput of the same prod_hist data as xlsx, csv, csv.gz and parquet.
+# The xlsx files are converted once into a temporary folder; every format is read with the
+# column types the uploader declares, and must read back to exactly the frame the xlsx
+# reader returns.
+# Usage: python src/bench_source_formats.py [prod_hist_dir]
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+prod_hist_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(PROJECT_ROOT, 'data', 'prod_hist')
+# As upload_prod_hist reads its exports
+COLUMN_TYPES = declared_column_types(SCHEMA, COLUMN_MAPPING)
+
+WRITERS = {
+    '.csv': lambda df, path: df.to_csv(path, index=False),
+    '.csv.gz': lambda df, path: df.to_csv(path, index=False),
+    '.parquet': lambda df, path: pq.write_table(to_arrow_table(df), path),
+}
+
+
+def timed_read(label, paths):
+    start = time.perf_counter()
+    frames = [read_source(path, column_types=COLUMN_TYPES) for path in paths]
+    elapsed = time.perf_counter() - start
+    rows = sum(len(df) for df in frames)
+    print(f"  {label:<8} {elapsed:8.2f}s  {rows / elapsed:12,.0f} rows/s")
+    return frames
+
+
+files = sorted(glob.glob(os.path.join(prod_hist_dir, '*.xlsx')))
+print(f"Files: {len(files)} in {prod_hist_dir}")
+reference = timed_read('xlsx', files)
+print(f"Rows: {sum(len(df) for df in reference)}")
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+    converted = {extension: [] for extension in WRITERS}
+    for path, df in zip(files, reference):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        for extension, write in WRITERS.items():
+            target = os.path.join(tmp_dir, stem + extension)
+            write(df, target)
+            converted[extension].append(target)
+
+    for extension, paths in converted.items():
+        frames = timed_read(extension.lstrip('.'), paths)
+        for expected, actual in zip(reference, frames):
+            pd.testing.assert_frame_equal(expected, actual)
+        print("    identical to xlsx: passed")
@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import Counter
+
+import google.auth
+from google.auth.transport.requests import AuthorizedSession
+from google.api_core.exceptions import Conflict, NotFound
+from google.cloud import bigquery
+from requests.adapters import HTTPAdapter
+
+# Datasets/tables we created or loaded are trusted to still exist for this long
+CACHE_TTL_SECONDS = 600
+# Connections kept open to the BigQuery API (shared by all threads using the client)
+HTTP_POOL_SIZE = 16
+
+_lock = threading.Lock()
+_client = None
+_known = {}  # ('dataset'|'table', id) -> expiry (time.monotonic())
+
+# API round trips skipped thanks to the existence cache (reusing the client saves set-up, not calls).
+# Updated from uploader worker threads, so only under _lock; read it through api_calls_saved().
+API_CALLS_SAVED = Counter()
+
+
+def get_client():
+    """
+    Return the process-wide BigQuery client, creating it on first use.
+    The client shares one authorized HTTP session whose connection pool is
+    sized for concurrent uploads, so repeated loads reuse warm connections.
+    """
+    global _client
+    with _lock:
+        if _client is not None:
+            return _client
+
+        credentials, project = google.auth.default(scopes=bigquery.Client.SCOPE)
+        session = AuthorizedSession(credentials)
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount('https://', adapter)
+        _client = bigquery.Client(project=project, credentials=credentials, _http=session)
+        return _client
+
+
+def _is_known(kind, name, saved_call):
+    # A hit skips saved_call, which is counted in the same locked step
+    with _lock:
+        expiry = _known.get((kind, name))
+        if expiry is not None and expiry > time.monotonic():
+            API_CALLS_SAVED[saved_call] += 1
+            return True
+        _known.pop((kind, name), None)
+        return False
+
+
+def _remember(kind, name):
+    with _lock:
+        _known[(kind, name)] = time.monotonic() + CACHE_TTL_SECONDS
+
+
+def forget_table(table_id):
+    with _lock:
+        _known.pop(('table', table_id), None)
+
+
+def ensure_dataset(client, dataset_id, location):
+    """
+    Create the dataset unless it was created/confirmed within CACHE_TTL_SECONDS.
+    """
+    full_id = f"{client.project}.{dataset_id}"
+    if _is_known('dataset', full_id, 'create_dataset'):
+        return
+
+    dataset = bigquery.Dataset(full_id)
+    dataset.location = location
+    try:
+        client.create_dataset(dataset, timeout=30)
+        print(f"Created dataset {full_id}")
+    except Conflict:
+        print(f"Dataset {full_id} already exists")
+    _remember('dataset', full_id)
+
+
+def replace_table(client, table_id, df, schema):
+    """
+    Replace the contents of table_id with df without the table ever going missing:
+    df is loaded into <table>__staging, which one copy job (WRITE_TRUNCATE) then swaps
+    in atomically, so readers see either the old or the new rows.
+    An EXTERNAL table (which cannot be overwritten) is deleted first; the check is
+    skipped when this process loaded the table itself within CACHE_TTL_SECONDS.
+    Returns the number of rows loaded.
+    """
+    staging_id = f"{table_id}__staging"
+    job = client.load_table_from_dataframe(
+        df, staging_id,
+        job_config=bigquery.LoadJobConfig(write_disposition="WRITE_TRUNCATE", schema=schema)
+    )
+    job.result()
+
+    if not _is_known('table', table_id, 'get_table'):
+        try:
+            if client.get_table(table_id).table_type == 'EXTERNAL':
+                client.delete_table(table_id, not_found_ok=True)
+        except NotFound:
+            pass
+
+    client.copy_table(
+        staging_id, table_id,
+        job_config=bigquery.CopyJobConfig(write_disposition="WRITE_TRUNCATE")
+    ).result()
+    client.delete_table(staging_id, not_found_ok=True)
+    return job.output_rows
+
+
+def remember_table(table_id):
+    # Call after a successful load into table_id
+    _remember('table', table_id)
+
+
+def api_calls_saved():
+    # Consistent copy of API_CALLS_SAVED
+    with _lock:
+        return Counter(API_CALLS_SAVED)
+
+
+def print_metrics():
+    calls = api_calls_saved()
+    if not calls:
+        return
+    saved = ", ".join(f"{name}={count}" for name, count in sorted(calls.items()))
+    print(f"BigQuery API calls saved: {sum(calls.values())} ({saved})")
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from google.cloud import bigquery
+
+# Configuration
+# Determine the project root (parent of the 'src' directory where this script lives)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+# Inferred schema per sheet version (header fingerprint). Kept in the repo so that
+# reloads are deterministic everywhere and a type change shows up as a diff.
+SCHEMA_CACHE_FILE = os.path.join(PROJECT_ROOT, 'schemas', 'budget_schemas.json')
+
+_lock = threading.Lock()
+
+
+def header_fingerprint(sheet_name, columns):
+    # Same sheet + same (sanitized) headers in the same order = same sheet version
+    text = json.dumps([sheet_name, [str(col) for col in columns]])
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def infer_schema(df):
+    """
+    Decide a BigQuery type per column from the converted frame's dtypes, in one pass:
+    integer -> INTEGER, float -> FLOAT, bool -> BOOLEAN, anything else -> STRING.
+    """
+    kinds = df.dtypes.map(lambda dtype: np.dtype(dtype).kind if isinstance(dtype, np.dtype) else 'O')
+    types = kinds.map({'i': 'INTEGER', 'u': 'INTEGER', 'f': 'FLOAT', 'b': 'BOOLEAN'}).fillna('STRING')
+    return [[str(col), field_type] for col, field_type in zip(df.columns, types)]
+
+
+def _load_cache():
+    if not os.path.exists(SCHEMA_CACHE_FILE):
+        return {'versions': {}, 'latest': {}}
+    with open(SCHEMA_CACHE_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_cache(cache):
+    os.makedirs(os.path.dirname(SCHEMA_CACHE_FILE), exist_ok=True)
+    tmp_file = SCHEMA_CACHE_FILE + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, SCHEMA_CACHE_FILE)
+
+
+def _print_schema_diff(sheet_name, old_columns, new_columns):
+    old_types, new_types = dict(old_columns), dict(new_columns)
+    for col in new_types:
+        if col not in old_types:
+            print(f"  Schema change in '{sheet_name}': + {col} {new_types[col]}")
+        elif old_types[col] != new_types[col]:
+            print(f"  Schema change in '{sheet_name}': {col} {old_types[col]} -> {new_types[col]}")
+    for col in old_types:
+        if col not in new_types:
+            print(f"  Schema change in '{sheet_name}': - {col} {old_types[col]}")
+
+
+def _fits(series, field_type):
+    # Can the column be loaded as field_type without losing data?
+    if field_type == 'STRING':
+        return True
+    if field_type == 'FLOAT':
+        return pd.api.types.is_numeric_dtype(series)
+    if field_type == 'INTEGER':
+        return pd.api.types.is_numeric_dtype(series) and bool((series % 1 == 0).all())
+    if field_type == 'BOOLEAN':
+        return pd.api.types.is_bool_dtype(series)
+    return False
+
+
+def resolve_schema(sheet_name, df):
+    """
+    Return the explicit schema for this sheet version, inferring and caching it on first sight.
+    - A known header fingerprint reuses its cached types; a column whose data no longer
+      fits its cached type is widened (INTEGER -> FLOAT, otherwise STRING) and reported.
+    - A new fingerprint (new budget version) is inferred and diffed against the previous
+      version of the same sheet, so type flips are printed instead of passing silently.
+    """
+    fingerprint = header_fingerprint(sheet_name, df.columns)
+    with _lock:
+        cache = _load_cache()
+        entry = cache['versions'].get(fingerprint)
+        if entry is None:
+            columns = infer_schema(df)
+            previous = cache['latest'].get(sheet_name)
+            if previous and previous in cache['versions']:
+                _print_schema_diff(sheet_name, cache['versions'][previous]['columns'], columns)
+            print(f"  -> Inferred schema for '{sheet_name}' (version {fingerprint})")
+        else:
+            # A copy: widening must show up as a difference from the cached entry, so it is saved
+            columns = [list(column) for column in entry['columns']]
+            for i, (col, field_type) in enumerate(columns):
+                if not _fits(df[col], field_type):
+                    widened = 'FLOAT' if field_type == 'INTEGER' and _fits(df[col], 'FLOAT') else 'STRING'
+                    print(f"  Schema change in '{sheet_name}': {col} {field_type} -> {widened} (data no longer fits)")
+                    columns[i] = [col, widened]
+
+        if entry is None or entry['columns'] != columns or cache['latest'].get(sheet_name) != fingerprint:
+            cache['versions'][fingerprint] = {
+                'sheet': sheet_name,
+                'columns': columns,
+                'updated_at': datetime.now().isoformat(timespec='seconds'),
+            }
+            cache['latest'][sheet_name] = fingerprint
+            _save_cache(cache)
+
+    return [bigquery.SchemaField(col, field_type) for col, field_type in columns]
+
+
+def conform(df, schema):
+    """Cast every column to its schema type so the load never depends on pandas' inference."""
+    casts = {'INTEGER': 'int64', 'FLOAT': 'float64', 'BOOLEAN': 'bool', 'STRING': str}
+    return df.astype({field.name: casts[field.field_type] for field in schema})
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+# Builds a load frame column by column, straight into schema order, instead of the
+# rename -> insert missing/audit columns -> project -> convert (-> concat) chain, where
+# every step produced another full frame. Each output column is stacked from the source
+# parts once, converted once and handed to the result without a further copy
+# (DataFrame from a dict of Series with copy=False keeps each one's data and dtype and does
+# not consolidate them into 2D blocks).
+
+
+def _missing_piece(length, like):
+    # What stacking frames gives for a column one of them lacks: nulls of the others' type
+    dtype = like.dtype
+    if pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype):
+        dtype = 'float64'
+    return pd.Series(None, index=pd.RangeIndex(length), dtype=dtype)
+
+
+def _fill_column(value, lengths):
+    total = sum(lengths)
+    if isinstance(value, pd.Series):
+        # A derived column of the full length (e.g. computed from other source columns)
+        return value.reset_index(drop=True)
+    if isinstance(value, (np.ndarray, pd.api.extensions.ExtensionArray)):
+        return pd.Series(value, index=pd.RangeIndex(total))
+    if isinstance(value, list):
+        # One value per part (e.g. the part's file name)
+        return pd.Series(np.repeat(np.array(value, dtype=object), lengths), index=pd.RangeIndex(total))
+    return pd.Series(value, index=pd.RangeIndex(total))
+
+
+def build_frame(parts, schema, column_mapping=None, fill=None, convert=None, keep=None, consume=False):
+    """
+    The schema's columns, in schema order, stacked from parts (source frames with source
+    headers, in row order).
+    column_mapping: source header -> schema column (unmapped headers keep their name).
+    fill: schema column -> value for every row, a list with one value per part, or a
+        full-length Series/array. Takes precedence over a source column of the same name.
+    convert: schema column -> function(Series) -> Series, applied to the stacked column
+        (named after the schema column).
+    keep: boolean mask over the stacked rows; dropped rows never reach the output.
+    consume: drop each source column from its part once it has been stacked, so the parsed
+        data is released column by column while the output grows. The parts are modified.
+    Schema columns found nowhere are NULL, with a warning.
+    """
+    column_mapping = column_mapping or {}
+    fill = fill or {}
+    convert = convert or {}
+    lengths = [len(part) for part in parts]
+    # Schema column -> source header, per part
+    headers = []
+    for part in parts:
+        found = {}
+        for header in part.columns:
+            found.setdefault(column_mapping.get(header, header), header)
+        headers.append(found)
+    if keep is not None:
+        keep = np.asarray(keep, dtype=bool)
+
+    columns = {}
+    for field in schema:
+        col = field.name
+        if col in fill:
+            series = _fill_column(fill[col], lengths)
+        elif any(col in found for found in headers):
+            like = next(part[found[col]] for part, found in zip(parts, headers) if col in found)
+            pieces = [part[found[col]] if col in found else _missing_piece(length, like)
+                      for part, found, length in zip(parts, headers, lengths)]
+            del like
+            series = pieces[0].reset_index(drop=True) if len(pieces) == 1 else pd.concat(pieces, ignore_index=True)
+            del pieces
+            if consume:
+                for part, found in zip(parts, headers):
+                    if col in found:
+                        del part[found[col]]
+        else:
+            print(f"  Warning: Column {col} missing in data, filling with Null")
+            # None, as assigning None to a frame column gives (Series(None, dtype=object) holds NaN)
+            series = pd.Series([None] * sum(lengths), index=pd.RangeIndex(sum(lengths)), dtype=object)
+        if keep is not None:
+            series = series[keep].reset_index(drop=True)
+        if col in convert:
+            series = convert[col](series.rename(col))
+        columns[col] = series
+        del series
+    rows = int(keep.sum()) if keep is not None else sum(lengths)
+    return pd.DataFrame(columns, index=pd.RangeIndex(rows), copy=False)
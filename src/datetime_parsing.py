@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+# Formats tried when detecting a column's layout, per day/month order of the source.
+# ISO layouts are unambiguous and tried for every source.
+ISO_FORMATS = [
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d',
+]
+MONTH_FIRST_FORMATS = [
+    '%m/%d/%Y %I:%M:%S %p',  # 1/2/2025 2:50:39 PM
+    '%m/%d/%Y %H:%M:%S',     # 01/03/2025 10:58:10
+    '%m/%d/%Y %H:%M',
+    '%m/%d/%Y',
+]
+DAY_FIRST_FORMATS = [
+    '%d/%m/%Y %I:%M:%S %p',
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y',
+]
+
+# Number of distinct values used to pick a column's format
+SAMPLE_SIZE = 500
+
+# Text dates in the UW, ReAs and Logbook exports are month-first
+# (e.g. 01/23/2025 08:43:52, 1/2/2025 2:50:39 PM)
+REPORT_DAYFIRST = False
+
+
+def candidate_formats(dayfirst):
+    return ISO_FORMATS + (DAY_FIRST_FORMATS if dayfirst else MONTH_FIRST_FORMATS)
+
+
+def detect_format(values, dayfirst):
+    """
+    Pick the candidate format that parses the most values of a sample.
+    values should be distinct, stripped strings. Returns None if no format parses anything.
+    """
+    sample = pd.Index(values[:SAMPLE_SIZE])
+    best_format, best_count = None, 0
+    for fmt in candidate_formats(dayfirst):
+        count = int(pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum())
+        if count > best_count:
+            best_format, best_count = fmt, count
+            if count == len(sample):
+                break
+    return best_format
+
+
+def parse_datetime_column(series, dayfirst, fmt=None):
+    """
+    Parse a date column with one fixed format instead of per-element inference.
+    - Columns Excel already typed as datetimes are returned unchanged.
+    - Each distinct value is parsed once and the result broadcast back to every row
+      (many rows share the same timestamp).
+    - The format is detected from a sample of the column unless fmt is given.
+      dayfirst declares the source's day/month order; it is never guessed per value.
+    - Values the format does not match (e.g. '1/2/2025 2:50:39 PM' in a column of
+      '01/03/2025 10:58:10') are retried with the other candidate formats.
+    Values no format matches become NaT, like errors='coerce', and are counted in a warning.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+
+    codes, uniques = pd.factorize(series)
+    uniques = pd.Series(uniques, dtype=object)
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype='datetime64[ns]')
+
+    # Values Excel typed as datetimes inside an otherwise text column
+    is_text = uniques.map(lambda value: isinstance(value, str))
+    if (~is_text).any():
+        parsed[~is_text] = pd.to_datetime(uniques[~is_text], errors='coerce')
+
+    text = uniques[is_text].str.strip()
+    if len(text):
+        if fmt is None:
+            fmt = detect_format(text.to_numpy(), dayfirst)
+        if fmt is not None:
+            parsed[is_text] = pd.to_datetime(text, format=fmt, errors='coerce')
+        for other in candidate_formats(dayfirst):
+            left = text[parsed[is_text].isna() & (text != '')]
+            if left.empty:
+                break
+            if other != fmt:
+                parsed[left.index] = pd.to_datetime(left, format=other, errors='coerce')
+        unparsed = parsed[is_text].isna() & (text != '')
+        if unparsed.any():
+            rows = int(np.isin(codes, unparsed[unparsed].index).sum())
+            print(f"  Warning: {rows} values of {series.name} match no date format "
+                  f"(e.g. {text[unparsed].iloc[0]!r}), loaded as NULL")
+
+    # -1 marks a missing value in codes; point it at an extra NaT slot
+    values = np.append(parsed.to_numpy(), np.datetime64('NaT', 'ns'))
+    return pd.Series(values[codes], index=series.index, name=series.name)
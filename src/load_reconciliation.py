@@ -0,0 +1,176 @@
+import datetime
+import hashlib
+import math
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Post-load reconciliation: compact checksums of the frame about to be loaded are compared
+# with one aggregate query over the loaded table, so a truncated load or values silently
+# coerced on the way in are reported instead of trusted. Nothing is downloaded.
+# Per column:
+# - every column: NULL count;
+# - INTEGER / NUMERIC / BIGNUMERIC: exact SUM; FLOAT: SUM within FLOAT_RELATIVE_TOLERANCE;
+# - STRING: SUM of LENGTH (catches truncated or replaced text);
+# - DATETIME / DATE: MIN and MAX;
+# plus the row count and, for tables with a key column, XOR and SUM of a hash of the key.
+# Columns the uploader stamps itself (create_date, modified_date, ...) are skipped: a delta
+# load leaves them at their old values in unchanged rows, so they never match the frame.
+
+FLOAT_RELATIVE_TOLERANCE = 1e-9
+# Digits of the exact BIGNUMERIC sums (Decimal context and Arrow decimal256)
+DECIMAL_PRECISION = 77
+
+# Numeric keys are hashed with arithmetic that cannot overflow INT64 in BigQuery:
+# MOD(MOD(key, P) * M, P) (Park-Miller multiplier)
+KEY_HASH_PRIME = 2147483647
+KEY_HASH_MULTIPLIER = 48271
+# String keys: the first 15 hex digits (60 bits) of MD5, so the value fits INT64
+KEY_HASH_HEX_DIGITS = 15
+
+
+class ReconciliationError(Exception):
+    pass
+
+
+def _numeric_key_sql(col):
+    return f"MOD(MOD(CAST(`{col}` AS INT64), {KEY_HASH_PRIME}) * {KEY_HASH_MULTIPLIER}, {KEY_HASH_PRIME})"
+
+
+def _string_key_sql(col):
+    return f"CAST(CONCAT('0x', SUBSTR(TO_HEX(MD5(`{col}`)), 1, {KEY_HASH_HEX_DIGITS})) AS INT64)"
+
+
+def _numeric_key_hashes(values):
+    # np.fmod truncates like BigQuery's MOD (the sign follows the dividend)
+    keys = np.round(values.dropna().to_numpy(dtype=np.float64)).astype(np.int64)
+    return np.fmod(np.fmod(keys, KEY_HASH_PRIME) * KEY_HASH_MULTIPLIER, KEY_HASH_PRIME)
+
+
+def _string_key_xor_sum(values):
+    # MD5 per distinct key; a key repeated an even number of times cancels out of the XOR
+    codes, uniques = pd.factorize(values.dropna().astype(str))
+    counts = np.bincount(codes, minlength=len(uniques))
+    hashes = np.array([int(hashlib.md5(value.encode('utf-8')).hexdigest()[:KEY_HASH_HEX_DIGITS], 16)
+                       for value in uniques], dtype=np.int64)
+    if not len(hashes):
+        return None, None
+    xor = int(np.bitwise_xor.reduce(hashes[counts % 2 == 1], initial=0))
+    total = sum(int(h) * int(c) for h, c in zip(hashes, counts))
+    return xor, total
+
+
+def _decimal_sum(values):
+    # Exact: Arrow sums decimal256 in C++ at the BIGNUMERIC scale
+    present = values.dropna()
+    if present.empty:
+        return None
+    return pc.sum(pa.array(present.tolist(), type=pa.decimal256(DECIMAL_PRECISION - 1, 38))).as_py()
+
+
+def _datetime_bound(values, how):
+    present = values.dropna()
+    if present.empty:
+        return None
+    bound = present.min() if how == 'min' else present.max()
+    if isinstance(bound, pd.Timestamp):
+        # BigQuery keeps microseconds
+        bound = bound.floor('us').to_pydatetime()
+    return bound
+
+
+class Checksums:
+    """
+    Expected aggregates of one frame: {alias: (SQL expression, local value, kind)}.
+    kind decides how the loaded value is compared ('exact' or 'float').
+    skip lists columns that are not checked.
+    """
+
+    def __init__(self, df, schema, key_column=None, skip=()):
+        self.rows = len(df)
+        self.checks = {'row_count': ("COUNT(*)", self.rows, 'exact')}
+        null_counts = df.isna().sum()
+        for i, field in enumerate(schema):
+            col = field.name
+            if col not in df.columns or col in skip:
+                continue
+            values = df[col]
+            self.checks[f"c{i}_nulls"] = (f"COUNTIF(`{col}` IS NULL)", int(null_counts[col]), 'exact')
+            field_type = field.field_type
+            if field_type == 'INTEGER':
+                present = values.dropna()
+                total = int(present.astype(np.int64).sum()) if len(present) else None
+                self.checks[f"c{i}_sum"] = (f"SUM(`{col}`)", total, 'exact')
+            elif field_type == 'FLOAT':
+                present = pd.to_numeric(values, errors='coerce').dropna()
+                total = float(present.sum()) if len(present) else None
+                self.checks[f"c{i}_sum"] = (f"SUM(`{col}`)", total, 'float')
+            elif field_type in ('NUMERIC', 'BIGNUMERIC'):
+                self.checks[f"c{i}_sum"] = (f"SUM(`{col}`)", _decimal_sum(values), 'exact')
+            elif field_type == 'STRING':
+                lengths = values.dropna().astype(str).str.len()
+                total = int(lengths.sum()) if len(lengths) else None
+                self.checks[f"c{i}_len"] = (f"SUM(LENGTH(`{col}`))", total, 'exact')
+            elif field_type in ('DATETIME', 'DATE', 'TIMESTAMP'):
+                self.checks[f"c{i}_min"] = (f"MIN(`{col}`)", _datetime_bound(values, 'min'), 'exact')
+                self.checks[f"c{i}_max"] = (f"MAX(`{col}`)", _datetime_bound(values, 'max'), 'exact')
+
+        if key_column is not None and key_column in df.columns:
+            key_type = next((field.field_type for field in schema if field.name == key_column), 'STRING')
+            values = df[key_column]
+            if key_type in ('INTEGER', 'FLOAT', 'NUMERIC', 'BIGNUMERIC'):
+                hashes = _numeric_key_hashes(pd.to_numeric(values, errors='coerce'))
+                key_sql = _numeric_key_sql(key_column)
+                xor = int(np.bitwise_xor.reduce(hashes)) if len(hashes) else None
+                total = int(hashes.sum()) if len(hashes) else None
+            else:
+                key_sql = _string_key_sql(key_column)
+                xor, total = _string_key_xor_sum(values)
+            self.checks['key_xor'] = (f"BIT_XOR({key_sql})", xor, 'exact')
+            self.checks['key_sum'] = (f"SUM({key_sql})", total, 'exact')
+
+    def query(self, table_id):
+        selects = ",\n  ".join(f"{sql} AS {alias}" for alias, (sql, _, _) in self.checks.items())
+        return f"SELECT\n  {selects}\nFROM `{table_id}`"
+
+    def compare(self, row):
+        """[(alias, expected, loaded)] for every aggregate that does not match."""
+        mismatches = []
+        for alias, (_, expected, kind) in self.checks.items():
+            loaded = row[alias]
+            if isinstance(loaded, datetime.datetime) and isinstance(expected, datetime.datetime):
+                loaded, expected = loaded.replace(tzinfo=None), expected.replace(tzinfo=None)
+            if expected is None or loaded is None:
+                same = expected is None and loaded is None
+            elif kind == 'float':
+                same = math.isclose(float(loaded), expected, rel_tol=FLOAT_RELATIVE_TOLERANCE, abs_tol=1e-9)
+            else:
+                same = loaded == expected
+            if not same:
+                mismatches.append((alias, expected, loaded))
+        return mismatches
+
+
+def column_of(alias, schema):
+    # c3_sum -> "NEW_PREMI sum"
+    match = re.match(r'^c(\d+)_(\w+)$', alias)
+    if not match:
+        return alias
+    return f"{schema[int(match.group(1))].name} {match.group(2)}"
+
+
+def reconcile_load(client, table_id, checksums, schema):
+    """
+    Compare checksums (taken from the frame before the load) with one aggregate query over
+    table_id. Raises ReconciliationError listing every mismatch.
+    """
+    row = next(iter(client.query(checksums.query(table_id)).result()))
+    mismatches = checksums.compare(row)
+    if mismatches:
+        details = "; ".join(f"{column_of(alias, schema)}: expected {expected}, loaded {loaded}"
+                            for alias, expected, loaded in mismatches)
+        raise ReconciliationError(f"{table_id} does not match the uploaded frame ({details})")
+    print(f"  -> Reconciled {table_id}: {len(checksums.checks)} checksums match")
@@ -0,0 +1,252 @@
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pandas as pd
+from google.api_core.exceptions import (
+    BadGateway, Forbidden, InternalServerError, ServiceUnavailable, TooManyRequests,
+)
+from google.cloud import bigquery
+
+from bq_client_pool import replace_table
+
+# Every load job goes through one scheduler per process (report loads, the delta staging
+# tables, dimensions and rollups). Query jobs (the delta MERGE, rollups computed in
+# BigQuery) and the Storage Write sink are not load jobs and are sent directly.
+# - requests are queued per destination table; requests still waiting for the same
+#   table are merged into one job (a replace supersedes what is queued before it,
+#   appends are concatenated), so a burst of small loads costs one job;
+# - a job only starts while the quota budgets below have room, so the scheduler
+#   waits instead of having BigQuery reject the job;
+# - transient errors (rate limits, 5xx) are retried with jittered exponential backoff;
+# - interactive reports go before the prod_hist backfill whenever both are waiting.
+
+INTERACTIVE = 0
+BACKFILL = 1
+
+# (scope, jobs, window seconds): at most `jobs` jobs started per window, counted per
+# destination table ('table') or for the whole process ('project'). Kept below
+# BigQuery's limits: 5 table metadata updates per 10 s per table, 1,500 load jobs per
+# table per day, 100,000 load jobs per project per day.
+QUOTA_BUDGETS = [
+    ('table', 4, 10),
+    ('table', 1000, 86400),
+    ('project', 50000, 86400),
+]
+# Jobs running at the same time
+MAX_CONCURRENT_JOBS = 4
+
+# Retries of a job failing with a transient error
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+TRANSIENT_ERRORS = (TooManyRequests, InternalServerError, BadGateway, ServiceUnavailable)
+# 403s that only mean "slow down"
+TRANSIENT_REASONS = {'rateLimitExceeded', 'backendError', 'internalError'}
+
+
+def is_transient(error):
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    if isinstance(error, Forbidden):
+        return any(detail.get('reason') in TRANSIENT_REASONS for detail in (error.errors or []))
+    return False
+
+
+def backoff_delay(attempt):
+    # "Full jitter": retries of jobs that failed together spread out instead of colliding again
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def append_table(client, table_id, df, schema):
+    job = client.load_table_from_dataframe(
+        df, table_id,
+        job_config=bigquery.LoadJobConfig(write_disposition="WRITE_APPEND", schema=schema)
+    )
+    job.result()
+    return job.output_rows
+
+
+def truncate_table(client, table_id, df, schema):
+    # Direct WRITE_TRUNCATE load (no staging table)
+    job = client.load_table_from_dataframe(
+        df, table_id,
+        job_config=bigquery.LoadJobConfig(write_disposition="WRITE_TRUNCATE", schema=schema)
+    )
+    job.result()
+    return job.output_rows
+
+
+class LoadRequest:
+    def __init__(self, client, table_id, df, schema, priority, write, append):
+        self.client = client
+        self.table_id = table_id
+        self.frames = [df]
+        self.schema = schema
+        self.priority = priority
+        self.write = write
+        self.append = append
+        self.futures = []
+        self.submitted = time.monotonic()
+        self.not_before = 0.0
+        self.attempt = 0
+
+    def merge(self, other):
+        """Fold a later request for the same table into this one."""
+        if other.append:
+            self.frames.extend(other.frames)
+        else:
+            # A replace makes everything queued before it irrelevant
+            self.frames = list(other.frames)
+            self.schema = other.schema
+            self.write = other.write
+            self.append = False
+        self.priority = min(self.priority, other.priority)
+        self.futures.extend(other.futures)
+
+    def frame(self):
+        if len(self.frames) == 1:
+            return self.frames[0]
+        return pd.concat(self.frames, ignore_index=True)
+
+
+class LoadScheduler:
+    def __init__(self, budgets=None, max_concurrent=MAX_CONCURRENT_JOBS, max_attempts=MAX_ATTEMPTS):
+        self.budgets = QUOTA_BUDGETS if budgets is None else budgets
+        self.max_concurrent = max_concurrent
+        self.max_attempts = max_attempts
+        self.pending = {}       # table_id -> LoadRequest waiting to run
+        self.running = set()    # table_ids with a job in flight (one per table, in order)
+        self.started = defaultdict(deque)  # (budget index, scope key) -> job start times
+        self.stats = defaultdict(int)
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='load')
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, client, table_id, df, schema, priority=INTERACTIVE, append=False, write=None):
+        """
+        Queue a load of df into table_id. Returns a Future resolving to the number of rows
+        loaded (of the merged job that carried this request).
+        write(client, table_id, df, schema) performs the load; by default a replace goes
+        through the staging-table swap and an append is a WRITE_APPEND load.
+        """
+        write = write or (append_table if append else replace_table)
+        request = LoadRequest(client, table_id, df, schema, priority, write, append)
+        future = Future()
+        request.futures.append(future)
+        with self._cond:
+            self.stats['submitted'] += 1
+            queued = self.pending.get(table_id)
+            if queued is None:
+                self.pending[table_id] = request
+            else:
+                queued.merge(request)
+                self.stats['merged'] += 1
+            self._cond.notify_all()
+        return future
+
+    def load(self, client, table_id, df, schema, priority=INTERACTIVE, append=False, write=None):
+        # Blocking form of submit
+        return self.submit(client, table_id, df, schema, priority, append, write).result()
+
+    @staticmethod
+    def _scope_key(scope, table_id):
+        return table_id if scope == 'table' else '*'
+
+    def _budget_wait(self, table_id, now):
+        """Seconds until every budget has room for one more job on table_id (0 = now)."""
+        wait = 0.0
+        for i, (scope, jobs, window) in enumerate(self.budgets):
+            starts = self.started[(i, self._scope_key(scope, table_id))]
+            while starts and starts[0] <= now - window:
+                starts.popleft()
+            if len(starts) >= jobs:
+                wait = max(wait, starts[0] + window - now)
+        return wait
+
+    def _next_request(self, now):
+        # Highest priority first, then the longest waiting; None plus the time to wait
+        if len(self.running) >= self.max_concurrent:
+            return None, None
+        best, wake = None, None
+        for table_id, request in self.pending.items():
+            if table_id in self.running:
+                continue
+            wait = max(request.not_before - now, self._budget_wait(table_id, now))
+            if wait > 0:
+                wake = wait if wake is None else min(wake, wait)
+                continue
+            if best is None or (request.priority, request.submitted) < (best.priority, best.submitted):
+                best = request
+        return best, wake
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                request, wake = self._next_request(now)
+                if request is None:
+                    self._cond.wait(timeout=wake)
+                    continue
+                del self.pending[request.table_id]
+                self.running.add(request.table_id)
+                for i, (scope, _, _) in enumerate(self.budgets):
+                    self.started[(i, self._scope_key(scope, request.table_id))].append(now)
+            self._executor.submit(self._run, request)
+
+    def _run(self, request):
+        try:
+            rows = request.write(request.client, request.table_id, request.frame(), request.schema)
+        except Exception as e:
+            request.attempt += 1
+            with self._cond:
+                if is_transient(e) and request.attempt < self.max_attempts:
+                    delay = backoff_delay(request.attempt)
+                    self.stats['retried'] += 1
+                    print(f"  -> Transient error loading {request.table_id} "
+                          f"(attempt {request.attempt}), retrying in {delay:.1f}s: {e}")
+                    request.not_before = time.monotonic() + delay
+                    # Requests that arrived meanwhile still apply on top of this one
+                    later = self.pending.get(request.table_id)
+                    if later is not None:
+                        request.merge(later)
+                    self.pending[request.table_id] = request
+                    self.running.discard(request.table_id)
+                    self._cond.notify_all()
+                    return
+                self.stats['failed'] += 1
+                self.running.discard(request.table_id)
+                self._cond.notify_all()
+            for future in request.futures:
+                future.set_exception(e)
+            return
+
+        with self._cond:
+            self.stats['jobs'] += 1
+            self.running.discard(request.table_id)
+            self._cond.notify_all()
+        for future in request.futures:
+            future.set_result(rows)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide scheduler, starting it on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LoadScheduler()
+        return _scheduler
+
+
+def scheduled_load(client, table_id, df, schema, priority=INTERACTIVE, append=False, write=None):
+    """Load df into table_id through the process-wide scheduler and wait for it; returns rows loaded."""
+    return get_scheduler().load(client, table_id, df, schema, priority, append, write)
+
@@ -0,0 +1,124 @@
+import glob
+import os
+import shutil
+import uuid
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+# Configuration
+# Determine the project root (parent of the 'src' directory where this script lives)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+# Local Parquet copy of every table the uploaders load, one folder per table:
+# mirror/<table>/<year col>=YYYY/<month col>=M/part-*.parquet
+# mirror/<table> is a symlink to the current version folder mirror/<table>.v-<run id>;
+# a replace writes a new version and switches the link in one rename.
+MIRROR_DIR = os.path.join(PROJECT_ROOT, 'mirror')
+MIRROR_ENABLED = True
+# Versions kept per table: the current one plus the one before it, so a reader that
+# resolved the link just before a swap can finish reading
+MIRROR_KEEP_VERSIONS = 2
+# BIGNUMERIC values arrive as arbitrary-scale Decimals, which Arrow stores as decimal256.
+# Most query engines (DuckDB included) only read decimals up to 38 digits, so the
+# mirror keeps them as decimal128(38, MIRROR_DECIMAL_SCALE), rounded half-to-even.
+MIRROR_DECIMAL_SCALE = 12
+
+
+def table_dir(table_name):
+    return os.path.join(MIRROR_DIR, table_name)
+
+
+def _switch_version(table_name, version):
+    # Point mirror/<table> at the version folder; os.replace of a symlink is atomic
+    target = table_dir(table_name)
+    if os.path.isdir(target) and not os.path.islink(target):
+        # A table mirrored before versioning: make its folder the first version
+        os.rename(target, os.path.join(MIRROR_DIR, f"{table_name}.v-0"))
+    link = f"{target}.link-{uuid.uuid4().hex}"
+    os.symlink(version, link)
+    os.replace(link, target)
+
+
+def _prune_versions(table_name):
+    current = os.path.realpath(table_dir(table_name))
+    versions = sorted(glob.glob(os.path.join(MIRROR_DIR, f"{table_name}.v-*")), key=os.path.getmtime)
+    for path in versions[:-MIRROR_KEEP_VERSIONS]:
+        if os.path.realpath(path) != current:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _partitioned(df, partition_cols, date_column):
+    # Tables without year/month columns are partitioned on the year/month of a date column
+    if date_column is not None:
+        dates = df[date_column]
+        df = df.assign(year=dates.dt.year.astype('Int64'), month=dates.dt.month.astype('Int64'))
+        partition_cols = ['year', 'month']
+    return df, partition_cols or []
+
+
+def _narrow_decimals(table):
+    for i, field in enumerate(table.schema):
+        if pa.types.is_decimal256(field.type) or (pa.types.is_decimal(field.type) and field.type.scale > MIRROR_DECIMAL_SCALE):
+            column = pc.round(table.column(i), ndigits=MIRROR_DECIMAL_SCALE, round_mode='half_to_even')
+            column = column.cast(pa.decimal128(38, MIRROR_DECIMAL_SCALE))
+            table = table.set_column(i, field.name, column)
+    return table
+
+
+def write_mirror(table_name, df, partition_cols=None, date_column=None, append=False):
+    """
+    Write df to the local mirror of table_name.
+    - partition_cols: existing year/month columns (e.g. ['TAHUN', 'BULAN']), or
+    - date_column: a datetime column to derive 'year'/'month' partitions from.
+    append=False mirrors WRITE_TRUNCATE: the new data is written to a new version folder
+    and the table's link is switched to it in one rename, so readers going through the
+    link see either the old or the new table, never a missing or half-written one.
+    append=True mirrors WRITE_APPEND and adds new files to the current version (a reader
+    may see some of the new files before others).
+    """
+    if not MIRROR_ENABLED:
+        return
+
+    df, partition_cols = _partitioned(df, partition_cols, date_column)
+    table = _narrow_decimals(pa.Table.from_pandas(df, preserve_index=False))
+    partitioning = None
+    if partition_cols:
+        partitioning = ds.partitioning(
+            pa.schema([table.schema.field(col) for col in partition_cols]), flavor='hive'
+        )
+
+    target = table_dir(table_name)
+    run_id = uuid.uuid4().hex
+    write_options = dict(
+        format='parquet',
+        partitioning=partitioning,
+        basename_template=f'part-{run_id}-{{i}}.parquet',
+    )
+
+    if append and os.path.isdir(target):
+        ds.write_dataset(table, os.path.realpath(target), existing_data_behavior='overwrite_or_ignore',
+                         **write_options)
+        print(f"  -> Mirrored {table.num_rows} rows (append) to {target}")
+        return
+
+    version = f"{table_name}.v-{run_id}"
+    ds.write_dataset(table, os.path.join(MIRROR_DIR, version), **write_options)
+    _switch_version(table_name, version)
+    _prune_versions(table_name)
+    print(f"  -> Mirrored {table.num_rows} rows to {target}")
+
+
+def mirror_after_load(table_id, df, **kwargs):
+    """
+    Mirror a table right after its BigQuery load succeeded.
+    table_id is the full 'project.dataset.table' id; the mirror uses the table name.
+    A mirror failure is reported but does not fail the upload.
+    """
+    table_name = table_id.split('.')[-1]
+    try:
+        write_mirror(table_name, df, **kwargs)
+    except Exception as e:
+        print(f"  -> Warning: could not update local mirror of {table_name}: {e}")
@@ -0,0 +1,86 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+
+def fingerprint_rows(df, key_columns):
+    """
+    Hash each row of df on key_columns into a single uint64 fingerprint.
+    - Numeric columns are hashed as float64 so an int 5 in one file matches 5.0 in another.
+    - Datetimes are hashed on their epoch value, everything else on its string form.
+    - Missing key columns are treated as all-null.
+    The result is 8 bytes per row, so the index stays small even at tens of millions of rows.
+    """
+    normalized = {}
+    for col in key_columns:
+        if col not in df.columns:
+            normalized[col] = pd.Series(np.nan, index=df.index, dtype='float64')
+            continue
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            # NaT maps to the int64 minimum, which is stable across files
+            normalized[col] = series.astype('datetime64[ns]').astype('int64')
+        elif pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+            normalized[col] = series.astype('float64')
+        else:
+            normalized[col] = series.astype(object).where(series.notna(), None).astype(str)
+
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(normalized), index=False)
+    return hashes.to_numpy(dtype=np.uint64)
+
+
+class DuplicateIndex:
+    """
+    Fingerprint index over several source files.
+    Keeps only one sorted uint64 array of distinct fingerprints per file plus
+    the per-row fingerprints needed to build the keep/drop mask.
+    """
+
+    def __init__(self):
+        self.files = []
+        self.row_hashes = []
+        self.distinct_hashes = []
+
+    def add(self, file_name, hashes):
+        self.files.append(file_name)
+        self.row_hashes.append(hashes)
+        self.distinct_hashes.append(np.unique(hashes))
+
+    def within_file_duplicates(self):
+        # Rows that repeat an earlier row of the same file
+        return {
+            name: len(rows) - len(distinct)
+            for name, rows, distinct in zip(self.files, self.row_hashes, self.distinct_hashes)
+        }
+
+    def pairwise_overlap(self):
+        # Distinct fingerprints shared by each pair of files (both arrays are sorted & unique)
+        overlap = {}
+        for i, j in itertools.combinations(range(len(self.files)), 2):
+            shared = np.intersect1d(self.distinct_hashes[i], self.distinct_hashes[j], assume_unique=True)
+            if len(shared):
+                overlap[(self.files[i], self.files[j])] = len(shared)
+        return overlap
+
+    def keep_mask(self):
+        """
+        Boolean mask over the concatenation of all added files (in add order)
+        that keeps the first occurrence of every fingerprint.
+        """
+        if not self.row_hashes:
+            return np.zeros(0, dtype=bool)
+        all_hashes = np.concatenate(self.row_hashes)
+        return ~pd.Series(all_hashes).duplicated(keep='first').to_numpy()
+
+    def report(self):
+        total_rows = sum(len(rows) for rows in self.row_hashes)
+        distinct = len(np.unique(np.concatenate(self.distinct_hashes))) if self.distinct_hashes else 0
+        print(f"Duplicate check: {total_rows} rows, {distinct} distinct, {total_rows - distinct} duplicates")
+
+        for name, count in self.within_file_duplicates().items():
+            if count:
+                print(f"  Warning: {name} contains {count} duplicate rows")
+
+        for (left, right), count in self.pairwise_overlap().items():
+            print(f"  Warning: {left} and {right} share {count} identical rows")
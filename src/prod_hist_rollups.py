@@ -0,0 +1,70 @@
+import decimal
+
+from google.cloud import bigquery
+
+# BIGNUMERIC holds up to 76 digits; make Decimal addition at least that precise
+# so rollup sums match SUM() over the detail table exactly.
+BIGNUMERIC_PRECISION = 77
+
+
+def build_rollup(df, group_cols, sum_cols):
+    """
+    Aggregate the typed detail frame by group_cols.
+    - sum_cols are summed (Decimal columns stay exact Decimals, NULLs are skipped).
+    - ROW_COUNT holds the number of detail rows per group.
+    Null group keys are kept as their own group, like GROUP BY does.
+    """
+    grouped = df.groupby(group_cols, dropna=False, sort=True)
+
+    with decimal.localcontext() as ctx:
+        ctx.prec = BIGNUMERIC_PRECISION
+        sums = grouped[sum_cols].sum(min_count=1)
+
+    rollup = sums.reset_index()
+    rollup['ROW_COUNT'] = grouped.size().to_numpy()
+    return rollup
+
+
+def rollup_schema(detail_schema, group_cols, sum_cols):
+    # Group and measure columns keep their detail types; ROW_COUNT is added at the end
+    field_types = {field.name: field.field_type for field in detail_schema}
+    schema = [bigquery.SchemaField(col, field_types[col]) for col in group_cols + sum_cols]
+    schema.append(bigquery.SchemaField("ROW_COUNT", "INTEGER"))
+    return schema
+
+
+def build_rollups(df, detail_schema, grouping_sets, sum_cols):
+    """
+    Build one rollup per grouping set.
+    grouping_sets maps the target table name to its list of group columns.
+    Returns {table_name: (rollup_df, schema)}.
+    """
+    rollups = {}
+    for table_name, group_cols in grouping_sets.items():
+        rollup = build_rollup(df, group_cols, sum_cols)
+        # All-null sums and null group keys come back as NaN (an INTEGER group column such as
+        # TAHUN turns float64); give them the loader-friendly null of their type
+        for field in detail_schema:
+            if field.name not in sum_cols and field.name not in group_cols:
+                continue
+            if field.field_type == 'INTEGER':
+                rollup[field.name] = rollup[field.name].astype('Int64')
+            elif field.field_type == 'BIGNUMERIC':
+                rollup[field.name] = rollup[field.name].astype(object).where(rollup[field.name].notna(), None)
+        rollups[table_name] = (rollup, rollup_schema(detail_schema, group_cols, sum_cols))
+    return rollups
+
+
+def rollup_query(detail_table_id, table_id, group_cols, sum_cols):
+    """
+    CREATE OR REPLACE TABLE statement computing the rollup of build_rollup from the
+    detail table in BigQuery (SUM over BIGNUMERIC is exact; all-NULL sums stay NULL).
+    """
+    groups = ", ".join(f"`{col}`" for col in group_cols)
+    sums = "".join(f",\n  SUM(`{col}`) AS `{col}`" for col in sum_cols)
+    return (
+        f"CREATE OR REPLACE TABLE `{table_id}` AS\n"
+        f"SELECT {groups}{sums},\n  COUNT(*) AS ROW_COUNT\n"
+        f"FROM `{detail_table_id}`\n"
+        f"GROUP BY {groups}"
+    )
@@ -0,0 +1,110 @@
+import decimal
+from datetime import datetime
+
+import pandas as pd
+from google.cloud import bigquery
+
+from column_builder import build_frame
+
+# Detail table of the prod_hist uploader: schema, source header mapping and the one-pass
+# build of the load frame from the parsed yearly exports.
+
+# Detail table schema
+SCHEMA = [
+    # User provided schema
+    bigquery.SchemaField("TANGGAL", "STRING"), # Note: Schema says STRING, file has datetime. Will convert.
+    bigquery.SchemaField("BULAN", "INTEGER"),
+    bigquery.SchemaField("TAHUN", "INTEGER"),
+    bigquery.SchemaField("BRANCH", "STRING"),
+    bigquery.SchemaField("MO", "STRING"),
+    bigquery.SchemaField("SARATOGA", "STRING"),
+    bigquery.SchemaField("CGROUP", "STRING"),
+    bigquery.SchemaField("SCGROUP", "STRING"),
+    bigquery.SchemaField("SOURCE", "STRING"),
+    bigquery.SchemaField("COB", "STRING"),
+    bigquery.SchemaField("TOC", "STRING"),
+    bigquery.SchemaField("LOB", "STRING"),
+    bigquery.SchemaField("bankersclause", "STRING"),
+    bigquery.SchemaField("NEW_", "INTEGER"),
+    bigquery.SchemaField("NEW_PREMI", "BIGNUMERIC"),
+    bigquery.SchemaField("RENEWAL", "INTEGER"),
+    bigquery.SchemaField("RENEWAL_PREMI", "BIGNUMERIC"),
+    bigquery.SchemaField("COMM", "BIGNUMERIC"),
+    bigquery.SchemaField("COMMSUBS", "BIGNUMERIC"),
+    bigquery.SchemaField("DISC", "BIGNUMERIC"),
+    bigquery.SchemaField("ENGFEE", "BIGNUMERIC"),
+    bigquery.SchemaField("FACPREM", "BIGNUMERIC"),
+    bigquery.SchemaField("RIPREM", "BIGNUMERIC"),
+    bigquery.SchemaField("FACRICOM", "BIGNUMERIC"),
+    bigquery.SchemaField("SOURCE_PROFILEID", "STRING"),
+
+    # Audit columns
+    bigquery.SchemaField("create_by", "STRING"),
+    bigquery.SchemaField("modified_by", "STRING"),
+    bigquery.SchemaField("create_date", "DATETIME"),
+    bigquery.SchemaField("modified_date", "DATETIME"),
+
+    # Added for file tracking
+    bigquery.SchemaField("SourceFilename", "STRING"),
+]
+
+# Column Mapping (Lower/Mixed case in File -> Upper/Specific case in Schema)
+COLUMN_MAPPING = {
+    'tanggal': 'TANGGAL',
+    'Bulan': 'BULAN',
+    'Tahun': 'TAHUN',
+    'branch': 'BRANCH',
+    'MO': 'MO',
+    'SARATOGA': 'SARATOGA',
+    'CGroup': 'CGROUP',
+    'SCGroup': 'SCGROUP',
+    'source': 'SOURCE',
+    'cob': 'COB',
+    'toc': 'TOC',
+    'LOB': 'LOB',
+    'BankersClause': 'bankersclause',
+    'New': 'NEW_',
+    'New Premi': 'NEW_PREMI',
+    'Renewal': 'RENEWAL',
+    'Renewal Premi': 'RENEWAL_PREMI',
+    'Comm': 'COMM',
+    'CommSUBS': 'COMMSUBS',
+    'Disc': 'DISC',
+    'EngFee': 'ENGFEE',
+    'FacPrem': 'FACPREM',
+    'RIPrem': 'RIPREM',
+    'FacRICom': 'FACRICOM',
+    'SourceBusiness': 'SOURCE_PROFILEID'
+}
+
+
+def to_bignumeric(series):
+    # decimal.Decimal for precision and Arrow compatibility
+    return series.apply(lambda x: decimal.Decimal(str(x)) if pd.notnull(x) and str(x).lower() != 'nan' else None)
+
+
+def tanggal_text(series):
+    # TANGGAL: Schema says STRING, file is datetime. Convert to YYYY-MM-DD string.
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.dt.strftime('%Y-%m-%d')
+    return series
+
+
+def build_detail(parts, file_names, keep=None, now=None, consume=False):
+    """
+    The detail load frame from parsed exports (source headers), one per file name, in
+    row order: mapped, typed and in schema order, with the audit and SourceFilename columns.
+    keep drops rows (over all parts); consume releases each parsed column once it is used
+    (see build_frame).
+    """
+    now = now or datetime.now()
+    convert = {field.name: to_bignumeric for field in SCHEMA if field.field_type == 'BIGNUMERIC'}
+    convert['TANGGAL'] = tanggal_text
+    fill = {
+        'create_by': 'ETL_Script',
+        'modified_by': 'ETL_Script',
+        'create_date': now,
+        'modified_date': now,
+        'SourceFilename': list(file_names),
+    }
+    return build_frame(parts, SCHEMA, COLUMN_MAPPING, fill=fill, convert=convert, keep=keep, consume=consume)
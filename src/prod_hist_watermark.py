@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+from source_readers import detect_format, read_source
+
+# Row watermarks for the year-to-date prod_hist exports, which only ever grow at the end.
+# Per source file the last load recorded how many rows it took, a hash over those rows
+# and the (TAHUN, BULAN) of the last one. A later run re-hashes the same number of rows:
+# if they are unchanged, only the rows after them are new and can be appended.
+# A file whose bytes did not change at all (a closed year) is not parsed.
+
+# Configuration
+# Determine the project root (parent of the 'src' directory where this script lives)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+WATERMARK_PATH = os.path.join(PROJECT_ROOT, 'watermarks', 'prod_hist.json')
+
+
+class Watermarks:
+    """{file name: {'format', 'file_hash', 'rows', 'prefix_hash', 'period'}} of the last successful load."""
+
+    def __init__(self, path=None):
+        self.path = path or WATERMARK_PATH
+        self.marks = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.marks = json.load(f)
+
+    def get(self, file_name):
+        return self.marks.get(file_name)
+
+    def save(self, marks):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(marks, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.marks = marks
+
+    def clear(self):
+        # The table was loaded some other way; the next tail run must start from a full load
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.marks = {}
+
+
+class TailRead:
+    """
+    Result of reading a source against its watermark.
+    status: 'unchanged' (no new rows), 'tail' (prefix verified, frame holds only the new
+    rows; None when the file was not parsed) or 'reload' (prefix changed, frame holds every
+    row). mark describes the whole file.
+    """
+
+    def __init__(self, status, frame, mark, reason=None):
+        self.status = status
+        self.frame = frame
+        self.mark = mark
+        self.reason = reason
+
+
+def _excel_value(value):
+    # The same cell conversion pd.read_excel applies (openpyxl engine)
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _xlsx_rows(path):
+    """
+    Header and raw data rows (value tuples) of the first sheet, from one streaming pass.
+    Blank rows at the end are dropped, as pd.read_excel does.
+    """
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions()
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, ())
+        data, blank_run = [], []
+        for row in rows:
+            if all(value is None for value in row):
+                blank_run.append(row)
+                continue
+            data.extend(blank_run)
+            blank_run = []
+            data.append(row)
+        return header, data
+    finally:
+        workbook.close()
+
+
+def _xlsx_frame(header, rows):
+    # Same cell conversion and parser (so the same column types) as pd.read_excel
+    width = len(header)
+    data = [[_excel_value(value) for value in header]]
+    for row in rows:
+        converted = [_excel_value(value) for value in row[:width]]
+        data.append(converted + [""] * (width - len(converted)))
+    return TextParser(data, header=0, skip_blank_lines=False).read()
+
+
+def _xlsx_hashes(header, rows):
+    # Running hash over the raw cell values; pickling a tuple is far cheaper than repr()
+    digest = hashlib.sha256(pickle.dumps(header, protocol=4))
+    for row in rows:
+        digest.update(pickle.dumps(row, protocol=4))
+        yield digest
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _frame_hash(df):
+    digest = hashlib.sha256(repr(list(df.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy(dtype=np.uint64).tobytes())
+    return digest.hexdigest()
+
+
+def _period(df, period_columns):
+    if df.empty or not all(col in df.columns for col in period_columns):
+        return None
+    return [int(df[col].iloc[-1]) if pd.notna(df[col].iloc[-1]) else None for col in period_columns]
+
+
+def read_tail(path, mark, period_columns, column_types=None):
+    """
+    Read path against its watermark (None: every row is new).
+    period_columns are the source's (year, month) headers; rows before the watermark's
+    period cannot be a tail (the export was re-sorted) and force a reload.
+    Workbooks are streamed once with openpyxl, and only the new rows become a DataFrame.
+    Other formats parse quickly and are read whole.
+    """
+    content_hash = file_hash(path)
+    if mark is not None and mark.get('file_hash') == content_hash:
+        return TailRead('unchanged', None, mark)
+
+    fmt = detect_format(path)
+    if mark is not None and mark['format'] != fmt:
+        mark, reason = None, f"format changed from {mark['format']} to {fmt}"
+    else:
+        reason = None
+    loaded = mark['rows'] if mark else 0
+
+    if fmt == 'xlsx':
+        header, rows = _xlsx_rows(path)
+        prefix_hash = full_hash = hashlib.sha256(pickle.dumps(header, protocol=4)).hexdigest()
+        for i, digest in enumerate(_xlsx_hashes(header, rows), start=1):
+            if i == loaded:
+                prefix_hash = digest.hexdigest()
+            full_hash = digest.hexdigest()
+        total = len(rows)
+        frame_of = lambda start: _xlsx_frame(header, rows[start:])
+    else:
+        df = read_source(path, column_types=column_types)
+        total = len(df)
+        prefix_hash = _frame_hash(df.iloc[:loaded])
+        full_hash = _frame_hash(df)
+        frame_of = lambda start: df.iloc[start:].reset_index(drop=True)
+
+    if mark is not None and total < loaded:
+        reason = f"{total} rows, {loaded} were loaded"
+    elif mark is not None and prefix_hash != mark['prefix_hash']:
+        reason = f"first {loaded} rows changed"
+
+    if reason is None:
+        tail = frame_of(loaded)
+        first = _period(tail.iloc[:1], period_columns)
+        if mark is not None and first is not None and mark['period'] is not None and None not in first \
+                and first < mark['period']:
+            reason = f"new rows start at {first}, before the loaded {mark['period']}"
+
+    if reason is not None:
+        frame = frame_of(0)
+        new_mark = {'format': fmt, 'file_hash': content_hash, 'rows': total, 'prefix_hash': full_hash,
+                    'period': _period(frame, period_columns)}
+        return TailRead('reload', frame, new_mark, reason)
+
+    new_mark = {'format': fmt, 'file_hash': content_hash, 'rows': total, 'prefix_hash': full_hash,
+                'period': _period(tail, period_columns) or (mark['period'] if mark else None)}
+    return TailRead('tail' if len(tail) else 'unchanged', tail, new_mark)
@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+
+from local_mirror import MIRROR_DIR
+
+# Query the local Parquet mirror with DuckDB, e.g.
+#   python src/query_mirror.py "SELECT BRANCH, SUM(NEW_PREMI) FROM Report_Prod_Hist_All WHERE TAHUN = 2024 GROUP BY 1"
+# Every mirrored table is exposed as a view with its BigQuery table name. Filters on the
+# partition columns (TAHUN/BULAN, or year/month) prune whole folders before any file is read.
+
+
+def connect():
+    import duckdb  # Optional dependency, only needed to query the mirror
+
+    con = duckdb.connect()
+    if not os.path.isdir(MIRROR_DIR):
+        return con
+    for name in sorted(os.listdir(MIRROR_DIR)):
+        path = os.path.join(MIRROR_DIR, name)
+        # Tables are the links; version folders and links being switched are skipped
+        if not os.path.isdir(path) or '.' in name:
+            continue
+        # Resolved once, so every query of this connection reads the same version
+        files = os.path.join(os.path.realpath(path), '**', '*.parquet').replace("'", "''")
+        con.execute(
+            f'CREATE VIEW "{name}" AS SELECT * FROM '
+            f"read_parquet('{files}', hive_partitioning = true, union_by_name = true)"
+        )
+    return con
+
+
+def query(sql):
+    return connect().execute(sql).df()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"Usage: python {os.path.basename(__file__)} \"<SQL>\"")
+        sys.exit(1)
+
+    try:
+        start = time.perf_counter()
+        result = query(sys.argv[1])
+        print(result.to_string(index=False))
+        print(f"\n{len(result)} rows in {(time.perf_counter() - start) * 1000:.0f} ms")
+    except Exception as e:
+        print(f"An error occurred: {e}")
@@ -0,0 +1,250 @@
+import importlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from arrow_ipc_handoff import to_arrow_table
+from source_readers import detect_format
+from watch_data_folder import REPORTS, scan
+from work_queue import LEASE_SECONDS, WorkQueue, worker_id
+
+# Sharded loads across several machines:
+# - coordinator: enumerates the source files and queues one task per file
+# - worker (any number, on any host that sees QUEUE_DIR): leases a task, parses the
+#   workbook and stages the parsed sheets as Parquet under STAGING_DIR. CSV and Parquet
+#   exports are cheap to read and are left to the commit step's typed readers.
+# - commit: once every task of the job is done, feeds the staged frames to the normal
+#   uploaders, which convert them and replace each table with one WRITE_TRUNCATE load
+#
+# Usage: python src/sharded_upload.py coordinator [report ...]
+#        python src/sharded_upload.py worker [processes]
+#        python src/sharded_upload.py commit [job]
+#        python src/sharded_upload.py status [job]
+
+# Configuration
+# Determine the project root (parent of the 'src' directory where this script lives)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+# Must be a directory every participating host can reach (e.g. a network share)
+QUEUE_DIR = os.environ.get('UPLOAD_QUEUE_DIR', os.path.join(PROJECT_ROOT, 'queue'))
+QUEUE_DB = os.path.join(QUEUE_DIR, 'work_queue.sqlite')
+STAGING_DIR = os.path.join(QUEUE_DIR, 'staging')
+
+# Sheets a worker parses per report: None = every sheet, an index = that sheet only
+PARSE_SHEETS = {'prod_hist': 0}
+# How long an idle worker waits for leased tasks that might come back to the queue
+POLL_SECONDS = 5
+
+
+def open_queue():
+    return WorkQueue(QUEUE_DB)
+
+
+def coordinate(reports=None, job=None):
+    """Queue one task per source file: every file of folder reports, the newest export of the others."""
+    job = job or datetime.now().strftime('%Y%m%d%H%M%S')
+    tasks = []
+    for report in reports or REPORTS:
+        found = scan(report)
+        if not found:
+            print(f"[coordinator] No files for {report}")
+            continue
+        if REPORTS[report].get('folder'):
+            paths = sorted(found)
+        else:
+            paths = [max(found, key=lambda path: found[path][2])]
+        tasks.extend((report, path) for path in paths)
+
+    open_queue().enqueue(job, tasks)
+    print(f"[coordinator] Job {job}: queued {len(tasks)} tasks in {QUEUE_DB}")
+    return job
+
+
+def stage(report, source, staged_dir):
+    """
+    Parse one workbook and write each sheet as Parquet plus a manifest of sheet names.
+    Returns the number of rows staged, or None for exports that are not staged (not xlsx).
+    """
+    if detect_format(source) != 'xlsx':
+        return None
+    sheets = pd.read_excel(source, sheet_name=PARSE_SHEETS.get(report))
+    if isinstance(sheets, pd.DataFrame):
+        sheets = {PARSE_SHEETS[report]: sheets}
+
+    tmp_dir = staged_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    manifest = []
+    for i, (sheet_name, df) in enumerate(sheets.items()):
+        filename = f"{i}.parquet"
+        pq.write_table(to_arrow_table(df), os.path.join(tmp_dir, filename))
+        manifest.append([sheet_name, filename])
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    # Readers only ever see a complete staging directory
+    shutil.rmtree(staged_dir, ignore_errors=True)
+    os.replace(tmp_dir, staged_dir)
+    return sum(len(df) for df in sheets.values())
+
+
+def read_staged(staged_dir):
+    with open(os.path.join(staged_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    return {sheet_name: pq.read_table(os.path.join(staged_dir, filename)).to_pandas()
+            for sheet_name, filename in manifest}
+
+
+def _keep_lease(queue, task_id, owner, done):
+    # Renew well before expiry while the task is being parsed
+    while not done.wait(LEASE_SECONDS / 3):
+        if not queue.renew(task_id, owner):
+            return
+
+
+def work(queue=None):
+    """Process tasks until the queue has nothing left that could still need a worker."""
+    queue = queue or open_queue()
+    owner = worker_id()
+    processed = 0
+    while True:
+        claimed = queue.claim(owner)
+        if claimed is None:
+            if not queue.outstanding():
+                break
+            # Other workers hold leases; their tasks come back if they die
+            time.sleep(POLL_SECONDS)
+            continue
+
+        task_id, job, report, source, attempt = claimed
+        print(f"[worker {owner}] Task {task_id} ({report}, attempt {attempt}): {os.path.basename(source)}")
+        staged_dir = os.path.join(STAGING_DIR, job, f"{task_id}-{attempt}")
+        done = threading.Event()
+        heartbeat = threading.Thread(target=_keep_lease, args=(queue, task_id, owner, done), daemon=True)
+        heartbeat.start()
+        start = time.perf_counter()
+        try:
+            rows = stage(report, source, staged_dir)
+        except Exception as e:
+            print(f"[worker {owner}] Task {task_id} failed: {e}")
+            queue.fail(task_id, owner, e)
+            continue
+        finally:
+            done.set()
+            heartbeat.join()
+
+        if queue.complete(task_id, owner, staged_dir if rows is not None else None):
+            processed += 1
+            if rows is None:
+                print(f"[worker {owner}] Task {task_id} left to the commit step (not a workbook)")
+            else:
+                print(f"[worker {owner}] Task {task_id} staged {rows} rows in {time.perf_counter() - start:.1f}s")
+        else:
+            # Lease was lost and the task handed to someone else; drop this copy
+            print(f"[worker {owner}] Task {task_id} lease lost, discarding staged output")
+            shutil.rmtree(staged_dir, ignore_errors=True)
+    print(f"[worker {owner}] No more tasks, processed {processed}")
+    return processed
+
+
+def _work_process():
+    work()
+
+
+def run_workers(processes):
+    # Several workers on this host, e.g. to try the queue without more machines
+    if processes <= 1:
+        return work()
+    workers = [multiprocessing.Process(target=_work_process) for _ in range(processes)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+
+
+def status(job=None):
+    queue = open_queue()
+    job = job or queue.latest_job()
+    if job is None:
+        print("No jobs queued.")
+        return
+    print(f"Job {job} ({queue.job_status(job)})")
+    for task_id, report, source, task_status, attempts, _, error in queue.tasks(job):
+        line = f"  {task_id:>4} {report:<10} {task_status:<8} attempts={attempts} {os.path.basename(source)}"
+        print(line + (f"  error: {error}" if error and task_status != 'done' else ""))
+
+
+def commit(job=None):
+    """
+    Load a finished job: every task must be done, otherwise nothing is loaded.
+    Each report's staged frames go through its uploader, which replaces the table in one load.
+    The job is marked committed and its staging removed only when every load succeeded;
+    otherwise it stays open and commit can be run again.
+    """
+    queue = open_queue()
+    job = job or queue.latest_job()
+    tasks = queue.tasks(job) if job else []
+    if not tasks:
+        print("Nothing to commit.")
+        return False
+    if queue.job_status(job) == 'committed':
+        print(f"Job {job} is already committed.")
+        return False
+    unfinished = [task for task in tasks if task[3] != 'done']
+    if unfinished:
+        print(f"Job {job} is not complete ({len(unfinished)} of {len(tasks)} tasks unfinished), nothing loaded:")
+        status(job)
+        return False
+
+    by_report = defaultdict(list)
+    for _, report, source, _, _, staged, _ in tasks:
+        by_report[report].append((source, staged))
+
+    failed = []
+    for report, staged_files in by_report.items():
+        config = REPORTS[report]
+        print(f"[commit] Loading {report} from {len(staged_files)} staged files")
+        upload = getattr(importlib.import_module(config['module']), config['function'])
+        # Unstaged sources (not workbooks) are read by the uploader itself
+        if config.get('folder'):
+            frames = {source: next(iter(read_staged(staged).values())) if staged else None
+                      for source, staged in staged_files}
+            if not upload(config['dir'], frames=frames):
+                failed.append(report)
+        else:
+            for source, staged in staged_files:
+                if not upload(source, sheets=read_staged(staged) if staged else None):
+                    failed.append(f"{report} ({os.path.basename(source)})")
+
+    if failed:
+        print(f"[commit] Job {job} not committed, failed loads: {', '.join(failed)}; staged files kept for a retry")
+        return False
+    queue.mark_committed(job)
+    shutil.rmtree(os.path.join(STAGING_DIR, job), ignore_errors=True)
+    print(f"[commit] Job {job} committed")
+    return True
+
+
+if __name__ == "__main__":
+    role = sys.argv[1] if len(sys.argv) > 1 else None
+    args = sys.argv[2:]
+    if role == 'coordinator':
+        coordinate(args or None)
+    elif role == 'worker':
+        run_workers(int(args[0]) if args else 1)
+    elif role == 'commit':
+        commit(args[0] if args else None)
+    elif role == 'status':
+        status(args[0] if args else None)
+    else:
+        print(f"Usage: python {os.path.basename(__file__)} coordinator [report ...] | worker [processes] | commit [job] | status [job]")
+        sys.exit(1)
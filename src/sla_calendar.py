@@ -0,0 +1,107 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from datetime_parsing import parse_datetime_column
+
+# Configuration
+# Determine the project root (parent of the 'src' directory where this script lives)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+# Working calendar used for SLA minutes
+WORKDAY_START = '08:00'
+WORKDAY_END = '17:00'
+WEEKMASK = '1111100'  # Mon-Fri
+# One holiday per line (YYYY-MM-DD); lines starting with '#' are ignored. Optional.
+HOLIDAYS_FILE = os.path.join(PROJECT_ROOT, 'data', 'holidays.csv')
+
+# '1/1/2025 11:04:50 AM - 1/2/2025 2:50:39 PM; ...' as written in the logbook stage columns
+INTERVAL_PATTERN = (
+    r'(?P<start>\d{1,2}/\d{1,2}/\d{4} \d{1,2}:\d{2}:\d{2} [AP]M)\s*-\s*'
+    r'(?P<end>\d{1,2}/\d{1,2}/\d{4} \d{1,2}:\d{2}:\d{2} [AP]M)'
+)
+INTERVAL_FORMAT = '%m/%d/%Y %I:%M:%S %p'
+
+
+def load_holidays(path=HOLIDAYS_FILE):
+    if not os.path.exists(path):
+        return []
+    holidays = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                holidays.append(line.split(',')[0])
+    return holidays
+
+
+def _minute_of_day(hhmm):
+    hours, minutes = hhmm.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+class WorkingCalendar:
+    """
+    Working days (weekmask minus holidays) and a daily working window.
+    Elapsed working minutes are computed for whole arrays at once:
+    each timestamp is mapped to 'working minutes since an origin day'
+    (numpy busday_count for whole days plus the clipped time of day),
+    and an interval's duration is the difference of its two ends.
+    """
+
+    def __init__(self, start=WORKDAY_START, end=WORKDAY_END, weekmask=WEEKMASK, holidays=None):
+        self.start_minute = _minute_of_day(start)
+        self.end_minute = _minute_of_day(end)
+        self.day_minutes = self.end_minute - self.start_minute
+        if holidays is None:
+            holidays = load_holidays()
+        self.busdaycal = np.busdaycalendar(weekmask=weekmask, holidays=np.array(holidays, dtype='datetime64[D]'))
+
+    def _working_minute_index(self, timestamps, origin):
+        days = timestamps.astype('datetime64[D]')
+        minute_of_day = (timestamps - days).astype('timedelta64[s]').astype('float64') / 60
+        whole_days = np.busday_count(origin, days, busdaycal=self.busdaycal)
+        within_day = np.where(
+            np.is_busday(days, busdaycal=self.busdaycal),
+            np.clip(minute_of_day, self.start_minute, self.end_minute) - self.start_minute,
+            0.0,
+        )
+        return whole_days * self.day_minutes + within_day
+
+    def working_minutes(self, start, end):
+        """
+        Working minutes between start and end (Series or arrays of datetimes), as float64.
+        NaT on either side gives NaN; an end before its start gives 0.
+        """
+        start = pd.to_datetime(pd.Series(start)).to_numpy(dtype='datetime64[ns]')
+        end = pd.to_datetime(pd.Series(end)).to_numpy(dtype='datetime64[ns]')
+        valid = ~(np.isnat(start) | np.isnat(end))
+        result = np.full(len(start), np.nan)
+        if not valid.any():
+            return result
+
+        start, end = start[valid], end[valid]
+        origin = min(start.min(), end.min()).astype('datetime64[D]')
+        elapsed = self._working_minute_index(end, origin) - self._working_minute_index(start, origin)
+        result[valid] = np.maximum(elapsed, 0.0)
+        return result
+
+    def interval_list_minutes(self, series):
+        """
+        Total working minutes of every 'start - end;' interval listed in each cell.
+        Cells with no parsable interval give NaN.
+        """
+        text = series.astype(object).where(series.notna(), None)
+        intervals = text.dropna().astype(str).str.extractall(INTERVAL_PATTERN)
+        result = pd.Series(np.nan, index=series.index)
+        if intervals.empty:
+            return result
+
+        starts = parse_datetime_column(intervals['start'], dayfirst=False, fmt=INTERVAL_FORMAT)
+        ends = parse_datetime_column(intervals['end'], dayfirst=False, fmt=INTERVAL_FORMAT)
+        minutes = pd.Series(self.working_minutes(starts, ends), index=intervals.index)
+        totals = minutes.groupby(level=0).sum(min_count=1)
+        result.loc[totals.index] = totals.to_numpy()
+        return result
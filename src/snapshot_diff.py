@@ -0,0 +1,200 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from google.cloud import bigquery
+
+from load_scheduler import get_scheduler, truncate_table
+
+# Configuration
+# Determine the project root (parent of the 'src' directory where this script lives)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+# Previous snapshot of each report as hashes only: the key column plus one uint64 per
+# compared column, so the last export never has to be kept or re-parsed.
+SNAPSHOT_DIR = os.path.join(PROJECT_ROOT, 'snapshots')
+
+# Set on every run, so never a reason to call a row 'updated'
+AUDIT_COLUMNS = ['create_date', 'modified_date', 'create_by', 'modified_by']
+
+
+def snapshot_path(table_name):
+    return os.path.join(SNAPSHOT_DIR, f"{table_name}.parquet")
+
+
+def hash_columns(df, columns):
+    # One uint64 per row and column; equal values hash equally across runs
+    return pd.DataFrame(
+        {col: pd.util.hash_pandas_object(df[col], index=False).to_numpy() for col in columns},
+        index=df.index,
+    )
+
+
+class SnapshotDiff:
+    """
+    Row-level changes between the previous snapshot and the new export, joined on key.
+    - inserted / updated: boolean masks over the rows of the new frame
+    - deleted_keys: keys present before and missing now
+    - changed_columns: for each updated row, the list of columns whose value changed
+    has_baseline is False on the first run (or when keys are unusable); everything
+    then counts as inserted and a delta load is not possible.
+    keys_usable is False when the new export's keys have nulls or duplicates; such an
+    export is not saved as the next run's baseline (and the old baseline is dropped).
+    """
+
+    def __init__(self, table_name, key, new_keys, new_hashes):
+        self.table_name = table_name
+        self.key = key
+        self.new_keys = new_keys
+        self.new_hashes = new_hashes
+        self.has_baseline = False
+        self.keys_usable = True
+        self.inserted = np.ones(len(new_keys), dtype=bool)
+        self.updated = np.zeros(len(new_keys), dtype=bool)
+        self.deleted_keys = new_keys[:0]
+        self.changed_columns = pd.Series([], dtype=object)
+        self.column_change_counts = {}
+
+    def compare(self, old):
+        old_keys = old[self.key].to_numpy()
+        if not pd.Index(old_keys).is_unique:
+            # A baseline saved before duplicates were kept out: diff as if there were none
+            print(f"  Warning: previous snapshot of {self.table_name} has duplicate keys, ignoring it")
+            return
+        columns = [col for col in self.new_hashes.columns if col in old.columns]
+
+        # Hash join: position of each new key in the previous snapshot (-1 = new key)
+        positions = pd.Index(old_keys).get_indexer(self.new_keys)
+        matched = positions >= 0
+        self.inserted = ~matched
+        self.deleted_keys = old_keys[~pd.Index(old_keys).isin(self.new_keys)]
+
+        new_matrix = self.new_hashes[columns].to_numpy()[matched]
+        old_matrix = old[columns].to_numpy()[positions[matched]]
+        differs = new_matrix != old_matrix
+        # Columns added to the schema since the last run count as changed
+        added = [col for col in self.new_hashes.columns if col not in old.columns]
+        if added:
+            differs = np.hstack([differs, np.ones((len(differs), len(added)), dtype=bool)])
+            columns = columns + added
+
+        row_changed = differs.any(axis=1)
+        self.updated = np.zeros(len(self.new_keys), dtype=bool)
+        self.updated[np.flatnonzero(matched)[row_changed]] = True
+
+        changed = differs[row_changed]
+        names = np.array(columns, dtype=object)
+        self.changed_columns = pd.Series(
+            [list(names[flags]) for flags in changed],
+            index=np.flatnonzero(self.updated),
+            dtype=object,
+        )
+        self.column_change_counts = {
+            col: int(count) for col, count in zip(columns, changed.sum(axis=0)) if count
+        }
+        self.has_baseline = True
+
+    def delta(self, df):
+        # Rows to (re)load: inserted and updated
+        return df[self.inserted | self.updated]
+
+    def summary(self):
+        return {
+            'table': self.table_name,
+            'run_at': datetime.now().isoformat(timespec='seconds'),
+            'baseline': self.has_baseline,
+            'rows': int(len(self.new_keys)),
+            'inserted': int(self.inserted.sum()),
+            'updated': int(self.updated.sum()),
+            'deleted': int(len(self.deleted_keys)),
+            'changed_columns': self.column_change_counts,
+        }
+
+    def report(self):
+        summary = self.summary()
+        if not self.has_baseline:
+            print(f"  -> No previous snapshot of {self.table_name}, every row counts as new")
+            return
+        print(f"  -> Changes since last snapshot: {summary['inserted']} inserted, "
+              f"{summary['updated']} updated, {summary['deleted']} deleted")
+        for col, count in sorted(self.column_change_counts.items(), key=lambda item: -item[1]):
+            print(f"     {col}: {count} rows changed")
+
+
+def diff_snapshot(table_name, df, key, ignore=AUDIT_COLUMNS):
+    """Compare df with the stored snapshot of table_name (see SnapshotDiff)."""
+    columns = [col for col in df.columns if col != key and col not in ignore]
+    diff = SnapshotDiff(table_name, key, df[key].to_numpy(), hash_columns(df, columns))
+
+    if df[key].isna().any() or df[key].duplicated().any():
+        print(f"  Warning: {key} has nulls or duplicates, cannot diff {table_name} by key")
+        diff.keys_usable = False
+        return diff
+    path = snapshot_path(table_name)
+    if not os.path.exists(path):
+        return diff
+
+    diff.compare(pd.read_parquet(path))
+    return diff
+
+
+def save_snapshot(diff):
+    """Store the new export's hashes as the baseline for the next run (call after a successful load)."""
+    if not diff.keys_usable:
+        # The table now holds an export that cannot be a baseline, and the previous one no
+        # longer matches the table: drop it, so the next run does a full load
+        print(f"  -> Snapshot of {diff.table_name} not saved: {diff.key} has nulls or duplicates")
+        if os.path.exists(snapshot_path(diff.table_name)):
+            os.remove(snapshot_path(diff.table_name))
+        return
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    snapshot = diff.new_hashes.copy()
+    snapshot.insert(0, diff.key, diff.new_keys)
+    tmp_path = snapshot_path(diff.table_name) + '.tmp'
+    snapshot.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, snapshot_path(diff.table_name))
+
+    # Keep a log of every run's change summary next to the snapshot
+    with open(os.path.join(SNAPSHOT_DIR, f"{diff.table_name}.changes.jsonl"), 'a', encoding='utf-8') as f:
+        f.write(json.dumps(diff.summary()) + "\n")
+
+
+def apply_delta(client, table_id, df, diff, schema):
+    """
+    Apply only the changed rows to table_id:
+    load inserted+updated rows and the deleted keys into staging tables, then
+    delete replaced/removed keys and insert the new rows in one transaction.
+    Returns the number of rows written.
+    """
+    key = diff.key
+    delta = diff.delta(df)
+    if delta.empty and not len(diff.deleted_keys):
+        return 0
+    changed_keys = pd.DataFrame({key: np.concatenate([delta[key].to_numpy(), diff.deleted_keys])})
+    key_type = next(field.field_type for field in schema if field.name == key)
+
+    # Both staging loads are queued at once through the quota-aware scheduler
+    staging_rows = f"{table_id}__delta"
+    staging_keys = f"{table_id}__delta_keys"
+    scheduler = get_scheduler()
+    loads = [
+        scheduler.submit(client, staging_rows, delta, schema, write=truncate_table),
+        scheduler.submit(client, staging_keys, changed_keys, [bigquery.SchemaField(key, key_type)], write=truncate_table),
+    ]
+    for load in loads:
+        load.result()
+
+    columns = ", ".join(f"`{field.name}`" for field in schema)
+    client.query(f"""
+        BEGIN TRANSACTION;
+        DELETE FROM `{table_id}` WHERE `{key}` IN (SELECT `{key}` FROM `{staging_keys}`);
+        INSERT INTO `{table_id}` ({columns}) SELECT {columns} FROM `{staging_rows}`;
+        COMMIT TRANSACTION;
+    """).result()
+
+    for staging in (staging_rows, staging_keys):
+        client.delete_table(staging, not_found_ok=True)
+    return len(delta)
@@ -0,0 +1,171 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+# One reader for every export format the source system can produce.
+# CSV is parsed by pyarrow's multithreaded reader with the report's declared column
+# types, then shaped like pandas' Excel reader output (integral numbers as int64, ISO
+# date text as datetimes), so the uploaders' conversions give identical results.
+
+# Extension -> format (also what the uploaders glob for). Only '.csv.gz' is a compressed
+# CSV export; other '.gz' files are not picked up.
+SOURCE_EXTENSIONS = {
+    '.xlsx': 'xlsx',
+    '.xlsm': 'xlsx',
+    '.csv.gz': 'csv',
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+}
+# Leading bytes -> format, for files without a recognised extension
+MAGIC_BYTES = [(b'PK\x03\x04', 'xlsx'), (b'PAR1', 'parquet'), (b'\x1f\x8b', 'csv')]
+# When the same export exists in several formats, the first of these is read
+FORMAT_PREFERENCE = ['parquet', 'csv', 'xlsx']
+
+# Declared (BigQuery) type -> Arrow type used to parse the CSV column.
+# Numbers are read as float64 like the Excel reader does; dates are read as text, ISO
+# text becomes datetimes (like Excel date cells) and anything else is left to the
+# uploaders' own datetime parsing.
+CSV_COLUMN_TYPES = {
+    'FLOAT': pa.float64(),
+    'INTEGER': pa.float64(),
+    'NUMERIC': pa.float64(),
+    'BIGNUMERIC': pa.float64(),
+    'BOOLEAN': pa.bool_(),
+    'STRING': pa.string(),
+    'DATETIME': pa.string(),
+}
+# Same missing-value markers as pandas' readers
+NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+             '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+ISO_DATETIME_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$')
+
+
+def detect_format(path):
+    name = str(path).lower()
+    for extension, fmt in SOURCE_EXTENSIONS.items():
+        if name.endswith(extension):
+            return fmt
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    for magic, fmt in MAGIC_BYTES:
+        if head.startswith(magic):
+            return fmt
+    return 'csv'
+
+
+def source_stem(path):
+    # ProduksiJanDes2018.csv.gz -> ProduksiJanDes2018
+    name = str(path)
+    lower = name.lower()
+    for extension in SOURCE_EXTENSIONS:
+        if lower.endswith(extension):
+            return name[:-len(extension)]
+    return name
+
+
+def list_sources(paths):
+    """Keep one file per export name, preferring the fastest format to parse; sorted."""
+    chosen = {}
+    for path in paths:
+        stem = source_stem(path)
+        if stem not in chosen or (FORMAT_PREFERENCE.index(detect_format(path))
+                                  < FORMAT_PREFERENCE.index(detect_format(chosen[stem]))):
+            chosen[stem] = path
+    return sorted(chosen.values())
+
+
+def _like_excel(df):
+    # Shape a CSV frame the way pd.read_excel would have returned the same data
+    for col in df.columns:
+        values = df[col]
+        if values.dtype == np.float64:
+            finite = values.to_numpy()
+            if len(finite) and not np.isnan(finite).any() and (finite == np.round(finite)).all() \
+                    and np.abs(finite).max() < 2**63:
+                df[col] = finite.astype(np.int64)
+        elif values.dtype == object or pd.api.types.is_string_dtype(values):
+            first = values.dropna()
+            if first.empty or not isinstance(first.iloc[0], str) or not ISO_DATETIME_PATTERN.match(first.iloc[0]):
+                continue
+            parsed = pd.to_datetime(values, format='ISO8601', errors='coerce')
+            if parsed.notna().sum() == len(first):
+                df[col] = parsed
+    return df
+
+
+def read_csv(path, column_types=None):
+    """
+    Parse a CSV (optionally gzip-compressed) with pyarrow's multithreaded reader.
+    column_types maps header names to declared types (see CSV_COLUMN_TYPES);
+    other columns are inferred.
+    """
+    types = {col: CSV_COLUMN_TYPES[field_type] for col, field_type in (column_types or {}).items()
+             if field_type in CSV_COLUMN_TYPES}
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+    source = pa.CompressedInputStream(pa.OSFile(str(path)), 'gzip') if compressed else pa.OSFile(str(path))
+    convert_options = pacsv.ConvertOptions(
+        column_types=types,
+        null_values=NA_VALUES,
+        strings_can_be_null=True,
+        quoted_strings_can_be_null=True,
+    )
+    try:
+        with source:
+            table = pacsv.read_csv(source, read_options=pacsv.ReadOptions(use_threads=True),
+                                   convert_options=convert_options)
+    except pa.ArrowInvalid as e:
+        if not types:
+            raise
+        # A value that does not fit its declared type (text in a number column):
+        # read with inferred types and let the uploader's conversion coerce it
+        print(f"  Warning: {e}; reading {path} with inferred column types")
+        return read_csv(path)
+    # Dates pyarrow inferred go through the same ISO parsing as declared date columns
+    inferred_dates = [i for i, field in enumerate(table.schema)
+                      if pa.types.is_date(field.type) or pa.types.is_timestamp(field.type)]
+    for i in inferred_dates:
+        table = table.set_column(i, table.schema[i].name, table.column(i).cast(pa.string()))
+    return _like_excel(table.to_pandas())
+
+
+def read_source(path, sheet_name=0, column_types=None):
+    """
+    Read one export in any supported format.
+    sheet_name only applies to workbooks (as in pd.read_excel); CSV and Parquet files hold a
+    single table. column_types only applies to CSV (Excel and Parquet carry their own types).
+    """
+    fmt = detect_format(path)
+    if fmt == 'xlsx':
+        return pd.read_excel(path, sheet_name=sheet_name)
+    if fmt == 'parquet':
+        return pq.read_table(path).to_pandas()
+    return read_csv(path, column_types)
+
+
+def read_report_sheets(path, target_sheets, column_types=None):
+    """
+    {sheet name: DataFrame} for a report export.
+    Workbooks return the target sheets they contain; a CSV or Parquet export is the
+    report's (first) target sheet.
+    """
+    if detect_format(path) == 'xlsx':
+        xls = pd.ExcelFile(path)
+        for sheet_name in xls.sheet_names:
+            if sheet_name not in target_sheets:
+                print(f"Skipping sheet: {sheet_name}")
+        return pd.read_excel(xls, sheet_name=[name for name in xls.sheet_names if name in target_sheets])
+    return {target_sheets[0]: read_source(path, column_types=column_types)}
+
+
+def declared_column_types(schema, column_mapping):
+    # Source header -> declared type, through the report's rename mapping
+    types = {field.name: field.field_type for field in schema}
+    declared = {source: types[target] for source, target in column_mapping.items() if target in types}
+    for name, field_type in types.items():
+        declared.setdefault(name, field_type)
+    return declared
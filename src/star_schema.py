@@ -0,0 +1,173 @@
+import contextlib
+import fcntl
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from google.cloud import bigquery
+
+from load_scheduler import get_scheduler, truncate_table
+
+# Configuration
+# Determine the project root (parent of the 'src' directory where this script lives)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+# Surrogate key index per dimension: every value ever seen and the key it was given.
+# Keys are never reassigned, so they stay stable across runs and across reports.
+DIMENSION_DIR = os.path.join(PROJECT_ROOT, 'dimensions')
+
+# Dimension -> BigQuery table holding (Key, Value)
+DIMENSION_TABLES = {
+    'user': 'Dim_User',
+    'branch': 'Dim_Branch',
+    'sob': 'Dim_SOB',
+    'toc': 'Dim_TOC',
+}
+
+DIMENSION_SCHEMA = [
+    bigquery.SchemaField("Key", "INTEGER"),
+    bigquery.SchemaField("Value", "STRING"),
+]
+
+_locks = {name: threading.Lock() for name in DIMENSION_TABLES}
+
+
+@contextlib.contextmanager
+def dimension_lock(dim):
+    """
+    Exclusive use of one dimension's key index, across threads and processes: UW, ReAs and
+    Logbook share dimensions (e.g. user), and two runs assigning keys from the same file
+    at once would hand out the same keys. Held for the whole read-assign-write.
+    """
+    os.makedirs(DIMENSION_DIR, exist_ok=True)
+    with _locks[dim], open(os.path.join(DIMENSION_DIR, f"{dim}.lock"), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def key_column(col):
+    # Marketing -> MarketingKey
+    return f"{col}Key"
+
+
+class KeyIndex:
+    """
+    Value -> surrogate key for one dimension, backed by a local Parquet file.
+    Lookups hash only the distinct values of a column; new values are appended in one
+    batch with the next free keys, so a run that adds a few users costs a few rows.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.path = os.path.join(DIMENSION_DIR, f"{name}.parquet")
+        if os.path.exists(self.path):
+            stored = pd.read_parquet(self.path)
+            self.keys = stored['Key'].to_numpy(dtype=np.int64)
+            self.values = stored['Value'].to_numpy(dtype=object)
+        else:
+            self.keys = np.empty(0, dtype=np.int64)
+            self.values = np.empty(0, dtype=object)
+        self.index = pd.Index(self.values, dtype=object)
+        self.added = 0
+
+    def assign(self, series):
+        """Keys for series (nullable Int64; missing values stay null), adding unseen values."""
+        codes, uniques = pd.factorize(series)
+        uniques = np.asarray(uniques, dtype=object)
+        positions = self.index.get_indexer(uniques)
+
+        unseen = positions < 0
+        if unseen.any():
+            new_values = uniques[unseen]
+            first_key = int(self.keys.max()) + 1 if len(self.keys) else 1
+            positions[unseen] = np.arange(len(self.keys), len(self.keys) + len(new_values))
+            self.keys = np.concatenate([self.keys, np.arange(first_key, first_key + len(new_values))])
+            self.values = np.concatenate([self.values, new_values])
+            self.index = self.index.append(pd.Index(new_values, dtype=object))
+            self.added += len(new_values)
+
+        unique_keys = np.append(self.keys[positions], 0)  # codes of -1 (missing) land on the extra slot
+        keys = pd.array(unique_keys[codes], dtype='Int64')
+        keys[codes < 0] = pd.NA
+        return keys
+
+    def frame(self):
+        return pd.DataFrame({'Key': self.keys, 'Value': self.values})
+
+    def save(self):
+        # Call under dimension_lock, with the index read under the same lock
+        if not self.added:
+            return
+        os.makedirs(DIMENSION_DIR, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        self.frame().astype({'Value': str}).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+        self.added = 0
+
+
+def encode_dimensions(df, schema, dimension_columns):
+    """
+    Replace each text column in dimension_columns ({column: dimension}) by an integer
+    foreign key column (Marketing -> MarketingKey) at the same position.
+    Returns (fact frame, fact schema, {encoded column: dimension}).
+    """
+    present = {col: dim for col, dim in dimension_columns.items() if col in df.columns}
+    by_dimension = {}
+    for col, dim in present.items():
+        by_dimension.setdefault(dim, []).append(col)
+
+    fact = df.copy(deep=False)
+    for dim, columns in by_dimension.items():
+        with dimension_lock(dim):
+            index = KeyIndex(dim)
+            for col in columns:
+                fact[col] = index.assign(df[col])
+            if index.added:
+                print(f"  -> {index.added} new {dim} values (dimension now {len(index.keys)})")
+            index.save()
+    fact = fact.rename(columns={col: key_column(col) for col in present})
+
+    fact_schema = [
+        bigquery.SchemaField(key_column(field.name), "INTEGER") if field.name in present else field
+        for field in schema
+    ]
+    return fact, fact_schema, present
+
+
+def load_dimensions(client, dataset_id, encoded):
+    # Dimensions are small: reload each one the fact table refers to in full. The loads are
+    # queued together; reloads of a dimension another report queued meanwhile merge into one.
+    loads = {}
+    for dim in sorted(set(encoded.values())):
+        table_id = f"{client.project}.{dataset_id}.{DIMENSION_TABLES[dim]}"
+        with dimension_lock(dim):
+            dim_df = KeyIndex(dim).frame()
+        loads[table_id] = get_scheduler().submit(client, table_id, dim_df, DIMENSION_SCHEMA, write=truncate_table)
+    for table_id, load in loads.items():
+        print(f"  -> Loaded {load.result()} rows to {table_id}")
+
+
+def create_wide_view(client, table_id, schema, encoded):
+    """
+    <table>_Wide: the fact table joined back to its dimensions, with the original
+    column names and order, for queries that want the text values.
+    """
+    dataset = table_id.rsplit('.', 1)[0]
+    selects, joins = [], []
+    for i, field in enumerate(schema):
+        dim = encoded.get(field.name)
+        if dim is None:
+            selects.append(f"f.`{field.name}`")
+            continue
+        alias = f"d{i}"
+        selects.append(f"{alias}.Value AS `{field.name}`")
+        joins.append(f"LEFT JOIN `{dataset}.{DIMENSION_TABLES[dim]}` {alias} ON {alias}.Key = f.`{key_column(field.name)}`")
+    client.query(
+        f"CREATE OR REPLACE VIEW `{table_id}_Wide` AS\n"
+        f"SELECT {', '.join(selects)}\nFROM `{table_id}` f\n" + "\n".join(joins)
+    ).result()
@@ -0,0 +1,305 @@
+import queue
+import threading
+import time
+
+import pyarrow as pa
+
+# Alternative to load jobs: stream Arrow record batches through the BigQuery
+# Storage Write API using a PENDING stream, which makes rows visible only when
+# the stream is committed (all or nothing). Each batch is sent with its row
+# offset, so a retried batch is recognised by the server instead of duplicated.
+# Replacing a table's contents commits into <table>__staging, which one copy job
+# then swaps in (like bq_client_pool.replace_table): readers never see it empty.
+
+# Rows per Arrow record batch (one AppendRows request each; keep requests < 10 MB)
+BATCH_ROWS = 20000
+# AppendRows requests sent but not yet acknowledged
+MAX_IN_FLIGHT = 4
+
+# BigQuery column type -> Arrow type used on the wire
+ARROW_TYPES = {
+    'STRING': pa.string(),
+    'INTEGER': pa.int64(),
+    'FLOAT': pa.float64(),
+    'BOOLEAN': pa.bool_(),
+    'DATE': pa.date32(),
+    'DATETIME': pa.timestamp('us'),
+    'TIMESTAMP': pa.timestamp('us', tz='UTC'),
+    'NUMERIC': pa.decimal128(38, 9),
+    'BIGNUMERIC': pa.decimal256(76, 38),
+}
+
+
+class StreamError(Exception):
+    pass
+
+
+def arrow_schema(schema):
+    return pa.schema([pa.field(field.name, ARROW_TYPES[field.field_type]) for field in schema])
+
+
+def table_path(table_id):
+    project, dataset, table = table_id.split('.')
+    return f"projects/{project}/datasets/{dataset}/tables/{table}"
+
+
+class LocalWriteBackend:
+    """
+    In-process stand-in for the Storage Write API with the same commit semantics:
+    - appended rows stay invisible until their stream is committed;
+    - an append must carry the stream's next offset; an already written offset
+      is acknowledged as a duplicate without writing anything;
+    - a stream must be finalized before it can be committed, and a commit of
+      several streams is atomic.
+    append_latency (seconds) simulates the server round trip of each request.
+    """
+
+    def __init__(self, append_latency=0.0):
+        self.append_latency = append_latency
+        self.tables = {}   # table path -> list of committed record batches
+        self.streams = {}  # stream name -> {'table', 'batches', 'rows', 'finalized', 'committed'}
+        self.copies = []
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def create_pending_stream(self, table):
+        with self._lock:
+            self._next_id += 1
+            name = f"{table}/streams/local-{self._next_id}"
+            self.streams[name] = {'table': table, 'batches': [], 'rows': 0, 'finalized': False, 'committed': False}
+            return name
+
+    def _apply(self, stream_name, schema, offset, batch):
+        with self._lock:
+            stream = self.streams[stream_name]
+            if stream['finalized']:
+                raise StreamError(f"Stream {stream_name} is finalized")
+            if not batch.schema.equals(schema):
+                raise StreamError("Batch schema does not match the writer schema")
+            if offset < stream['rows']:
+                return True
+            if offset > stream['rows']:
+                raise StreamError(f"Offset {offset} beyond end of stream ({stream['rows']} rows)")
+            stream['batches'].append(batch)
+            stream['rows'] += batch.num_rows
+            return False
+
+    def append_rows(self, stream_name, schema, requests):
+        """
+        Yields one acknowledgement (offset, duplicate) per request, in order.
+        Like the gRPC stream, requests are consumed on a separate thread and each
+        acknowledgement arrives append_latency after its request was sent, so
+        several requests can be in flight at once.
+        """
+        acks = queue.Queue()
+
+        def consume():
+            try:
+                for offset, batch in requests:
+                    acks.put((time.monotonic() + self.append_latency, offset, self._apply(stream_name, schema, offset, batch)))
+            except Exception as e:
+                acks.put((0, None, e))
+            acks.put(None)
+
+        threading.Thread(target=consume, daemon=True).start()
+        while True:
+            ack = acks.get()
+            if ack is None:
+                return
+            due, offset, result = ack
+            if isinstance(result, Exception):
+                raise result
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            yield offset, result
+
+    def finalize(self, stream_name):
+        with self._lock:
+            self.streams[stream_name]['finalized'] = True
+            return self.streams[stream_name]['rows']
+
+    def reset(self, table):
+        with self._lock:
+            self.tables[table] = []
+
+    def copy(self, source, destination):
+        # Like a WRITE_TRUNCATE copy job: the destination's contents are swapped in one step
+        with self._lock:
+            self.tables[destination] = list(self.tables.get(source, []))
+            self.copies.append((source, destination))
+
+    def drop(self, table):
+        with self._lock:
+            self.tables.pop(table, None)
+
+    def commit(self, table, stream_names):
+        with self._lock:
+            streams = [self.streams[name] for name in stream_names]
+            for name, stream in zip(stream_names, streams):
+                if not stream['finalized'] or stream['committed'] or stream['table'] != table:
+                    raise StreamError(f"Stream {name} cannot be committed")
+            for stream in streams:
+                self.tables.setdefault(table, []).extend(stream['batches'])
+                stream['committed'] = True
+
+    def read(self, table):
+        batches = self.tables.get(table, [])
+        return pa.Table.from_batches(batches) if batches else None
+
+
+class BigQueryWriteBackend:
+    """
+    Storage Write API backend (google-cloud-bigquery-storage).
+    Staging tables are (re)created, swapped in with a copy job and dropped through the
+    regular client.
+    """
+
+    def __init__(self, client, schema):
+        from google.cloud import bigquery_storage_v1  # Optional dependency, only needed for this sink
+
+        self.client = client
+        self.schema = schema
+        self.types = bigquery_storage_v1.types
+        self.write_client = bigquery_storage_v1.BigQueryWriteClient()
+
+    def create_pending_stream(self, table):
+        stream = self.types.WriteStream(type_=self.types.WriteStream.Type.PENDING)
+        return self.write_client.create_write_stream(parent=table, write_stream=stream).name
+
+    def append_rows(self, stream_name, schema, requests):
+        types = self.types
+        serialized_schema = schema.serialize().to_pybytes()
+
+        def append_requests():
+            first = True
+            for offset, batch in requests:
+                request = types.AppendRowsRequest(
+                    offset=offset,
+                    arrow_rows=types.AppendRowsRequest.ArrowData(
+                        rows=types.ArrowRecordBatch(
+                            serialized_record_batch=batch.serialize().to_pybytes(),
+                            row_count=batch.num_rows,
+                        ),
+                    ),
+                )
+                if first:
+                    # Stream name and writer schema only go on the first request of the connection
+                    request.write_stream = stream_name
+                    request.arrow_rows.writer_schema = types.ArrowSchema(serialized_schema=serialized_schema)
+                    first = False
+                yield request
+
+        for response in self.write_client.append_rows(append_requests()):
+            offset = response.append_result.offset if 'append_result' in response else None
+            if 'error' in response:
+                # ALREADY_EXISTS: this offset was written by an earlier attempt
+                if response.error.code == 6:
+                    yield offset, True
+                    continue
+                raise StreamError(f"AppendRows failed: {response.error.message}")
+            if response.row_errors:
+                raise StreamError(f"AppendRows rejected rows: {list(response.row_errors)[:5]}")
+            yield offset, False
+
+    def finalize(self, stream_name):
+        return self.write_client.finalize_write_stream(name=stream_name).row_count
+
+    @staticmethod
+    def _table_id(table):
+        _, project, _, dataset, _, name = table.split('/')
+        return f"{project}.{dataset}.{name}"
+
+    def reset(self, table):
+        from google.cloud import bigquery
+
+        table_id = self._table_id(table)
+        self.client.delete_table(table_id, not_found_ok=True)
+        self.client.create_table(bigquery.Table(table_id, schema=self.schema))
+
+    def copy(self, source, destination):
+        from google.cloud import bigquery
+
+        self.client.copy_table(
+            self._table_id(source), self._table_id(destination),
+            job_config=bigquery.CopyJobConfig(write_disposition="WRITE_TRUNCATE"),
+        ).result()
+
+    def drop(self, table):
+        self.client.delete_table(self._table_id(table), not_found_ok=True)
+
+    def commit(self, table, stream_names):
+        response = self.write_client.batch_commit_write_streams(
+            request=self.types.BatchCommitWriteStreamsRequest(parent=table, write_streams=stream_names)
+        )
+        if response.stream_errors:
+            raise StreamError(f"Commit failed: {list(response.stream_errors)}")
+
+
+class StorageWriteSink:
+    """
+    Writes a DataFrame to a table through a PENDING write stream:
+    split into Arrow record batches of batch_rows, keep at most max_in_flight
+    appends outstanding, finalize, then commit. To replace the table's contents the
+    stream is committed into an empty staging table that is then copied over it.
+    """
+
+    def __init__(self, backend, batch_rows=BATCH_ROWS, max_in_flight=MAX_IN_FLIGHT):
+        self.backend = backend
+        self.batch_rows = batch_rows
+        self.max_in_flight = max_in_flight
+
+    def _batches(self, df, schema):
+        table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+        offset = 0
+        for batch in table.to_batches(max_chunksize=self.batch_rows):
+            yield offset, batch
+            offset += batch.num_rows
+
+    def write(self, table_id, df, schema, truncate=False):
+        """
+        Returns the number of rows committed.
+        If any step fails before the swap, the table keeps its previous contents.
+        """
+        table = table_path(table_id)
+        target = table_path(f"{table_id}__staging") if truncate else table
+        if truncate:
+            self.backend.reset(target)
+        wire_schema = arrow_schema(schema)
+        stream = self.backend.create_pending_stream(target)
+
+        slots = threading.BoundedSemaphore(self.max_in_flight)
+
+        def requests():
+            for offset, batch in self._batches(df, wire_schema):
+                slots.acquire()
+                yield offset, batch
+
+        duplicates = 0
+        for _, duplicate in self.backend.append_rows(stream, wire_schema, requests()):
+            slots.release()
+            duplicates += duplicate
+
+        rows = self.backend.finalize(stream)
+        if rows != len(df):
+            raise StreamError(f"Stream holds {rows} rows, expected {len(df)}")
+        if duplicates:
+            print(f"  -> {duplicates} batches were already written (retried appends)")
+        self.backend.commit(target, [stream])
+        if truncate:
+            self.backend.copy(target, table)
+            self.backend.drop(target)
+        return rows
+
+
+def storage_write_dataframe(client, table_id, df, schema, truncate=True):
+    """
+    Replace (or append to) table_id with df through the Storage Write API.
+    The table is created with the given schema if it does not exist yet.
+    With truncate=True the rows are committed into a staging table and swapped in
+    with one copy job, so readers see either the old or the new rows.
+    """
+    from google.cloud import bigquery
+
+    client.create_table(bigquery.Table(table_id, schema=schema), exists_ok=True)
+    return StorageWriteSink(BigQueryWriteBackend(client, schema)).write(table_id, df, schema, truncate=truncate)
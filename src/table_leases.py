@@ -0,0 +1,202 @@
+import functools
+import hashlib
+import inspect
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+# Configuration
+# Determine the project root (parent of the 'src' directory where this script lives)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+# One lease per destination table, shared by every uploader process on this machine
+LEASE_DB = os.path.join(PROJECT_ROOT, 'locks', 'table_leases.sqlite')
+# A lease not renewed for this long belongs to a dead run and can be taken over
+LEASE_SECONDS = 120
+POLL_SECONDS = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    table_name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    source_hash TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS finished (
+    table_name TEXT NOT NULL,
+    source_hash TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    finished_at REAL NOT NULL,
+    PRIMARY KEY (table_name, source_hash)
+);
+CREATE TABLE IF NOT EXISTS failed (
+    table_name TEXT NOT NULL,
+    source_hash TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    failed_at REAL NOT NULL,
+    PRIMARY KEY (table_name, source_hash)
+);
+"""
+
+
+def run_owner():
+    # Distinguishes runs in other processes and in other threads of this one (the watcher)
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def source_hash(path):
+    """Content hash of a source file, or of every file in a source folder (names included)."""
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, name) for name in os.listdir(path))
+    elif os.path.exists(path):
+        files = [path]
+    else:
+        files = []
+        digest.update(str(path).encode('utf-8'))
+    for file_path in files:
+        if not os.path.isfile(file_path):
+            continue
+        digest.update(os.path.basename(file_path).encode('utf-8'))
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TableLeases:
+    def __init__(self, db_path=None):
+        self.db_path = db_path or LEASE_DB
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+
+    def try_acquire(self, table, owner, digest):
+        """Take the lease on table. Returns None on success, else the holder's (owner, source_hash, started_at)."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT owner, source_hash, started_at, expires FROM leases WHERE table_name = ?", (table,)
+            ).fetchone()
+            if row is not None and row[3] >= now:
+                conn.execute("COMMIT")
+                return row[:3]
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (table_name, owner, source_hash, started_at, expires) VALUES (?, ?, ?, ?, ?)",
+                (table, owner, digest, now, now + LEASE_SECONDS),
+            )
+            conn.execute("COMMIT")
+            return None
+
+    def renew(self, table, owner):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE leases SET expires = ? WHERE table_name = ? AND owner = ?",
+                (time.time() + LEASE_SECONDS, table, owner),
+            )
+
+    def release(self, table, owner, digest, loaded):
+        """
+        Give up the lease. loaded says whether the run confirmed its load: only then is the
+        source recorded as finished; otherwise it is recorded as failed.
+        """
+        outcome = "INSERT OR REPLACE INTO finished (table_name, source_hash, owner, finished_at) VALUES (?, ?, ?, ?)" \
+            if loaded else "INSERT OR REPLACE INTO failed (table_name, source_hash, owner, failed_at) VALUES (?, ?, ?, ?)"
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM leases WHERE table_name = ? AND owner = ?", (table, owner))
+            conn.execute(outcome, (table, digest, owner, time.time()))
+            conn.execute("COMMIT")
+
+    def finished_since(self, table, digest, since):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT owner FROM finished WHERE table_name = ? AND source_hash = ? AND finished_at >= ?",
+                (table, digest, since),
+            ).fetchone()
+            return row[0] if row else None
+
+    def failed_since(self, table, digest, since):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT owner FROM failed WHERE table_name = ? AND source_hash = ? AND failed_at >= ?",
+                (table, digest, since),
+            ).fetchone()
+            return row[0] if row else None
+
+
+def _keep_leases(leases, tables, owner, done):
+    # tables grows while the run acquires them one by one
+    while not done.wait(LEASE_SECONDS / 3):
+        for table in list(tables):
+            leases.renew(table, owner)
+
+
+def coalesced_run(*tables):
+    """
+    Decorator for an uploader whose first argument is its source file/folder and which
+    replaces the given destination tables.
+    - Only one run per table at a time; a run for another source waits for the lease.
+    - A run whose source has the same content hash as the run holding the lease waits for
+      that run to finish and then returns True without parsing or loading anything itself.
+      If that run failed (returned a false value or raised), it loads the source itself.
+    """
+    def decorate(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            source = next(iter(bound.arguments.values()))
+            digest = source_hash(source)
+            owner = run_owner()
+            leases = TableLeases()
+            acquired = []
+            loaded = False
+            done = threading.Event()
+            # Started before the first lease is taken, so a lease held while waiting for
+            # the next table is renewed too
+            heartbeat = threading.Thread(target=_keep_leases, args=(leases, acquired, owner, done), daemon=True)
+            heartbeat.start()
+            try:
+                for table in sorted(tables):
+                    announced = False
+                    attached_since = None  # start of the same-source run we are waiting on
+                    while True:
+                        holder = leases.try_acquire(table, owner, digest)
+                        if holder is None:
+                            acquired.append(table)
+                            if attached_since is not None and leases.finished_since(table, digest, attached_since):
+                                print(f"[lease] {table}: attached run finished, nothing left to do")
+                                loaded = True
+                                return True
+                            if attached_since is not None and leases.failed_since(table, digest, attached_since):
+                                print(f"[lease] {table}: attached run failed, loading the source here")
+                            break
+                        holder_owner, holder_hash, started_at = holder
+                        if holder_hash == digest and attached_since is None:
+                            print(f"[lease] {table}: same source already loading in {holder_owner}, attaching to it")
+                            attached_since = started_at
+                        elif holder_hash != digest and not announced:
+                            print(f"[lease] {table}: waiting for run {holder_owner} to finish")
+                            announced = True
+                        time.sleep(POLL_SECONDS)
+
+                result = func(*args, **kwargs)
+                loaded = bool(result)
+                return result
+            finally:
+                done.set()
+                for table in acquired:
+                    leases.release(table, owner, digest, loaded)
+        return run
+    return decorate
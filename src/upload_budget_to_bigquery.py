@@ -1,8 +1,15 @@
 import pandas as pd
-from google.cloud import bigquery
-from google.api_core.exceptions import Conflict
 import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from bq_client_pool import ensure_dataset, get_client, remember_table
+from budget_schema import conform, resolve_schema
+from load_reconciliation import Checksums, reconcile_load
+from load_scheduler import scheduled_load
+from local_mirror import mirror_after_load
+from table_leases import coalesced_run
+from upload_metrics import ReportMetrics
 
 # Configuration
 # Determine the project root (parent of the 'src' directory where this script lives)
@@ -13,6 +20,12 @@ KEY_FILE = os.path.join(PROJECT_ROOT, 'big-bliss-302909-06cd6e425088.json')
 EXCEL_FILE = os.path.join(PROJECT_ROOT, 'data', 'budget_2026_v1.xlsx')
 DATASET_ID = 'temporary'
 LOCATION = 'asia-southeast2' # Jakarta
+TARGET_SHEETS = ["Input MKT", "Input Teknik"]
+# Sheets are converted and uploaded concurrently, up to this many at a time
+MAX_WORKERS = 4
+# After each load, compare row count, NULL counts, sums and text lengths of the frame with
+# one aggregate query over the table (no data is downloaded). The sheets have no key column.
+RECONCILE = True
 
 # Setup Credentials
 if not os.path.exists(KEY_FILE):
@@ -21,6 +34,8 @@ if not os.path.exists(KEY_FILE):
 
 os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = KEY_FILE
 
+METRICS = ReportMetrics('budget')
+
 def sanitize_table_name(name):
     """
     Sanitize the sheet name to be a valid BigQuery table name.
@@ -38,111 +53,148 @@ def sanitize_table_name(name):
         
     return clean_name
 
-def upload_budget():
+def sanitize_column_name(col):
+    """
+    Sanitize a column header to be a valid BigQuery field name.
+    BigQuery fields must contain only letters, numbers, and underscores, start with letter or underscore, length <= 300
+    """
+    col_str = str(col)
+    # specific replacements for readability
+    col_str = col_str.replace('%', '_pct')
+    col_str = col_str.replace('&', '_and_')
+    col_str = col_str.replace('+', '_plus_')
+    
+    # Replace non-alphanumeric characters with a single underscore
+    clean_col = re.sub(r'[^a-zA-Z0-9]+', '_', col_str)
+    
+    # Strip leading/trailing underscores
+    clean_col = clean_col.strip('_')
+    
+    if not clean_col:
+        clean_col = "col_"
+    if not clean_col[0].isalpha() and clean_col[0] != '_':
+        clean_col = '_' + clean_col
+    return clean_col
+
+def convert_sheet(df):
+    """
+    Coerce text columns to numeric where possible and fill NaNs, in one pass over the frame.
+    - Text columns: '-' (accounting format for 0) becomes 0, then the column is made numeric
+      if that yields at least one number or the column was empty.
+    - NaNs become 0 in numeric columns and "" in the rest, which are cast to str.
+    """
+    text_cols = df.select_dtypes(include=['object', 'string']).columns
+    if len(text_cols):
+        text = df[text_cols].astype(object).replace({'-': 0})
+        numeric = text.apply(pd.to_numeric, errors='coerce')
+        use_numeric = numeric.notna().any() | text.isna().all()
+        df[text_cols] = text
+        numeric_cols = use_numeric.index[use_numeric]
+        if len(numeric_cols):
+            df[numeric_cols] = numeric[numeric_cols]
+            # Text that did not parse in a numeric column ends up as 0 below
+            for col in numeric_cols:
+                METRICS.coerced(col, text[col], numeric[col])
+
+    is_numeric = df.dtypes.map(pd.api.types.is_numeric_dtype).astype(bool)
+    numeric_cols = df.columns[is_numeric]
+    other_cols = df.columns[~is_numeric]
+    if len(numeric_cols):
+        df[numeric_cols] = df[numeric_cols].fillna(0)
+    if len(other_cols):
+        # Ensure string type for non-numeric to avoid mixed type issues
+        df[other_cols] = df[other_cols].fillna("").astype(str)
+
+    df.columns = [sanitize_column_name(col) for col in df.columns]
+    return df
+
+def process_sheet(client, sheet_name, df):
+    print(f"Processing sheet: {sheet_name}")
+    stage = 'convert'
     try:
-        print(f"Initializing BigQuery client with key: {KEY_FILE}")
-        client = bigquery.Client()
+        start = time.perf_counter()
+        METRICS.rows_parsed.inc(len(df))
+        df = convert_sheet(df)
+        # Explicit schema, inferred once per sheet version instead of autodetected on every load
+        schema = resolve_schema(sheet_name, df)
+        df = conform(df, schema)
         
-        # Create Dataset
-        dataset_ref = client.dataset(DATASET_ID)
-        dataset = bigquery.Dataset(dataset_ref)
-        dataset.location = LOCATION
+        table_name = sanitize_table_name(sheet_name)
+        table_id = f"{client.project}.{DATASET_ID}.{table_name}"
         
-        try:
-            client.create_dataset(dataset, timeout=30)
-            print(f"Created dataset {client.project}.{DATASET_ID}")
-        except Conflict:
-            print(f"Dataset {client.project}.{DATASET_ID} already exists")
-
-        # Read Excel
-        print(f"Reading Excel file: {EXCEL_FILE}")
-        xls = pd.ExcelFile(EXCEL_FILE)
+        METRICS.seconds['convert'].observe(time.perf_counter() - start)
+        stage, load_start = 'load', time.perf_counter()
+        print(f"  -> Uploading {sheet_name} to {table_id}...")
         
-        target_sheets = ["Input MKT", "Input Teknik"]
-        for sheet_name in xls.sheet_names:
-            if sheet_name not in target_sheets:
-                continue
-                
-            print(f"Processing sheet: {sheet_name}")
-            try:
-                df = pd.read_excel(xls, sheet_name=sheet_name)
-                
-                # Attempt to convert object columns to numeric where possible
-                # This fixes issues where numeric columns are read as objects due to a few bad values or formatting
-                for col in df.columns:
-                    # Clean up common non-numeric formatting like ' - ' for 0
-                    if df[col].dtype == 'object':
-                        # Try to handle the specific case where accounting explicit format results in '-' for 0
-                        df[col] = df[col].replace({'-': 0})
-                        # Attempt to convert to numeric, coercing errors to NaN (which will be handled later)
-                        # We only keep the numeric version if it doesn't destroy the data (i.e. if it wasn't all just text)
-                        temp_col = pd.to_numeric(df[col], errors='coerce')
-                        
-                        # Check: If the column had data, and conversion resulted in SOME numbers (or was already empty), use it.
-                        # If it was purely text, temp_col would be all NaN (except where original was NaN).
-                        # Simple heuristic: If the original column had non-null values, and the numeric conversion has non-null values
-                        # we assume it's numeric.
-                        if temp_col.notna().sum() > 0 or df[col].notna().sum() == 0:
-                             df[col] = temp_col
-
-                # Handle NaNs: 0 for numbers, empty string for others
-                for col in df.columns:
-                    if pd.api.types.is_numeric_dtype(df[col]):
-                        df[col] = df[col].fillna(0)
-                    else:
-                        df[col] = df[col].fillna("")
-                        # Ensure string type for non-numeric to avoid mixed type issues
-                        df[col] = df[col].astype(str)
-
-                # Sanitize column names
-                # Replace non-alphanumeric (except underscore) with underscore
-                # BigQuery fields must contain only letters, numbers, and underscores, start with letter or underscore, length <= 300
-                new_columns = []
-                for col in df.columns:
-                    col_str = str(col)
-                    # specific replacements for readability
-                    col_str = col_str.replace('%', '_pct')
-                    col_str = col_str.replace('&', '_and_')
-                    col_str = col_str.replace('+', '_plus_')
-                    
-                    # Replace non-alphanumeric characters with a single underscore
-                    clean_col = re.sub(r'[^a-zA-Z0-9]+', '_', col_str)
-                    
-                    # Strip leading/trailing underscores
-                    clean_col = clean_col.strip('_')
-                    
-                    if not clean_col:
-                        clean_col = "col_"
-                    if not clean_col[0].isalpha() and clean_col[0] != '_':
-                        clean_col = '_' + clean_col
-                    new_columns.append(clean_col)
-                df.columns = new_columns
-                
-                table_name = sanitize_table_name(sheet_name)
-                table_id = f"{client.project}.{DATASET_ID}.{table_name}"
-                
-                print(f"  -> Uploading to {table_id}...")
-                
-                # DELETE table if it exists to handle cases where it might be an EXTERNAL table
-                # which cannot be overwritten by load_table_from_dataframe with WRITE_TRUNCATE
-                client.delete_table(table_id, not_found_ok=True)
-                
-                job_config = bigquery.LoadJobConfig(
-                    write_disposition="WRITE_TRUNCATE", # Defines the action when the table exists.
-                    autodetect=True,
-                )
-                
-                job = client.load_table_from_dataframe(
-                    df, table_id, job_config=job_config
-                )
-                job.result() # Wait for job to complete
-                
-                print(f"  -> Success! Loaded {job.output_rows} rows to {table_id}")
-            except Exception as e:
-                print(f"  -> Failed to upload sheet '{sheet_name}': {e}")
+        checksums = Checksums(df, schema) if RECONCILE else None
+        # Staging-table swap (the table never goes missing), queued by the quota-aware scheduler
+        output_rows = scheduled_load(client, table_id, df, schema)
+        remember_table(table_id)
+        METRICS.seconds['load'].observe(time.perf_counter() - load_start)
+        METRICS.rows_loaded.inc(output_rows or 0)
+        
+        # Each stage after the load is timed (and blamed for failures) on its own.
+        # The mirror follows the table as soon as it has changed, even if reconciliation fails.
+        stage = 'mirror'
+        with METRICS.timed('mirror'):
+            mirror_after_load(table_id, df)
+        if checksums is not None:
+            stage = 'reconcile'
+            with METRICS.timed('reconcile'):
+                reconcile_load(client, table_id, checksums, schema)
+        elapsed = time.perf_counter() - start
+        print(f"  -> Success! Loaded {output_rows} rows to {table_id} ({elapsed:.1f}s)")
+        return True
+    except Exception as e:
+        METRICS.failures[stage].inc()
+        print(f"  -> Failed to upload sheet '{sheet_name}': {e}")
+        return False
+
+# One run per table; an overlapping run on the same workbook waits for and reuses the first
+@coalesced_run(*[f"{DATASET_ID}.{sanitize_table_name(name)}" for name in TARGET_SHEETS])
+def upload_budget(excel_file=EXCEL_FILE, sheets=None):
+    # Stage blamed for a failure outside the per-sheet handler (client set-up counts as loading)
+    stage = 'load'
+    try:
+        print(f"Initializing BigQuery client with key: {KEY_FILE}")
+        client = get_client()
+        
+        # Create Dataset (skipped if already confirmed by this process)
+        ensure_dataset(client, DATASET_ID, LOCATION)
+
+        # Read Excel: the workbook is opened and the target sheets parsed in a single call,
+        # since the reader cannot be shared safely between threads.
+        # Sheets already parsed elsewhere (e.g. staged by sharded workers) are used as given.
+        start = time.perf_counter()
+        if sheets is None:
+            stage = 'parse'
+            print(f"Reading Excel file: {excel_file}")
+            xls = pd.ExcelFile(excel_file)
+            sheet_names = [name for name in xls.sheet_names if name in TARGET_SHEETS]
+            sheets = pd.read_excel(xls, sheet_name=sheet_names)
+            METRICS.seconds['parse'].observe(time.perf_counter() - start)
+            METRICS.read_source(excel_file)
+            print(f"Parsed {len(sheets)} sheets in {time.perf_counter() - start:.1f}s")
+            stage = 'load'
+        else:
+            sheets = {name: df for name, df in sheets.items() if name in TARGET_SHEETS}
+
+        # Convert and upload each sheet in its own worker
+        with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(sheets)))) as executor:
+            futures = [
+                executor.submit(process_sheet, client, sheet_name, df)
+                for sheet_name, df in sheets.items()
+            ]
+            loaded = [future.result() for future in futures]
+
+        print(f"Finished {len(sheets)} sheets in {time.perf_counter() - start:.1f}s")
+        # Every target sheet must load for the run to count as done (the watcher retries otherwise)
+        return bool(loaded) and all(loaded)
 
     except Exception as e:
+        METRICS.failures[stage].inc()
         print(f"An error occurred: {e}")
+        return False
 
 if __name__ == "__main__":
     upload_budget()
@@ -0,0 +1,225 @@
+import abc
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bq_client_pool import api_calls_saved
+
+# Counters and histograms per report and stage, served over HTTP in the Prometheus text
+# format when the uploaders run as a service (the folder watcher).
+# Each uploader binds its label values once at import (ReportMetrics), so recording is
+# one locked add per sheet or file and never happens per row.
+
+# Port of the /metrics endpoint; 0 (the default) leaves the endpoint off
+METRICS_PORT = int(os.environ.get('UPLOAD_METRICS_PORT', '0'))
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+STAGES = ('parse', 'convert', 'load', 'reconcile', 'mirror')
+
+# Every metric, in exposition order
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class _Metric(abc.ABC):
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        """The child for these label values; bind it once and keep it (no lookup per call)."""
+        values = tuple(str(value) for value in values)
+        with self._lock:
+            child = self.children.get(values)
+            if child is None:
+                child = self.children[values] = self._new_child()
+            return child
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """A fresh child holding the values of one label combination."""
+
+    @abc.abstractmethod
+    def _samples(self, values, child):
+        """The exposition lines of one child."""
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = sorted(self.children.items())
+        for values, child in children:
+            lines.extend(self._samples(values, child))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def _samples(self, values, child):
+        yield f"{self.name}{_label_text(self.labelnames, values)} {_number(child.value)}"
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _samples(self, values, child):
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _label_text(self.labelnames, values, [('le', _number(bound))])
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _label_text(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {_number(total)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+ROWS_PARSED = Counter('upload_rows_parsed_total', 'Rows read from source exports.', ['report'])
+ROWS_LOADED = Counter('upload_rows_loaded_total', 'Rows BigQuery reported as loaded (job.output_rows).', ['report'])
+SOURCE_BYTES = Counter('upload_source_bytes_total', 'Bytes of source exports read.', ['report'])
+COERCED_NULLS = Counter('upload_coerced_nulls_total', 'Values that became NULL in a type conversion.',
+                        ['report', 'column'])
+FAILURES = Counter('upload_failures_total', 'Failed sheets/files per stage.', ['report', 'stage'])
+STAGE_SECONDS = Histogram('upload_stage_seconds', 'Duration of each parse, convert, load, reconcile and mirror.', ['report', 'stage'])
+
+
+def _cache_hit_lines():
+    # Existence checks skipped by bq_client_pool's cache
+    yield "# HELP upload_cache_hits_total BigQuery API calls saved by the client pool caches."
+    yield "# TYPE upload_cache_hits_total counter"
+    for call, count in sorted(api_calls_saved().items()):
+        yield f'upload_cache_hits_total{{call="{_escape(call)}"}} {count}'
+
+
+def exposition():
+    """All metrics in the Prometheus text format (version 0.0.4)."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    lines.extend(_cache_hit_lines())
+    return '\n'.join(lines) + '\n'
+
+
+class ReportMetrics:
+    """The metrics of one report, with every label value bound up front."""
+
+    def __init__(self, report):
+        self.report = report
+        self.rows_parsed = ROWS_PARSED.labels(report)
+        self.rows_loaded = ROWS_LOADED.labels(report)
+        self.source_bytes = SOURCE_BYTES.labels(report)
+        self.seconds = {stage: STAGE_SECONDS.labels(report, stage) for stage in STAGES}
+        self.failures = {stage: FAILURES.labels(report, stage) for stage in STAGES}
+        self._coerced = {}
+
+    @contextmanager
+    def timed(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage].observe(time.perf_counter() - start)
+
+    def read_source(self, path):
+        try:
+            self.source_bytes.inc(os.path.getsize(path))
+        except OSError:
+            pass
+
+    def coerced(self, column, before, after):
+        """Count values of column that were present before a conversion and are null after it."""
+        added = int(after.isna().sum()) - int(before.isna().sum())
+        if added <= 0:
+            return
+        child = self._coerced.get(column)
+        if child is None:
+            child = self._coerced[column] = COERCED_NULLS.labels(self.report, column)
+        child.inc(added)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would drown the upload log
+        pass
+
+
+def start_metrics_server(port=None):
+    """Serve /metrics on port (default METRICS_PORT) from a daemon thread; returns the server or None."""
+    port = METRICS_PORT if port is None else port
+    if not port:
+        return None
+    server = ThreadingHTTPServer(('', port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving metrics on http://localhost:{server.server_address[1]}/metrics")
+    return server
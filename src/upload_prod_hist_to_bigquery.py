@@ -1,10 +1,19 @@
-import pandas as pd
-from google.cloud import bigquery
-from google.api_core.exceptions import Conflict
 import os
 import glob
 import re
-from datetime import datetime
+import time
+from load_reconciliation import Checksums, reconcile_load
+from prod_hist_dedup import DuplicateIndex, fingerprint_rows
+from prod_hist_rollups import build_rollups, rollup_query
+from prod_hist_schema import COLUMN_MAPPING, SCHEMA, build_detail
+from prod_hist_watermark import Watermarks, read_tail
+from load_scheduler import BACKFILL, get_scheduler, truncate_table
+from local_mirror import mirror_after_load
+from arrow_ipc_handoff import HandoffStats, read_source_files
+from bq_client_pool import ensure_dataset, get_client
+from source_readers import SOURCE_EXTENSIONS, declared_column_types, list_sources
+from table_leases import coalesced_run
+from upload_metrics import ReportMetrics
 
 # Configuration
 # Determine the project root (parent of the 'src' directory where this script lives)
@@ -16,6 +25,30 @@ PROD_HIST_DIR = os.path.join(PROJECT_ROOT, 'data', 'prod_hist')
 DATASET_ID = 'temporary'
 LOCATION = 'asia-southeast2' # Jakarta
 TARGET_TABLE_NAME = 'Report_Prod_Hist_All'
+# Drop rows that are exact duplicates (on the business columns) of a row already seen
+# in the same or an earlier file. When False, overlaps are only reported.
+DROP_DUPLICATES = False
+# Parse the yearly files in this many worker processes (1 = parse in this process)
+PARSE_WORKERS = min(4, os.cpu_count() or 1)
+# Tail-only mode: append just the rows added at the end of each export since the last run
+# (verified against the row watermarks in prod_hist_watermark). Any other change to the
+# exports, or a table loaded another way, falls back to the full reload.
+# Not combined with DROP_DUPLICATES, which needs every row of every file.
+TAIL_ONLY = False
+# Source (year, month) columns recorded with each watermark
+PERIOD_COLUMNS = ['Tahun', 'Bulan']
+# After a full load, compare row count, NULL counts, exact BIGNUMERIC sums, text lengths and
+# date bounds of the frame with one aggregate query over the table (no data is downloaded).
+# Tail appends are not reconciled: the local side only holds the new rows.
+RECONCILE = True
+
+# Summary tables built from the same typed frame and loaded next to the detail table.
+# Table name -> grouping columns. Every BIGNUMERIC column plus NEW_/RENEWAL is summed.
+ROLLUP_GROUPING_SETS = {
+    'Report_Prod_Hist_Summary': ['TAHUN', 'BULAN', 'BRANCH', 'COB', 'LOB'],
+    'Report_Prod_Hist_Summary_Branch': ['TAHUN', 'BULAN', 'BRANCH'],
+    'Report_Prod_Hist_Summary_COB': ['TAHUN', 'BULAN', 'COB', 'LOB'],
+}
 
 # Setup Credentials
 if not os.path.exists(KEY_FILE):
@@ -24,6 +57,8 @@ if not os.path.exists(KEY_FILE):
 
 os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = KEY_FILE
 
+METRICS = ReportMetrics('prod_hist')
+
 def sanitize_table_name(name):
     clean_name = re.sub(r'[^a-zA-Z0-9]', '_', name)
     if not clean_name:
@@ -32,174 +67,268 @@ def sanitize_table_name(name):
         clean_name = '_' + clean_name
     return clean_name
 
-def upload_prod_hist():
+def merge_parsed(files, frames, parsed):
+    # (path, DataFrame, error) in the order of files, taking given frames as they are
+    # and the rest from parsed (which yields them in the same relative order)
+    for file_path in files:
+        if frames.get(file_path) is not None:
+            yield file_path, frames[file_path], None
+        else:
+            yield next(parsed)
+
+def rebuild_rollups(client, table_id, schema):
+    """Rebuild every rollup from the whole detail table in BigQuery. True when all succeeded."""
+    sum_cols = ['NEW_', 'RENEWAL'] + [f.name for f in schema if f.field_type == 'BIGNUMERIC']
+    rollups_failed = 0
+    for rollup_name, group_cols in ROLLUP_GROUPING_SETS.items():
+        rollup_table_id = f"{client.project}.{DATASET_ID}.{rollup_name}"
+        try:
+            client.query(rollup_query(table_id, rollup_table_id, group_cols, sum_cols)).result()
+            rollup_df = client.list_rows(rollup_table_id).to_dataframe()
+            mirror_after_load(rollup_table_id, rollup_df)
+            print(f"  -> Rebuilt rollup {rollup_table_id} ({len(rollup_df)} rows)")
+        except Exception as e:
+            rollups_failed += 1
+            METRICS.failures['load'].inc()
+            print(f"  -> Failed to rebuild rollup '{rollup_name}': {e}")
+    return not rollups_failed
+
+def append_tails(client, table_id, schema, column_mapping, reads, watermarks):
+    """
+    Tail-only load: append the new trailing rows of every export and rebuild the rollups
+    in BigQuery. Returns None (nothing loaded) when only a full reload is correct, else
+    whether the rollups were rebuilt (the appended rows stay in the table either way).
+    reads maps each export to its TailRead.
+    """
+    if not watermarks.marks:
+        print("Tail-only: no watermarks from a previous tail-only load, doing a full reload")
+        return None
+    missing = set(watermarks.marks) - {os.path.basename(file_path) for file_path in reads}
+    if missing:
+        print(f"Tail-only: exports removed since the last load ({', '.join(sorted(missing))}), doing a full reload")
+        return None
+    reloads = {file_path: read.reason for file_path, read in reads.items() if read.status == 'reload'}
+    if reloads:
+        for file_path, reason in reloads.items():
+            print(f"Tail-only: {os.path.basename(file_path)} changed ({reason}), doing a full reload")
+        return None
+
+    tails, names = [], []
+    for file_path, read in reads.items():
+        name = os.path.basename(file_path)
+        if read.status == 'unchanged':
+            print(f"Processing file: {name} (no new rows)")
+            continue
+        print(f"Processing file: {name} ({len(read.frame)} new rows, up to {read.mark['period']})")
+        tails.append(read.frame)
+        names.append(name)
+    if not tails:
+        # Nothing to append; rollups are still rebuilt, as a retry of a run whose rebuild failed lands here
+        print("No new rows since the last load.")
+        return rebuild_rollups(client, table_id, schema)
+
+    with METRICS.timed('convert'):
+        tail_df = build_detail(tails, names)
+    print(f"Appending {len(tail_df)} rows to {table_id}...")
+    with METRICS.timed('load'):
+        output_rows = get_scheduler().load(client, table_id, tail_df, schema, priority=BACKFILL, append=True)
+    METRICS.rows_loaded.inc(output_rows or 0)
+    with METRICS.timed('mirror'):
+        mirror_after_load(table_id, tail_df, partition_cols=['TAHUN', 'BULAN'], append=True)
+    print(f"Success! Appended {output_rows} rows to {table_id}")
+
+    # Rollups are rebuilt from the whole detail table, so they stay exact without the old rows here.
+    # Like a full load, a failed rebuild fails the run, so the watcher tries again.
+    return rebuild_rollups(client, table_id, schema)
+
+# One run per table; an overlapping run on the same folder contents waits for and reuses the first
+@coalesced_run(f"{DATASET_ID}.{TARGET_TABLE_NAME}")
+def upload_prod_hist(prod_hist_dir=PROD_HIST_DIR, frames=None):
+    stage = 'parse'
     try:
         print(f"Initializing BigQuery client with key: {KEY_FILE}")
-        client = bigquery.Client()
-        
-        # Create Dataset
-        dataset_ref = client.dataset(DATASET_ID)
-        dataset = bigquery.Dataset(dataset_ref)
-        dataset.location = LOCATION
-        
-        try:
-            client.create_dataset(dataset, timeout=30)
-            print(f"Created dataset {client.project}.{DATASET_ID}")
-        except Conflict:
-            print(f"Dataset {client.project}.{DATASET_ID} already exists")
-
-        # Define Schema
-        schema = [
-            # User provided schema
-            bigquery.SchemaField("TANGGAL", "STRING"), # Note: Schema says STRING, file has datetime. Will convert.
-            bigquery.SchemaField("BULAN", "INTEGER"),
-            bigquery.SchemaField("TAHUN", "INTEGER"),
-            bigquery.SchemaField("BRANCH", "STRING"),
-            bigquery.SchemaField("MO", "STRING"),
-            bigquery.SchemaField("SARATOGA", "STRING"),
-            bigquery.SchemaField("CGROUP", "STRING"),
-            bigquery.SchemaField("SCGROUP", "STRING"),
-            bigquery.SchemaField("SOURCE", "STRING"),
-            bigquery.SchemaField("COB", "STRING"),
-            bigquery.SchemaField("TOC", "STRING"),
-            bigquery.SchemaField("LOB", "STRING"),
-            bigquery.SchemaField("bankersclause", "STRING"),
-            bigquery.SchemaField("NEW_", "INTEGER"),
-            bigquery.SchemaField("NEW_PREMI", "BIGNUMERIC"),
-            bigquery.SchemaField("RENEWAL", "INTEGER"),
-            bigquery.SchemaField("RENEWAL_PREMI", "BIGNUMERIC"),
-            bigquery.SchemaField("COMM", "BIGNUMERIC"),
-            bigquery.SchemaField("COMMSUBS", "BIGNUMERIC"),
-            bigquery.SchemaField("DISC", "BIGNUMERIC"),
-            bigquery.SchemaField("ENGFEE", "BIGNUMERIC"),
-            bigquery.SchemaField("FACPREM", "BIGNUMERIC"),
-            bigquery.SchemaField("RIPREM", "BIGNUMERIC"),
-            bigquery.SchemaField("FACRICOM", "BIGNUMERIC"),
-            bigquery.SchemaField("SOURCE_PROFILEID", "STRING"),
-            
-            # Audit columns
-            bigquery.SchemaField("create_by", "STRING"),
-            bigquery.SchemaField("modified_by", "STRING"),
-            bigquery.SchemaField("create_date", "DATETIME"),
-            bigquery.SchemaField("modified_date", "DATETIME"),
-            
-            # Added for file tracking
-            bigquery.SchemaField("SourceFilename", "STRING"),
-        ]
-
-        # Column Mapping (Lower/Mixed case in File -> Upper/Specific case in Schema)
-        column_mapping = {
-            'tanggal': 'TANGGAL',
-            'Bulan': 'BULAN',
-            'Tahun': 'TAHUN',
-            'branch': 'BRANCH',
-            'MO': 'MO',
-            'SARATOGA': 'SARATOGA',
-            'CGroup': 'CGROUP',
-            'SCGroup': 'SCGROUP',
-            'source': 'SOURCE',
-            'cob': 'COB',
-            'toc': 'TOC',
-            'LOB': 'LOB',
-            'BankersClause': 'bankersclause',
-            'New': 'NEW_',
-            'New Premi': 'NEW_PREMI',
-            'Renewal': 'RENEWAL',
-            'Renewal Premi': 'RENEWAL_PREMI',
-            'Comm': 'COMM',
-            'CommSUBS': 'COMMSUBS',
-            'Disc': 'DISC',
-            'EngFee': 'ENGFEE',
-            'FacPrem': 'FACPREM',
-            'RIPrem': 'RIPREM',
-            'FacRICom': 'FACRICOM',
-            'SourceBusiness': 'SOURCE_PROFILEID'
-        }
-
-        # Find all excel files
-        files = glob.glob(os.path.join(PROD_HIST_DIR, "*.xlsx"))
-        print(f"Found {len(files)} files in {PROD_HIST_DIR}")
+        client = get_client()
         
-        all_dfs = []
-        for file_path in files:
+        # Create Dataset (skipped if already confirmed by this process)
+        ensure_dataset(client, DATASET_ID, LOCATION)
+
+        # Schema and column mapping (file header -> schema column) of the detail table
+        schema = SCHEMA
+        column_mapping = COLUMN_MAPPING
+
+        # Rows are fingerprinted on every business column (everything we map from the file)
+        dedup_key_cols = list(column_mapping.values())
+        dup_index = DuplicateIndex()
+
+        # Read all columns with default pandas types; BIGNUMERIC columns are converted later.
+        # With PARSE_WORKERS > 1 files are parsed in worker processes and handed back
+        # through shared-memory Arrow IPC files instead of pickled DataFrames.
+        # frames ({file path: parsed frame or None}, e.g. staged by sharded workers) gives the
+        # files to load; only those without a frame are parsed here.
+        stage_start = time.perf_counter()
+        column_types = declared_column_types(schema, column_mapping)
+        table_id = f"{client.project}.{DATASET_ID}.{TARGET_TABLE_NAME}"
+        watermarks = Watermarks()
+        marks = {}
+        if frames is None:
+            # Find all exports (xlsx, csv, csv.gz, parquet; one format per year, sorted so
+            # 'keep first' is deterministic across runs). CSV columns are typed from the schema.
+            files = list_sources(
+                path for extension in SOURCE_EXTENSIONS
+                for path in glob.glob(os.path.join(prod_hist_dir, f"*{extension}"))
+            )
+            print(f"Found {len(files)} files in {prod_hist_dir}")
+            frames = {}
+            if TAIL_ONLY and not DROP_DUPLICATES:
+                reads = {
+                    file_path: read_tail(file_path, watermarks.get(os.path.basename(file_path)),
+                                         PERIOD_COLUMNS, column_types)
+                    for file_path in files
+                }
+                marks = {os.path.basename(file_path): read.mark for file_path, read in reads.items()}
+                tail_seconds = time.perf_counter() - stage_start
+                stage = 'load'
+                appended = append_tails(client, table_id, schema, column_mapping, reads, watermarks)
+                if appended is not None:
+                    METRICS.seconds['parse'].observe(tail_seconds)
+                    for file_path, read in reads.items():
+                        if read.frame is not None:
+                            METRICS.read_source(file_path)
+                            METRICS.rows_parsed.inc(len(read.frame))
+                    # Saved even when a rollup failed: the rows are in, a retry must not append them again
+                    watermarks.save(marks)
+                    return appended
+                # Full reload, reusing the exports that were already read whole. Their rows
+                # and the time spent reading the tails count toward this run's one parse
+                # observation below (the failed append attempt does not).
+                stage, stage_start = 'parse', time.perf_counter() - tail_seconds
+                frames = {file_path: read.frame for file_path, read in reads.items()
+                          if read.frame is not None and len(read.frame) == read.mark['rows']}
+        else:
+            files = sorted(frames)
+        to_parse = [file_path for file_path in files if frames.get(file_path) is None]
+        handoff_stats = HandoffStats() if PARSE_WORKERS > 1 and to_parse else None
+        parsed = merge_parsed(files, frames, read_source_files(
+            to_parse, PARSE_WORKERS, stats=handoff_stats, column_types=column_types,
+        ))
+
+        # A file that cannot be read leaves the run incomplete (the watcher retries it)
+        parts, file_names, unread = [], [], 0
+        for file_path, df, error in parsed:
             print(f"Processing file: {os.path.basename(file_path)}")
+            if error is not None:
+                unread += 1
+                METRICS.failures['parse'].inc()
+                print(f"  Error reading {file_path}: {error}")
+                continue
+            METRICS.read_source(file_path)
+            METRICS.rows_parsed.inc(len(df))
             try:
-                # Read all columns as object (string) first for BIGNUMERIC safety, 
-                # or rely on pandas default types.
-                # BIGNUMERIC in BQ can handle large decimals. 
-                # We'll stick to default pandas types but convert numeric cols later if needed.
-                df = pd.read_excel(file_path)
-                
                 # Check if empty
                 if df.empty:
                     print(f"  Warning: File is empty, skipping.")
                     continue
                     
-                # Rename columns
-                df = df.rename(columns=column_mapping)
-                
-                # Add SourceFilename
-                df['SourceFilename'] = os.path.basename(file_path)
-                
-                all_dfs.append(df)
+                # Fingerprinted on the schema names (a rename shares the parsed columns)
+                dup_index.add(os.path.basename(file_path),
+                              fingerprint_rows(df.rename(columns=column_mapping), dedup_key_cols))
+                parts.append(df)
+                file_names.append(os.path.basename(file_path))
             except Exception as e:
+                unread += 1
+                METRICS.failures['parse'].inc()
                 print(f"  Error reading {file_path}: {e}")
 
-        if not all_dfs:
+        if handoff_stats is not None:
+            handoff_stats.report()
+        METRICS.seconds['parse'].observe(time.perf_counter() - stage_start)
+        stage, stage_start = 'convert', time.perf_counter()
+
+        if not parts:
             print("No data found to upload.")
-            return
-
-        # Concatenate all
-        final_df = pd.concat(all_dfs, ignore_index=True)
-        print(f"Total rows to process: {len(final_df)}")
-
-        # Add Audit Columns
-        now = datetime.now()
-        final_df['create_date'] = now
-        final_df['modified_date'] = now
-        final_df['create_by'] = 'ETL_Script'
-        final_df['modified_by'] = 'ETL_Script'
-
-        # Ensure schema columns exist
-        schema_cols = [field.name for field in schema]
-        for col in schema_cols:
-            if col not in final_df.columns:
-                print(f"  Warning: Column {col} missing in data, filling with Null")
-                final_df[col] = None
-        
-        final_df = final_df[schema_cols]
+            return not unread
+        print(f"Total rows to process: {sum(len(part) for part in parts)}")
 
-        # Handling Types
-        # TANGGAL: Schema says STRING, file is datetime. Convert to YYYY-MM-DD string.
-        if 'TANGGAL' in final_df.columns and pd.api.types.is_datetime64_any_dtype(final_df['TANGGAL']):
-            final_df['TANGGAL'] = final_df['TANGGAL'].dt.strftime('%Y-%m-%d')
-        
-        # BIGNUMERIC fields: Use decimal.Decimal for precision and Arrow compatibility
-        import decimal
+        # Report duplicates within and across files (e.g. year-end rows re-exported in the next year)
+        dup_index.report()
+        keep = None
+        if DROP_DUPLICATES:
+            keep = dup_index.keep_mask()
+            dropped = int((~keep).sum())
+            if dropped:
+                print(f"Dropped {dropped} duplicate rows, {len(keep) - dropped} rows remain")
+            else:
+                keep = None
+
+        # One pass from the parsed exports to the typed frame in schema order (no concat or
+        # intermediate frames). parts holds the only references to the parsed frames read
+        # here, so each parsed column is released as soon as its output column is built.
+        frames = parsed = df = None
+        final_df = build_detail(parts, file_names, keep=keep, consume=True)
+        del parts
         bignumeric_cols = [f.name for f in schema if f.field_type == 'BIGNUMERIC']
-        for col in bignumeric_cols:
-             final_df[col] = final_df[col].apply(lambda x: decimal.Decimal(str(x)) if pd.notnull(x) and str(x).lower() != 'nan' else None)
+
+        METRICS.seconds['convert'].observe(time.perf_counter() - stage_start)
+        stage, stage_start = 'load', time.perf_counter()
 
         # Upload
-        table_id = f"{client.project}.{DATASET_ID}.{TARGET_TABLE_NAME}"
         print(f"Uploading to {table_id}...")
         
         # We perform a full refresh (WRITE_TRUNCATE) for the "Folder Logic"
         # upserting by checking existing data would be too slow/complex without a dedicated Key.
-        job_config = bigquery.LoadJobConfig(
-            write_disposition="WRITE_TRUNCATE",
-            schema=schema
-        )
-        
-        job = client.load_table_from_dataframe(
-            final_df, table_id, job_config=job_config
-        )
-        job.result()
-        
-        print(f"Success! Loaded {job.output_rows} rows to {table_id}")
+        # Queued as backfill, so interactive report loads go first when both are waiting.
+        checksums = Checksums(final_df, schema) if RECONCILE else None
+        scheduler = get_scheduler()
+        output_rows = scheduler.load(client, table_id, final_df, schema, priority=BACKFILL, write=truncate_table)
+        METRICS.seconds['load'].observe(time.perf_counter() - stage_start)
+        METRICS.rows_loaded.inc(output_rows or 0)
+
+        # Each stage after the load is timed (and blamed for failures) on its own.
+        # The mirror and watermarks follow the table as soon as it has changed, so a
+        # reconciliation failure below cannot leave them describing the old contents.
+        stage = 'mirror'
+        with METRICS.timed('mirror'):
+            mirror_after_load(table_id, final_df, partition_cols=['TAHUN', 'BULAN'])
+        # Watermarks describe this load in tail-only mode; any other full load invalidates them
+        if marks:
+            watermarks.save(marks)
+        else:
+            watermarks.clear()
+        if checksums is not None:
+            stage = 'reconcile'
+            with METRICS.timed('reconcile'):
+                reconcile_load(client, table_id, checksums, schema)
+        print(f"Success! Loaded {output_rows} rows to {table_id}")
+        stage = 'load'
+
+        # Rollups (computed from final_df so BIGNUMERIC sums match the detail exactly),
+        # all queued at once so they load side by side within the scheduler's budgets
+        rollup_sum_cols = ['NEW_', 'RENEWAL'] + bignumeric_cols
+        rollups = build_rollups(final_df, schema, ROLLUP_GROUPING_SETS, rollup_sum_cols)
+        rollup_loads, rollups_failed = {}, 0
+        for rollup_name, (rollup_df, rollup_schema) in rollups.items():
+            rollup_table_id = f"{client.project}.{DATASET_ID}.{rollup_name}"
+            print(f"Uploading rollup ({len(rollup_df)} rows) to {rollup_table_id}...")
+            rollup_loads[rollup_name] = scheduler.submit(
+                client, rollup_table_id, rollup_df, rollup_schema, priority=BACKFILL, write=truncate_table
+            )
+        for rollup_name, future in rollup_loads.items():
+            rollup_df = rollups[rollup_name][0]
+            rollup_table_id = f"{client.project}.{DATASET_ID}.{rollup_name}"
+            try:
+                rollup_rows = future.result()
+                mirror_after_load(rollup_table_id, rollup_df)
+                print(f"  -> Success! Loaded {rollup_rows} rows to {rollup_table_id}")
+            except Exception as e:
+                rollups_failed += 1
+                METRICS.failures['load'].inc()
+                print(f"  -> Failed to upload rollup '{rollup_name}': {e}")
+        return not unread and not rollups_failed
 
     except Exception as e:
+        METRICS.failures[stage].inc()
         print(f"An error occurred: {e}")
+        return False
 
 if __name__ == "__main__":
     upload_prod_hist()
@@ -1,9 +1,22 @@
 import pandas as pd
 from google.cloud import bigquery
-from google.api_core.exceptions import Conflict
 import os
 import re
+import time
 from datetime import datetime
+from bq_client_pool import ensure_dataset, get_client, remember_table
+from column_builder import build_frame
+from datetime_parsing import REPORT_DAYFIRST, parse_datetime_column
+from load_reconciliation import Checksums, reconcile_load
+from load_scheduler import scheduled_load
+from local_mirror import mirror_after_load
+from sla_calendar import WorkingCalendar
+from snapshot_diff import AUDIT_COLUMNS, apply_delta, diff_snapshot, save_snapshot
+from source_readers import declared_column_types, read_report_sheets
+from star_schema import create_wide_view, encode_dimensions, load_dimensions
+from storage_write_sink import storage_write_dataframe
+from table_leases import coalesced_run
+from upload_metrics import ReportMetrics
 
 # Configuration
 # Determine the project root (parent of the 'src' directory where this script lives)
@@ -14,6 +27,29 @@ KEY_FILE = os.path.join(PROJECT_ROOT, 'big-bliss-302909-06cd6e425088.json')
 EXCEL_FILE = os.path.join(PROJECT_ROOT, 'data', 'ReportReas-07202026150133.xlsx')
 DATASET_ID = 'temporary'
 LOCATION = 'asia-southeast2' # Jakarta
+# 'load_job' (load_table_from_dataframe) or 'storage_write' (Storage Write API: rows are committed
+# into a staging table that one copy job swaps in; avoids load-job quotas for frequent small refreshes)
+LOAD_SINK = 'load_job'
+# Rows are matched across exports on this key. With DELTA_LOAD only inserted/updated rows are
+# loaded and deleted keys removed (falls back to a full load when there is no previous snapshot).
+SNAPSHOT_KEY = 'IdLogQuotation'
+DELTA_LOAD = False
+# After each load, compare row count, NULL counts, sums, text lengths, date bounds and a
+# key hash of the frame with one aggregate query over the table (no data is downloaded)
+RECONCILE = True
+# Star schema: load the table with integer keys into shared dimension tables (Dim_User,
+# Dim_Branch, Dim_SOB, Dim_TOC) instead of repeating the text on every row, plus a
+# <table>_Wide view that joins the text back. Column -> dimension:
+STAR_SCHEMA = False
+DIMENSION_COLUMNS = {
+    'Marketing': 'user',
+    'Underwriter': 'user',
+    'Reinsurance': 'user',
+    'LatestPIC': 'user',
+    'Branch': 'branch',
+    'SOB': 'sob',
+    'TOC': 'toc',
+}
 
 # Setup Credentials
 if not os.path.exists(KEY_FILE):
@@ -22,6 +58,8 @@ if not os.path.exists(KEY_FILE):
 
 os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = KEY_FILE
 
+METRICS = ReportMetrics('reas')
+
 def sanitize_table_name(name):
     clean_name = re.sub(r'[^a-zA-Z0-9]', '_', name)
     if not clean_name:
@@ -30,25 +68,49 @@ def sanitize_table_name(name):
         clean_name = '_' + clean_name
     return clean_name
 
-def upload_reas():
+def to_float(series):
+    converted = pd.to_numeric(series, errors='coerce')
+    METRICS.coerced(series.name, series, converted)
+    return converted
+
+def to_text(series):
+    # Special handling for dates that should be strings (ResponseDate)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        series = series.dt.strftime('%Y-%m-%d')
+    # Convert to string, replacing NaN/None with None (which BigQuery handles as NULL)
+    # Note: astype(str) converts None to 'None', which we don't want.
+    return series.apply(lambda x: str(x) if pd.notna(x) else None)
+
+def to_datetime(series):
+    converted = parse_datetime_column(series, dayfirst=REPORT_DAYFIRST)
+    METRICS.coerced(series.name, series, converted)
+    return converted
+
+def converters(schema):
+    # Schema column -> type conversion (create_date/modified_date are set as datetimes)
+    convert = {}
+    for field in schema:
+        if field.field_type == 'FLOAT':
+            convert[field.name] = to_float
+        elif field.field_type == 'STRING':
+            convert[field.name] = to_text
+        elif field.field_type == 'DATETIME' and field.name not in ('create_date', 'modified_date'):
+            convert[field.name] = to_datetime
+    return convert
+
+# One run per table; an overlapping run on the same export waits for and reuses the first
+@coalesced_run(f"{DATASET_ID}.Report_ReAs")
+def upload_reas(excel_file=EXCEL_FILE, sheets=None):
+    # Stage blamed for a failure outside the per-sheet handler (client set-up counts as loading)
+    stage = 'load'
     try:
         print(f"Initializing BigQuery client with key: {KEY_FILE}")
-        client = bigquery.Client()
+        client = get_client()
         
-        # Create Dataset
-        dataset_ref = client.dataset(DATASET_ID)
-        dataset = bigquery.Dataset(dataset_ref)
-        dataset.location = LOCATION
-        
-        try:
-            client.create_dataset(dataset, timeout=30)
-            print(f"Created dataset {client.project}.{DATASET_ID}")
-        except Conflict:
-            print(f"Dataset {client.project}.{DATASET_ID} already exists")
-
-        # Read Excel
-        print(f"Reading Excel file: {EXCEL_FILE}")
-        xls = pd.ExcelFile(EXCEL_FILE)
+        # Create Dataset (skipped if already confirmed by this process)
+        ensure_dataset(client, DATASET_ID, LOCATION)
+
+        calendar = WorkingCalendar()
         
         # Define Schema
         schema = [
@@ -81,6 +143,8 @@ def upload_reas():
             bigquery.SchemaField("SharePercentage", "FLOAT"),
             bigquery.SchemaField("CompletionStatus", "STRING"),
             bigquery.SchemaField("LatestPIC", "STRING"),
+            # Recomputed under our working calendar (see sla_calendar.py)
+            bigquery.SchemaField("ResponseWorkingMinutes", "FLOAT"),
         ]
 
         # Column Mapping
@@ -114,93 +178,111 @@ def upload_reas():
 
         target_sheets = ["Report ReAs"]
         
-        for sheet_name in xls.sheet_names:
+        # Read the export (xlsx, csv, csv.gz or parquet), unless the sheets were already parsed
+        # (e.g. staged by sharded workers). CSV columns are typed from the schema above.
+        if sheets is None:
+            stage = 'parse'
+            print(f"Reading export: {excel_file}")
+            with METRICS.timed('parse'):
+                sheets = read_report_sheets(excel_file, target_sheets, declared_column_types(schema, column_mapping))
+            METRICS.read_source(excel_file)
+
+        # Every target sheet must load for the run to count as done (the watcher retries otherwise)
+        loaded, failed = 0, 0
+        for sheet_name in sheets:
             if sheet_name not in target_sheets:
                 print(f"Skipping sheet: {sheet_name}")
                 continue
                 
             print(f"Processing sheet: {sheet_name}")
+            stage, stage_start = 'convert', time.perf_counter()
             try:
-                df = pd.read_excel(xls, sheet_name=sheet_name)
+                df = sheets[sheet_name]
+                METRICS.rows_parsed.inc(len(df))
                 
                 # Rename columns
                 df = df.rename(columns=column_mapping)
                 
-                 # Add 'DataStatus' if missing
-                if 'DataStatus' not in df.columns:
-                     df['DataStatus'] = None
+                # Working minutes from submission to response, excluding nights, weekends and holidays
+                if 'SubmitDate' in df.columns and 'ResponseDate' in df.columns:
+                    df['ResponseWorkingMinutes'] = calendar.working_minutes(
+                        parse_datetime_column(df['SubmitDate'], dayfirst=REPORT_DAYFIRST),
+                        parse_datetime_column(df['ResponseDate'], dayfirst=REPORT_DAYFIRST),
+                    )
 
-                # Add Audit Columns
+                # Audit columns, schema columns in order (missing ones as NULL) and type
+                # conversions in one pass: each output column is built once, no intermediate frames
                 now = datetime.now()
-                df['create_date'] = now
-                df['modified_date'] = now
-                df['create_by'] = 'ETL_Script'
-                df['modified_by'] = 'ETL_Script'
-
-                # Ensure only columns in schema are kept
-                schema_cols = [field.name for field in schema]
-                
-                # Initialize missing columns with None
-                for col in schema_cols:
-                    if col not in df.columns:
-                        print(f"  Warning: Column {col} missing in source, filling with Null")
-                        df[col] = None 
-                        
-                df = df[schema_cols]
-                
-                # Type Conversions
-                
-                # 1. FLOATs
-                float_cols = [f.name for f in schema if f.field_type == 'FLOAT']
-                for col in float_cols:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-                
-                # 2. STRINGs
-                str_cols = [f.name for f in schema if f.field_type == 'STRING']
-                for col in str_cols:
-                    # Special handling for dates that should be strings (ResponseDate)
-                    if pd.api.types.is_datetime64_any_dtype(df[col]):
-                        df[col] = df[col].dt.strftime('%Y-%m-%d')
-                    
-                    # Convert to string, replacing NaN/None with None (which BigQuery handles as NULL)
-                    # Note: astype(str) converts None to 'None', which we don't want.
-                    # So we apply a lambda or map
-                    df[col] = df[col].apply(lambda x: str(x) if pd.notna(x) else None)
-
-                # 3. DATETIME
-                dt_cols = [f.name for f in schema if f.field_type == 'DATETIME']
-                for col in dt_cols:
-                     if col in ['create_date', 'modified_date']:
-                         continue 
-                     df[col] = pd.to_datetime(df[col], errors='coerce')
+                fill = {'create_date': now, 'modified_date': now, 'create_by': 'ETL_Script', 'modified_by': 'ETL_Script'}
+                # 'DataStatus' is not in the export
+                if 'DataStatus' not in df.columns:
+                    fill['DataStatus'] = None
+                df = build_frame([df], schema, fill=fill, convert=converters(schema))
 
                 table_name = sanitize_table_name(sheet_name)
                 # Force specific table name if needed, or stick to sheet name sanitization
                 # Sheet is 'Report ReAs' -> 'Report_ReAs'
                 table_id = f"{client.project}.{DATASET_ID}.{table_name}"
                 
-                print(f"  -> Uploading to {table_id}...")
+                # Compare with the previous export
+                changes = diff_snapshot(table_name, df, SNAPSHOT_KEY)
+                changes.report()
+
+                # Star schema: text columns become integer keys into the dimension tables
+                # (after the diff, so snapshots compare text and survive a mode switch)
+                load_schema, encoded = schema, {}
+                if STAR_SCHEMA:
+                    df, load_schema, encoded = encode_dimensions(df, schema, DIMENSION_COLUMNS)
                 
-                client.delete_table(table_id, not_found_ok=True)
+                METRICS.seconds['convert'].observe(time.perf_counter() - stage_start)
+                stage, stage_start = 'load', time.perf_counter()
+                print(f"  -> Uploading to {table_id}...")
                 
-                job_config = bigquery.LoadJobConfig(
-                    write_disposition="WRITE_TRUNCATE",
-                    schema=schema
-                )
+                checksums = Checksums(df, load_schema, SNAPSHOT_KEY, skip=AUDIT_COLUMNS) if RECONCILE else None
+                output_rows = None
+                if DELTA_LOAD and changes.has_baseline:
+                    try:
+                        output_rows = apply_delta(client, table_id, df, changes, load_schema)
+                    except Exception as e:
+                        print(f"  -> Delta load failed, falling back to a full load: {e}")
                 
-                job = client.load_table_from_dataframe(
-                    df, table_id, job_config=job_config
-                )
-                job.result() 
+                if output_rows is None and LOAD_SINK == 'storage_write':
+                    output_rows = storage_write_dataframe(client, table_id, df, load_schema, truncate=True)
+                elif output_rows is None:
+                    # Staging-table swap (the table never goes missing), queued by the quota-aware scheduler
+                    output_rows = scheduled_load(client, table_id, df, load_schema)
+                remember_table(table_id)
+                if encoded:
+                    load_dimensions(client, DATASET_ID, encoded)
+                    create_wide_view(client, table_id, schema, encoded)
+                METRICS.seconds['load'].observe(time.perf_counter() - stage_start)
+                METRICS.rows_loaded.inc(output_rows or 0)
                 
-                print(f"  -> Success! Loaded {job.output_rows} rows to {table_id}")
+                # Each stage after the load is timed (and blamed for failures) on its own.
+                # The mirror and snapshot follow the table as soon as it has changed, so a
+                # reconciliation failure below cannot leave them describing the old contents.
+                stage = 'mirror'
+                with METRICS.timed('mirror'):
+                    mirror_after_load(table_id, df, date_column='DateCreated')
+                save_snapshot(changes)
+                if checksums is not None:
+                    stage = 'reconcile'
+                    with METRICS.timed('reconcile'):
+                        reconcile_load(client, table_id, checksums, load_schema)
+                print(f"  -> Success! Loaded {output_rows} rows to {table_id}")
+                loaded += 1
             except Exception as e:
+                failed += 1
+                METRICS.failures[stage].inc()
                 print(f"  -> Failed to upload sheet '{sheet_name}': {e}")
                 if hasattr(e, 'errors'):
                     print(f"     Detailed errors: {e.errors}")
+        return loaded > 0 and not failed
 
     except Exception as e:
+        METRICS.failures[stage].inc()
         print(f"An error occurred: {e}")
+        return False
 
 if __name__ == "__main__":
     upload_reas()
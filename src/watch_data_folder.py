@@ -0,0 +1,231 @@
+import importlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from bq_client_pool import print_metrics
+from source_readers import FORMAT_PREFERENCE, detect_format
+from upload_metrics import start_metrics_server
+
+# Configuration
+# Determine the project root (parent of the 'src' directory where this script lives)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+DATA_DIR = os.path.join(PROJECT_ROOT, 'data')
+PROD_HIST_DIR = os.path.join(DATA_DIR, 'prod_hist')
+STATE_FILE = os.path.join(DATA_DIR, '.watch_state.json')
+
+POLL_SECONDS = 10
+# A file must keep the same size and mtime for this long before it is loaded,
+# so exports that are still being copied/written are not picked up half-way.
+SETTLE_SECONDS = 30
+# At most this many loads run at once; a report is never loaded twice concurrently.
+MAX_WORKERS = 2
+
+
+def export_timestamp(match):
+    # ReportUW-07152026150110.xlsx -> MMDDYYYYHHMMSS
+    return datetime.strptime(match.group(1), '%m%d%Y%H%M%S')
+
+
+def budget_version(match):
+    # budget_2026_v1.xlsx -> (year, version)
+    return (int(match.group(1)), int(match.group(2)))
+
+
+# Report -> where its exports land (xlsx, csv, csv.gz or parquet), how to recognise them, how to order them and which uploader loads them.
+# Uploaders with folder=True reload the whole folder whenever any matching file changes.
+REPORTS = {
+    'uw': {
+        'dir': DATA_DIR,
+        'pattern': re.compile(r'^ReportUW-(\d{14})\.(?:xlsx|csv|csv\.gz|parquet)$'),
+        'order': export_timestamp,
+        'module': 'upload_uw_to_bigquery',
+        'function': 'upload_uw',
+    },
+    'reas': {
+        'dir': DATA_DIR,
+        'pattern': re.compile(r'^ReportReas-(\d{14})\.(?:xlsx|csv|csv\.gz|parquet)$'),
+        'order': export_timestamp,
+        'module': 'upload_reas_to_bigquery',
+        'function': 'upload_reas',
+    },
+    'logbook': {
+        'dir': DATA_DIR,
+        'pattern': re.compile(r'^ReportLogbookAll-(\d{14})\.(?:xlsx|csv|csv\.gz|parquet)$'),
+        'order': export_timestamp,
+        'module': 'upload_logbook_to_bigquery',
+        'function': 'upload_logbook',
+    },
+    'budget': {
+        'dir': DATA_DIR,
+        'pattern': re.compile(r'^budget_(\d{4})_v(\d+)\.xlsx$'),  # several sheets: xlsx only
+        'order': budget_version,
+        'module': 'upload_budget_to_bigquery',
+        'function': 'upload_budget',
+    },
+    'prod_hist': {
+        'dir': PROD_HIST_DIR,
+        'pattern': re.compile(r'^ProduksiJanDes(\d{4})\.(?:xlsx|csv|csv\.gz|parquet)$'),
+        'order': lambda match: int(match.group(1)),
+        'module': 'upload_prod_hist_to_bigquery',
+        'function': 'upload_prod_hist',
+        'folder': True,
+    },
+}
+
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(state):
+    tmp_file = STATE_FILE + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, STATE_FILE)
+
+
+def scan(report):
+    """
+    Return {path: (size, mtime_ns, order_key)} for every export of the report currently on disk.
+    Excel lock files ('~$...') and anything not matching the report pattern are ignored.
+    """
+    found = {}
+    config = REPORTS[report]
+    if not os.path.isdir(config['dir']):
+        return found
+    with os.scandir(config['dir']) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name.startswith('~$'):
+                continue
+            match = config['pattern'].match(entry.name)
+            if not match:
+                continue
+            try:
+                order_key = config['order'](match)
+            except ValueError:
+                print(f"  Warning: Unrecognised timestamp in {entry.name}, ignoring")
+                continue
+            stat = entry.stat()
+            found[entry.path] = (stat.st_size, stat.st_mtime_ns, order_key)
+    return found
+
+
+def run_upload(report, target):
+    config = REPORTS[report]
+    print(f"[watch] Loading {report} from {target}")
+    start = time.perf_counter()
+    module = importlib.import_module(config['module'])
+    loaded = getattr(module, config['function'])(target)
+    print(f"[watch] Finished {report} in {time.perf_counter() - start:.1f}s")
+    print_metrics()
+    # Uploaders report their own failures and return False instead of raising
+    return loaded
+
+
+class FolderWatcher:
+    """
+    Polls the data folders, debounces files that are still being written and
+    hands the newest settled export of each report to a bounded worker pool.
+    """
+
+    def __init__(self, reports=None):
+        self.reports = list(reports or REPORTS)
+        self.state = load_state()
+        self.seen = {}        # report -> {path: (size, mtime_ns, first time this size/mtime was observed)}
+        self.in_flight = {}   # report -> (future, signature)
+        self.executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+    def settled(self, report, now):
+        """
+        Files whose size/mtime has not changed for SETTLE_SECONDS, and whether any other
+        export of the report is still changing. Files no longer on disk are forgotten.
+        """
+        seen = self.seen.get(report, {})
+        current = {}
+        ready = {}
+        settling = False
+        for path, (size, mtime_ns, order_key) in scan(report).items():
+            previous = seen.get(path)
+            if previous is None or previous[:2] != (size, mtime_ns):
+                current[path] = (size, mtime_ns, now)
+                settling = True
+                continue
+            current[path] = previous
+            if now - previous[2] >= SETTLE_SECONDS:
+                ready[path] = (size, mtime_ns, order_key)
+            else:
+                settling = True
+        self.seen[report] = current
+        return ready, settling
+
+    def signature(self, report, ready):
+        if REPORTS[report].get('folder'):
+            # Any added or rewritten file changes the folder signature
+            return [[os.path.basename(path), mtime_ns] for path, (_, mtime_ns, _) in sorted(ready.items())]
+        # The same export in several formats: read the one source_readers prefers
+        newest = max(ready, key=lambda path: (ready[path][2], -FORMAT_PREFERENCE.index(detect_format(path))))
+        return [os.path.basename(newest), ready[newest][1]]
+
+    def collect_finished(self):
+        for report, (future, signature) in list(self.in_flight.items()):
+            if not future.done():
+                continue
+            del self.in_flight[report]
+            error = future.exception()
+            if error is not None:
+                print(f"[watch] Load of {report} failed: {error}")
+                continue
+            if not future.result():
+                # Not recorded, so the same export is loaded again on the next poll
+                print(f"[watch] Load of {report} failed, retrying on the next poll")
+                continue
+            self.state[report] = signature
+            save_state(self.state)
+
+    def poll(self):
+        now = time.monotonic()
+        self.collect_finished()
+        for report in self.reports:
+            ready, settling = self.settled(report, now)
+            if not ready or report in self.in_flight:
+                continue
+            config = REPORTS[report]
+            if config.get('folder') and settling:
+                # The uploader reads every export in the folder: wait until none is still being written
+                continue
+            signature = self.signature(report, ready)
+            if self.state.get(report) == signature:
+                continue
+            if config.get('folder'):
+                target = config['dir']
+            else:
+                target = os.path.join(config['dir'], signature[0])
+            future = self.executor.submit(run_upload, report, target)
+            self.in_flight[report] = (future, signature)
+
+    def run(self):
+        print(f"[watch] Watching {DATA_DIR} and {PROD_HIST_DIR} every {POLL_SECONDS}s")
+        try:
+            while True:
+                self.poll()
+                time.sleep(POLL_SECONDS)
+        except KeyboardInterrupt:
+            print("[watch] Stopping, waiting for running loads to finish...")
+        finally:
+            self.executor.shutdown(wait=True)
+            self.collect_finished()
+
+
+if __name__ == "__main__":
+    # Prometheus endpoint when UPLOAD_METRICS_PORT is set
+    start_metrics_server()
+    FolderWatcher().run()
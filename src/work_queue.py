@@ -0,0 +1,154 @@
+import os
+import socket
+import sqlite3
+import time
+
+# SQLite-backed work queue with leases. Any number of worker processes (on this or
+# other hosts sharing the queue directory) claim tasks; a claimed task is leased for
+# LEASE_SECONDS and goes back to the queue if its worker stops renewing the lease.
+
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job TEXT NOT NULL,
+    report TEXT NOT NULL,
+    source TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending | leased | done | failed
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    staged TEXT,
+    error TEXT,
+    updated_at REAL,
+    UNIQUE (job, report, source)
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    job TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'open',  -- open | committed
+    created_at REAL,
+    committed_at REAL
+);
+"""
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # Autocommit mode; writes that must be atomic use BEGIN IMMEDIATE explicitly
+        return sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+
+    def enqueue(self, job, tasks):
+        """tasks: iterable of (report, source). Already queued tasks are left alone."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT OR IGNORE INTO jobs (job, created_at) VALUES (?, ?)", (job, now))
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (job, report, source, updated_at) VALUES (?, ?, ?, ?)",
+                [(job, report, source, now) for report, source in tasks],
+            )
+            conn.execute("COMMIT")
+
+    def claim(self, owner):
+        """
+        Lease the next pending task (or one whose lease expired).
+        Returns (task_id, job, report, source, attempt) or None when nothing is claimable.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                """
+                SELECT id, job, report, source, attempts FROM tasks
+                WHERE (status = 'pending' OR (status = 'leased' AND lease_expires < ?))
+                  AND attempts < ?
+                ORDER BY id LIMIT 1
+                """,
+                (now, MAX_ATTEMPTS),
+            ).fetchone()
+            if row is None:
+                # Expired leases that used up their attempts are failures
+                conn.execute(
+                    "UPDATE tasks SET status = 'failed', error = COALESCE(error, 'lease expired'), updated_at = ? "
+                    "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (now, now, MAX_ATTEMPTS),
+                )
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE id = ?",
+                (owner, now + LEASE_SECONDS, now, row[0]),
+            )
+            conn.execute("COMMIT")
+        task_id, job, report, source, attempts = row
+        return task_id, job, report, source, attempts + 1
+
+    def renew(self, task_id, owner):
+        # Returns False if the lease was lost (expired and taken by another worker)
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET lease_expires = ?, updated_at = ? WHERE id = ? AND owner = ? AND status = 'leased'",
+                (now + LEASE_SECONDS, now, task_id, owner),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, task_id, owner, staged):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status = 'done', staged = ?, error = NULL, updated_at = ? "
+                "WHERE id = ? AND owner = ? AND status = 'leased'",
+                (staged, time.time(), task_id, owner),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, task_id, owner, error):
+        # Back to pending for a retry, or failed once MAX_ATTEMPTS is used up
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND owner = ? AND status = 'leased'",
+                (MAX_ATTEMPTS, str(error)[:2000], time.time(), task_id, owner),
+            )
+
+    def tasks(self, job):
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT id, report, source, status, attempts, staged, error FROM tasks WHERE job = ? ORDER BY id",
+                (job,),
+            ).fetchall()
+
+    def outstanding(self):
+        # Tasks that some worker may still pick up or is working on
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE status IN ('pending', 'leased')"
+            ).fetchone()[0]
+
+    def job_status(self, job):
+        with self._connect() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE job = ?", (job,)).fetchone()
+            return row[0] if row else None
+
+    def mark_committed(self, job):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'committed', committed_at = ? WHERE job = ?", (time.time(), job))
+
+    def latest_job(self):
+        with self._connect() as conn:
+            row = conn.execute("SELECT job FROM jobs ORDER BY created_at DESC LIMIT 1").fetchone()
+            return row[0] if row else None